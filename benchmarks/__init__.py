@@ -0,0 +1,3 @@
+"""
+Benchmarks of module_renamer on synthetic git repositories, see `python -m benchmarks --help`.
+"""
@@ -0,0 +1,187 @@
+"""
+Run the benchmarks on a synthetic repository and record the results.
+
+    > python -m benchmarks --files=10000 --output=results.json
+    > python -m benchmarks --files=10000 --compare=results.json
+    > python -m benchmarks --files=100000 --stage=analyze.find_moved_imports --trace-memory
+"""
+import json
+import os
+import pickle
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import click
+
+from .stages import STAGE_NAMES, measure_stage
+from .synthetic_repo import RepoSpec, create_synthetic_repo
+
+CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--files', 'number_of_files', type=click.IntRange(min=1), default=1000,
+              help='Number of python modules of the synthetic repository [Default: 1000]')
+@click.option('--imports-per-file', type=click.IntRange(min=1), default=10,
+              help='Number of imports on each module [Default: 10]')
+@click.option('--moved-symbols', type=click.IntRange(min=0), default=50,
+              help='Number of symbols moved on the working branch [Default: 50]')
+@click.option('--divergence', type=float, default=0.1,
+              help='Fraction of the files with unrelated changes [Default: 0.1]')
+@click.option('--lines-per-file', type=click.IntRange(min=0), default=40,
+              help='Number of lines of code on each module [Default: 40]')
+@click.option('--seed', type=int, default=0, help='Seed of the synthetic repository')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=None,
+              help='Number of workers [Default: number of CPUs]')
+@click.option('--executor', type=click.Choice(['process', 'thread', 'serial']),
+              default='process', help='Executor of the rename stage [Default: process]')
+@click.option('--trace-memory', is_flag=True, default=False,
+              help='Also measure the peak of the python allocations of each stage, excluding its '
+                   'setup and workers, which makes the stages slower')
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGE_NAMES),
+              help='Stage to be measured, can be repeated [Default: all]')
+@click.option('--repo-dir', type=click.Path(file_okay=False), default=None,
+              help='Directory of the synthetic repository, reused when it already exists '
+                   '[Default: a temporary directory]')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='JSON file where the results are written')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSON file with previous results to compare with')
+def main(number_of_files, imports_per_file, moved_symbols, divergence, lines_per_file, seed,
+         jobs, executor, trace_memory, stages, repo_dir, output, compare):
+    """
+    Measure the throughput and peak memory of each stage of analyze and rename.
+    """
+    if not 0 <= divergence <= 1:
+        raise click.BadParameter('must be between 0 and 1', param_hint='--divergence')
+    spec = RepoSpec(number_of_files, imports_per_file, moved_symbols, divergence,
+                    lines_per_file, seed)
+    options = {'jobs': jobs, 'executor': executor, 'trace_memory': trace_memory}
+    results = run_benchmarks(spec, stages or STAGE_NAMES, options, repo_dir)
+
+    click.echo(format_results(results, _load_results(compare) if compare else None))
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+def run_benchmarks(spec, stage_names, options, repo_dir=None):
+    """
+    Generate the synthetic repository and measure each one of the given stages.
+
+    :param RepoSpec spec: Shape of the synthetic repository.
+    :param list(str) stage_names: Stages to be measured, see `stages.STAGE_NAMES`.
+    :param dict options: The 'jobs', 'executor' and 'trace_memory' used by the stages.
+    :param str repo_dir: Directory of the repository, a cached repository is reused only when it
+        was generated with the same spec.
+    :return: A dict that can be written as JSON.
+    """
+    temporary_dir = None
+    if repo_dir is None:
+        repo_dir = temporary_dir = tempfile.mkdtemp(prefix='renamer-synthetic-')
+
+    try:
+        synthetic_repo = _load_or_create_repo(repo_dir, spec)
+        return {
+            'commit': _current_commit(),
+            'python': platform.python_version(),
+            'platform': sys.platform,
+            'spec': spec.as_dict(),
+            'options': options,
+            'stages': {
+                stage_name: measure_stage(stage_name, synthetic_repo, options)
+                for stage_name in stage_names
+            },
+        }
+    finally:
+        if temporary_dir is not None:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+
+def format_results(results, previous_results=None):
+    """
+    Format the results as a table, with the ratio to the previous results when given.
+    """
+    header = '{0:<28} {1:>10} {2:>14} {3:>12} {4:>12}'.format(
+        'stage', 'seconds', 'items/s', 'peak MB', 'traced MB')
+    if previous_results is not None:
+        header += '  {0:>8} {1:>8}'.format('time', 'memory')
+    lines = [header]
+
+    for stage_name in STAGE_NAMES:
+        stage = results['stages'].get(stage_name)
+        if stage is None:
+            continue
+        line = '{0:<28} {1:>10.3f} {2:>14} {3:>12} {4:>12}'.format(
+            stage_name, stage['seconds'],
+            '{0:.0f} {1}'.format(stage['items_per_second'] or 0, stage['unit']),
+            _format_megabytes(stage['peak_rss_kb']),
+            _format_megabytes(stage.get('traced_peak_kb')))
+
+        previous_stage = (previous_results or {}).get('stages', {}).get(stage_name)
+        if previous_stage is not None:
+            line += '  {0:>8} {1:>8}'.format(
+                _format_ratio(stage['seconds'], previous_stage['seconds']),
+                _format_ratio(stage['peak_rss_kb'], previous_stage['peak_rss_kb']))
+        lines.append(line)
+
+    if previous_results is not None and previous_results.get('spec') != results['spec']:
+        lines.append('Warning: the previous results were generated with a different spec')
+    return '\n'.join(lines)
+
+
+def _format_megabytes(kilobytes):
+    return '-' if kilobytes is None else '{0:.1f}'.format(kilobytes / 1024.0)
+
+
+def _format_ratio(value, previous_value):
+    if not value or not previous_value:
+        return '-'
+    return '{0:.2f}x'.format(float(value) / previous_value)
+
+
+def _load_results(file_path):
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def _load_or_create_repo(repo_dir, spec):
+    """
+    The synthetic repository is expensive to generate for big specs, so it can be reused between
+    runs through a pickled description stored next to it.
+    """
+    repo_dir = os.path.abspath(repo_dir)
+    description_file = os.path.join(repo_dir, '.git', 'synthetic_repo.pickle')
+    if os.path.isfile(description_file):
+        with open(description_file, 'rb') as file:
+            synthetic_repo = pickle.load(file)
+        if synthetic_repo.spec.as_dict() == spec.as_dict():
+            synthetic_repo.reset()
+            return synthetic_repo
+        raise click.ClickException('The repository on {0} was generated with a different spec'
+                                   .format(repo_dir))
+
+    if os.path.isdir(repo_dir) and os.listdir(repo_dir):
+        raise click.ClickException('The directory {0} is not empty'.format(repo_dir))
+
+    synthetic_repo = create_synthetic_repo(repo_dir, spec)
+    with open(description_file, 'wb') as file:
+        pickle.dump(synthetic_repo, file)
+    return synthetic_repo
+
+
+def _current_commit():
+    """
+    The commit of module_renamer being measured, with a '+' when there are local changes.
+    """
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=source_dir)
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                         cwd=source_dir)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode('ascii').strip() + ('+' if status.strip() else '')
@@ -0,0 +1,227 @@
+"""
+The measured stages of `renamer analyze` and `renamer rename`.
+
+Each stage is created by a factory that receives the synthetic repository and does all the
+setup, returning a function that runs only the measured work and returns the number of items
+it processed. Every stage runs on a fresh process, so the peak memory of one stage doesn't
+leak into the next one.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from git import Repo
+
+from module_renamer.commands.analyze_modifications import (analyze_modifications,
+                                                           generate_list_with_modified_imports,
+                                                           get_imports, imports_of_files,
+                                                           list_py_blobs)
+from module_renamer.commands.import_table import ImportTable
+from module_renamer.commands.move_plan import MovePlan, load_move_plan
+from module_renamer.commands.rename_imports import execute_rename, rename_source
+from module_renamer.commands.utils import decode_source, walk_on_all_py_files
+from .synthetic_repo import ORIGIN_BRANCH, WORKING_BRANCH
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (Windows)
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover (python 2)
+    tracemalloc = None
+
+
+def _list_files(synthetic_repo, options):
+    repo = Repo(synthetic_repo.path)
+
+    def run():
+        return sum(len(list_py_blobs(repo, branch)) for branch in (ORIGIN_BRANCH, WORKING_BRANCH))
+    return run, 'files'
+
+
+def _parse_files(synthetic_repo, options):
+    repo = Repo(synthetic_repo.path)
+    blobs = list_py_blobs(repo, ORIGIN_BRANCH) + list_py_blobs(repo, WORKING_BRANCH)
+
+    def run():
+        return len(get_imports(repo, blobs, ImportTable(), cache=None, jobs=options['jobs']))
+    return run, 'files'
+
+
+def _find_moved_imports(synthetic_repo, options):
+    """
+    The imports of each branch are collected on their sets and compared, with the imports of
+    each file already parsed, so its memory is the one of the import table and sets.
+    """
+    repo = Repo(synthetic_repo.path)
+    origin_blobs = list_py_blobs(repo, ORIGIN_BRANCH)
+    working_blobs = list_py_blobs(repo, WORKING_BRANCH)
+    table = ImportTable()
+    imports_by_blob = get_imports(repo, origin_blobs + working_blobs, table,
+                                  jobs=options['jobs'])
+
+    def run():
+        origin_imports = imports_of_files(origin_blobs, imports_by_blob, table)
+        working_imports = imports_of_files(working_blobs, imports_by_blob, table)
+        generate_list_with_modified_imports(origin_imports, working_imports)
+        return len(origin_imports) + len(working_imports)
+    return run, 'imports'
+
+
+def _analyze(incremental=False, warm_cache=False):
+    def _stage(synthetic_repo, options):
+        output_file = os.path.join(options['work_dir'], 'list_output.py')
+        cache_dir = os.path.join(options['work_dir'], 'cache')
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+
+        def _run_analyze():
+            analyze_modifications(synthetic_repo.path, ORIGIN_BRANCH, WORKING_BRANCH,
+                                  output_file, incremental, use_cache=warm_cache,
+                                  cache_dir=cache_dir, jobs=options['jobs'])
+
+        if warm_cache:
+            _run_analyze()
+
+        def run():
+            _run_analyze()
+            if load_move_plan(output_file).moves != synthetic_repo.moves:
+                raise AssertionError('analyze did not find the moves of the synthetic repo')
+            return synthetic_repo.spec.number_of_files * 2
+        return run, 'files'
+    return _stage
+
+
+def _walk(synthetic_repo, options):
+    def run():
+        return len(list(walk_on_all_py_files([synthetic_repo.path])))
+    return run, 'files'
+
+
+def _rename_sources(synthetic_repo, options):
+    """
+    Only the rename of the files in memory, on a single process and without any I/O.
+    """
+    move_plan = MovePlan(synthetic_repo.moves)
+    sources = []
+    for file_path in walk_on_all_py_files([synthetic_repo.path]):
+        with open(file_path, mode='rb') as file:
+            raw_source = file.read()
+        if move_plan.might_affect(raw_source):
+            sources.append(decode_source(raw_source)[0])
+
+    def run():
+        for source_code in sources:
+            rename_source(source_code, move_plan)
+        return len(sources)
+    return run, 'files'
+
+
+def _rename(synthetic_repo, options):
+    synthetic_repo.reset()
+    move_plan = MovePlan(synthetic_repo.moves)
+
+    def run():
+        try:
+            execute_rename(synthetic_repo.path, move_plan, options['executor'], options['jobs'])
+        finally:
+            synthetic_repo.reset()
+        return synthetic_repo.spec.number_of_files
+    return run, 'files'
+
+
+# Stage name -> factory, in the order they run by default
+STAGES = [
+    ('analyze.list_files', _list_files),
+    ('analyze.parse', _parse_files),
+    ('analyze.find_moved_imports', _find_moved_imports),
+    ('analyze', _analyze()),
+    ('analyze.incremental', _analyze(incremental=True)),
+    ('analyze.warm_cache', _analyze(warm_cache=True)),
+    ('rename.walk', _walk),
+    ('rename.sources', _rename_sources),
+    ('rename', _rename),
+]
+
+STAGE_NAMES = [name for name, _ in STAGES]
+
+
+def measure_stage(stage_name, synthetic_repo, options):
+    """
+    Run a stage on a new process.
+
+    :param str stage_name: One of STAGE_NAMES.
+    :param SyntheticRepo synthetic_repo: The repository used by the stage.
+    :param dict options: The 'jobs' and 'executor' used by the stage, and 'trace_memory' to
+        trace the python allocations of the stage, which makes it slower.
+    :return: The measures of the stage: 'seconds', 'items', 'unit', 'items_per_second',
+        'baseline_rss_kb' (after the setup), 'peak_rss_kb' (including the worker processes)
+        and 'traced_peak_kb' (the peak of the memory allocated by the measured work on the
+        stage process, None unless traced).
+    :rtype: dict
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure_stage_on_process,
+                                      args=(stage_name, synthetic_repo, options, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': 'The process of the stage has crashed'}
+    process.join()
+
+    if 'error' in result:
+        raise RuntimeError('Stage {0} failed: {1}'.format(stage_name, result['error']))
+    return result
+
+
+def _measure_stage_on_process(stage_name, synthetic_repo, options, sender):
+    work_dir = tempfile.mkdtemp(prefix='renamer-benchmark-')
+    try:
+        stage_factory = dict(STAGES)[stage_name]
+        run, unit = stage_factory(synthetic_repo, dict(options, work_dir=work_dir))
+        baseline_rss_kb = _peak_rss_kb()
+
+        trace_memory = options.get('trace_memory') and tracemalloc is not None
+        if trace_memory:
+            tracemalloc.start()
+        start = time.time()
+        number_of_items = run()
+        seconds = time.time() - start
+        traced_peak_kb = None
+        if trace_memory:
+            traced_peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+        sender.send({
+            'seconds': seconds,
+            'items': number_of_items,
+            'unit': unit,
+            'items_per_second': number_of_items / seconds if seconds else None,
+            'baseline_rss_kb': baseline_rss_kb,
+            'peak_rss_kb': _peak_rss_kb(),
+            'traced_peak_kb': traced_peak_kb,
+        })
+    except Exception as exc:
+        sender.send({'error': '{0}: {1}'.format(type(exc).__name__, exc)})
+    finally:
+        sender.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _peak_rss_kb():
+    """
+    Peak resident memory of this process or any of its finished children, None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS reports bytes instead of kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
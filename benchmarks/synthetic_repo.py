@@ -0,0 +1,184 @@
+"""
+Generate reproducible git repositories that look like a big project in the middle of a refactor.
+"""
+import os
+import random
+import subprocess
+
+# The synthetic repositories don't depend on the git configuration of the machine
+_GIT_CONFIG = ['-c', 'user.name=benchmark', '-c', 'user.email=benchmark@example.com',
+               '-c', 'commit.gpgsign=false', '-c', 'core.autocrlf=false']
+
+ORIGIN_BRANCH = 'master'
+WORKING_BRANCH = 'refactor'
+
+
+class RepoSpec(object):
+    """
+    Shape of a synthetic repository, the same spec always generates the same repository.
+
+    :param int number_of_files:
+        Number of python modules of the project.
+    :param int imports_per_file:
+        Number of `from module import Symbol` statements on each module.
+    :param int moved_symbols:
+        Number of symbols moved to another module on the working branch, every file that
+        imports them is updated.
+    :param float divergence:
+        Fraction of the files that also have unrelated changes on the working branch.
+    :param int lines_per_file:
+        Number of lines of code after the imports of each module.
+    :param int seed:
+        Seed of the random generator.
+    """
+
+    def __init__(self, number_of_files=1000, imports_per_file=10, moved_symbols=50,
+                 divergence=0.1, lines_per_file=40, seed=0):
+        self.number_of_files = number_of_files
+        self.imports_per_file = imports_per_file
+        self.moved_symbols = moved_symbols
+        self.divergence = divergence
+        self.lines_per_file = lines_per_file
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class SyntheticRepo(object):
+    """
+    A generated repository, checked out on ORIGIN_BRANCH.
+
+    :ivar str path: Root of the repository.
+    :ivar RepoSpec spec: Spec used to generate it.
+    :ivar list(str) file_paths: Path of each module, relative to the root.
+    :ivar list(tuple(str,str)) moves: The imports moved on WORKING_BRANCH, sorted, which is
+        exactly what `renamer analyze` must find.
+    """
+
+    def __init__(self, path, spec, file_paths, moves):
+        self.path = path
+        self.spec = spec
+        self.file_paths = file_paths
+        self.moves = moves
+
+    def write_moves_file(self, file_path):
+        with open(file_path, 'w') as file:
+            file.write('imports_to_move = {0!r}\n'.format(self.moves))
+
+    def reset(self):
+        """
+        Discard the changes on the working tree, so the same renames can be applied again.
+        """
+        _git(self.path, 'checkout', '-q', '-f', ORIGIN_BRANCH)
+
+
+def create_synthetic_repo(path, spec):
+    """
+    Generate a repository with two branches on the given empty directory.
+
+    Each module imports random symbols from other modules. On the working branch some of these
+    symbols are moved to a different module and all imports of them are updated, while some
+    files get unrelated changes.
+
+    :param str path: Directory where the repository is created.
+    :param RepoSpec spec: Shape of the repository.
+    :rtype: SyntheticRepo
+    """
+    generator = random.Random(spec.seed)
+    modules = _module_names(spec.number_of_files)
+    file_paths = [module.replace('.', '/') + '.py' for module in modules]
+
+    # Every symbol has a unique name, so the only moved imports are the ones generated here
+    number_of_symbols = max(spec.imports_per_file, spec.number_of_files * 2)
+    symbols = ['Symbol{0}'.format(i) for i in range(number_of_symbols)]
+    origin_module_of = {symbol: generator.choice(modules) for symbol in symbols}
+    imports_of_file = [
+        sorted(generator.sample(symbols, min(spec.imports_per_file, len(symbols))))
+        for _ in file_paths
+    ]
+
+    imported_symbols = sorted({symbol for imports in imports_of_file for symbol in imports})
+    moved_symbols = generator.sample(imported_symbols,
+                                     min(spec.moved_symbols, len(imported_symbols)))
+    working_module_of = dict(origin_module_of)
+    for symbol in moved_symbols:
+        working_module_of[symbol] = _choose_new_module(generator, modules,
+                                                       origin_module_of[symbol])
+
+    divergent_files = set(generator.sample(range(len(file_paths)),
+                                           int(len(file_paths) * spec.divergence)))
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    _git(path, 'init', '-q')
+    _git(path, 'symbolic-ref', 'HEAD', 'refs/heads/' + ORIGIN_BRANCH)
+
+    for file_path, imports in zip(file_paths, imports_of_file):
+        _write_module(path, file_path, imports, origin_module_of, spec.lines_per_file)
+    _commit_all(path, 'Synthetic project')
+
+    _git(path, 'checkout', '-q', '-b', WORKING_BRANCH)
+    moved_symbols = set(moved_symbols)
+    for index, (file_path, imports) in enumerate(zip(file_paths, imports_of_file)):
+        extra_lines = 1 if index in divergent_files else 0
+        if extra_lines or moved_symbols.intersection(imports):
+            _write_module(path, file_path, imports, working_module_of, spec.lines_per_file,
+                          extra_lines)
+    _commit_all(path, 'Move symbols')
+    _git(path, 'checkout', '-q', ORIGIN_BRANCH)
+
+    moves = sorted(
+        (origin_module_of[symbol] + '.' + symbol, working_module_of[symbol] + '.' + symbol)
+        for symbol in moved_symbols
+    )
+    return SyntheticRepo(path, spec, file_paths, moves)
+
+
+def _module_names(number_of_files):
+    modules_per_package = 50
+    return [
+        'package_{0}.module_{1}'.format(i // modules_per_package, i % modules_per_package)
+        for i in range(number_of_files)
+    ]
+
+
+def _choose_new_module(generator, modules, old_module):
+    new_module = generator.choice(modules)
+    if new_module == old_module:
+        # Also covers a project with a single module
+        new_module = old_module.replace('.module_', '.moved_module_')
+    return new_module
+
+
+def _write_module(root, file_path, imports, module_of, lines_per_file, extra_lines=0):
+    lines = ['"""Synthetic module."""\n', 'import os\n']
+    lines.extend('from {0} import {1}\n'.format(module_of[symbol], symbol)
+                 for symbol in imports)
+    lines.append('\n\n')
+    for i in range(lines_per_file // 4):
+        symbol = imports[i % len(imports)] if imports else 'object'
+        lines.append('def function_{0}(value):\n'.format(i))
+        lines.append('    """Return a new {0}."""\n'.format(symbol))
+        lines.append('    return {0}(os.path.join(value, "{1}"))\n'.format(symbol, i))
+        lines.append('\n')
+    for i in range(extra_lines):
+        lines.append('EXTRA_{0} = {0}\n'.format(i))
+
+    full_path = os.path.join(root, *file_path.split('/'))
+    directory = os.path.dirname(full_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        with open(os.path.join(directory, '__init__.py'), 'w'):
+            pass
+    with open(full_path, 'w') as file:
+        file.writelines(lines)
+
+
+def _commit_all(path, message):
+    _git(path, 'add', '-A')
+    _git(path, 'commit', '-q', '-m', message)
+
+
+def _git(path, *args):
+    subprocess.check_call(['git'] + _GIT_CONFIG + list(args), cwd=path)
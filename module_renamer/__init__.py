@@ -1,3 +1,19 @@
 # -*- coding: utf-8 -*-
 
 """Top-level package for Module Renamer."""
+import sys
+
+__all__ = ['RenameResult', 'Renamer']
+
+
+# The library API is only imported when used, so the command line doesn't pay for the
+# dependencies of the workers (multiprocessing, concurrent.futures, ...)
+def __getattr__(name):
+    if name in __all__:
+        from module_renamer import renamer
+        return getattr(renamer, name)
+    raise AttributeError("module 'module_renamer' has no attribute '{0}'".format(name))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover (module __getattr__ requires python 3.7)
+    from module_renamer.renamer import RenameResult, Renamer  # noqa: F401
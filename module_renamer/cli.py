@@ -6,8 +6,14 @@ import sys
 
 import click
 
-from module_renamer.commands.rename_imports import rename_modules
-from .commands.analyze_modifications import analyze_modifications
+from module_renamer.commands.constants import EXECUTOR_TYPES, MOVES_FILE_FORMATS
+
+DEFAULT_INDEX_PATH = '.renamer-index.sqlite'
+
+DEFAULT_SERVER_ADDRESS = r'\\.\pipe\renamer' if sys.platform == 'win32' else '.renamer.sock'
+
+# The commands import heavy dependencies (GitPython, pasta, tqdm), so they are only imported
+# when the command runs, keeping `renamer --help` and the hooks that call it fast.
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -28,7 +34,37 @@ def main():
               help='Branch that has the modifications [Default: current active branch]')
 @click.option('--output-file', default='list_output.py',
               help='Change the name of the output file [Default: list_output.py]')
-def analyze(project_path, compare_with, branch, output_file):
+@click.option('--format', 'file_format', type=click.Choice(MOVES_FILE_FORMATS), default=None,
+              help='Format of the output file [Default: from its extension, or python]')
+@click.option('--incremental', is_flag=True, default=False,
+              help='Parse only the files that changed between the branches, '
+                   'producing the same output as the full scan')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Do not use the cache with the imports found on each file')
+@click.option('--cache-dir', type=click.Path(file_okay=False), default=None,
+              help='Directory of the cache of imports [Default: .git/module_renamer]')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=None,
+              help='Number of processes used to parse the files [Default: number of CPUs]')
+@click.option('--include', multiple=True,
+              help='Pattern of the files to be analyzed, can be repeated [Default: *.py]')
+@click.option('--exclude', multiple=True,
+              help='Pattern of files or directories to be skipped, can be repeated')
+@click.option('--stats', 'show_stats', is_flag=True, default=False,
+              help='Show the time spent on each phase, the slowest files and other stats')
+@click.option('--stats-json', type=click.Path(dir_okay=False), default=None,
+              help='File where the stats are written as JSON')
+@click.option('--profile', type=click.Path(dir_okay=False), default=None,
+              help='File where the cProfile stats of the main process are dumped')
+@click.option('--server', default=None,
+              help='Address of a server started by "renamer serve", which finds the imports')
+@click.option('--shard', default=None, metavar='INDEX/COUNT',
+              help='Only process one of COUNT slices of the files, INDEX from 1 to COUNT')
+@click.option('--balance-shards', is_flag=True, default=False,
+              help='Balance the size of the files of each shard, instead of using only the '
+                   'paths of the files')
+def analyze(project_path, compare_with, branch, output_file, file_format, incremental, no_cache,
+            cache_dir, jobs, include, exclude, show_stats, stats_json, profile, server, shard,
+            balance_shards):
     """
     Generate the difference between the imports on two different branches.
 
@@ -50,14 +86,135 @@ def analyze(project_path, compare_with, branch, output_file):
 
     > renamer analyze project_path --branch=my-branch --compare-with=my-other-branch
 
+    Big lists of moves are faster to write and read with --format=jsonl (one JSON array per
+    line) or --format=tsv (one tab separated pair per line). The rename command detects the
+    format of the file and never executes it.
+
+    > renamer analyze project_path --output-file=moves.tsv
+
+    On big projects, use the flag --incremental to parse only the files that are different
+    between the two branches (plus the unchanged files that mention a modified import).
+
+    > renamer analyze project_path --incremental
+
+    The imports found on each file are cached by their content, so files that didn't change
+    since the last run are not parsed again. Use --no-cache to disable it or --cache-dir to
+    choose where the cache is stored.
+
+    Patterns without a '/' match the name of a file or directory, otherwise its path
+    relative to the project. Excluded directories are never traversed.
+
+    > renamer analyze project_path --exclude=vendor --exclude='tests/*.py'
+
+    To find out where the time goes, use --stats to show the time spent on each phase (also
+    written as JSON with --stats-json) and --profile to dump the cProfile stats. Only the main
+    process is profiled, use --jobs=1 to include the parsing of the files.
+
+    > renamer analyze project_path --stats --profile=analyze.prof
+
+    With --server the imports are found by a server started with "renamer serve", which keeps
+    the imports of each file in memory. The include and exclude patterns of the server are
+    used, and only the conflicts are checked by this command.
+
+    Big projects can be analyzed by several machines, each one with a different --shard. Each
+    shard writes the imports found on its slice of the files (on imports_shard_INDEX_of_COUNT
+    .jsonl unless --output-file is given), which are combined by "renamer merge". Every shard
+    must use the same COUNT and options.
+
+    > renamer analyze project_path --shard=1/2
+
+    > renamer analyze project_path --shard=2/2
+
+    > renamer merge imports_shard_1_of_2.jsonl imports_shard_2_of_2.jsonl
+
+    """
+    from module_renamer.commands import stats
+    from module_renamer.commands.analyze_modifications import analyze_modifications
+    from module_renamer.commands.discovery import FileDiscovery
+    from module_renamer.commands.sharding import Shard
+
+    if shard is not None:
+        shard = Shard.parse(shard, balance_shards)
+        if incremental or server is not None:
+            raise click.UsageError('--shard can not be used with --incremental or --server')
+        if output_file == 'list_output.py':
+            output_file = 'imports_shard_{0}_of_{1}.jsonl'.format(shard.index, shard.count)
+
+    discovery = FileDiscovery(include, exclude)
+    with stats.record(show_stats, stats_json, profile):
+        analyze_modifications(project_path, compare_with, branch, output_file, incremental,
+                              use_cache=not no_cache, cache_dir=cache_dir, jobs=jobs,
+                              discovery=discovery, server_address=server,
+                              file_format=file_format, shard=shard)
+
+
+@main.command()
+@click.argument('partial_file', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--output-file', default='list_output.py',
+              help='Change the name of the output file [Default: list_output.py]')
+@click.option('--format', 'file_format', type=click.Choice(MOVES_FILE_FORMATS), default=None,
+              help='Format of the output file [Default: from its extension, or python]')
+def merge(partial_file, output_file, file_format):
+    """
+    Combine the imports found by every shard of "renamer analyze --shard".
+
+    The moved imports are found on the imports of all the shards and checked for conflicts,
+    writing the same file as an analyze without shards.
     """
-    analyze_modifications(project_path, compare_with, branch, output_file)
+    from module_renamer.commands.analyze_modifications import merge_partial_imports
+
+    merge_partial_imports(partial_file, output_file, file_format)
 
 
 @main.command()
 @click.argument('project_path', nargs=-1, type=click.Path(exists=True))
 @click.argument('import-file', type=click.Path(exists=True, resolve_path=True))
-def rename(project_path, import_file):
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=None,
+              help='Number of workers [Default: number of CPUs]')
+@click.option('--executor', type=click.Choice(EXECUTOR_TYPES), default='process',
+              help='How the files are distributed among the workers [Default: process]')
+@click.option('--include', multiple=True,
+              help='Pattern of the files to be renamed, can be repeated [Default: *.py]')
+@click.option('--exclude', multiple=True,
+              help='Pattern of files or directories to be skipped, can be repeated')
+@click.option('--no-gitignore', is_flag=True, default=False,
+              help='Also rename the files ignored by the .gitignore files')
+@click.option('--git-ls-files', is_flag=True, default=False,
+              help='List the files with "git ls-files" instead of walking on the directories')
+@click.option('--error-log', type=click.Path(dir_okay=False), default=None,
+              help='File where the exceptions are written when there are too many to be '
+                   'displayed [Default: a temporary file]')
+@click.option('--stats', 'show_stats', is_flag=True, default=False,
+              help='Show the time spent on each phase, the slowest files and other stats')
+@click.option('--stats-json', type=click.Path(dir_okay=False), default=None,
+              help='File where the stats are written as JSON')
+@click.option('--profile', type=click.Path(dir_okay=False), default=None,
+              help='File where the cProfile stats of the main process are dumped')
+@click.option('--journal', type=click.Path(dir_okay=False), default=None,
+              help='File where the result of each file is recorded, so an interrupted run '
+                   'can be resumed or rolled back')
+@click.option('--resume', is_flag=True, default=False,
+              help='Continue the run recorded on the journal, skipping the files already renamed')
+@click.option('--rollback', is_flag=True, default=False,
+              help='Restore the files modified by the run recorded on the journal')
+@click.option('--dry-run', is_flag=True, default=False,
+              help='Write the diff of the files that would be modified on stdout, without '
+                   'modifying them')
+@click.option('--diff-output', type=click.Path(dir_okay=False), default=None,
+              help='File where the diff is written instead of stdout, implies --dry-run')
+@click.option('--index', type=click.Path(dir_okay=False), default=None,
+              help='Reverse index of the imports of the project, created or updated before the '
+                   'rename and used to only visit the files that reference the moved imports')
+@click.option('--server', default=None,
+              help='Address of a server started by "renamer serve", which renames the files')
+@click.option('--shard', default=None, metavar='INDEX/COUNT',
+              help='Only process one of COUNT slices of the files, INDEX from 1 to COUNT')
+@click.option('--balance-shards', is_flag=True, default=False,
+              help='Balance the size of the files of each shard, instead of using only the '
+                   'paths of the files')
+def rename(project_path, import_file, jobs, executor, include, exclude, no_gitignore,
+           git_ls_files, error_log, show_stats, stats_json, profile, journal, resume, rollback,
+           dry_run, diff_output, index, server, shard, balance_shards):
     """
     Renames the imports statements of a project from a given file with a list of changed imports.
 
@@ -65,7 +222,11 @@ def rename(project_path, import_file):
     This file can be generated by the command analyze, or created manually.
 
     This file must have a list named 'imports_to_move' and each item of this list must be a tuple
-    where the first element is the old path and the second element is the new path.
+    where the first element is the old path and the second element is the new path. The list
+    must be a literal, since the file is not executed.
+
+    The file can also have one move per line, either as a JSON array or as the two paths
+    separated by a tab, detected by the extension (.jsonl or .tsv) or by the content.
 
     Example.: The class Door was located at home.room and now is located on home.basic_material
 
@@ -77,9 +238,194 @@ def rename(project_path, import_file):
         A Path (or Paths) of the project that is going to be processed by the script.
     :param str import_file:
         Path of the file with the list of changed imports.
+    :param int jobs:
+        Number of workers used to rename the files.
+    :param str executor:
+        Either 'process', 'thread' or 'serial'.
+    :param tuple(str) include:
+        Patterns of the files to be renamed.
+    :param tuple(str) exclude:
+        Patterns of the files and directories to be skipped. Version control directories and
+        virtualenvs are always skipped, as well as the files ignored by .gitignore unless
+        --no-gitignore is given.
+    :param str error_log:
+        File with all the exceptions, only written when there are too many to be displayed.
+    :param bool show_stats:
+        Show the time and number of calls of each phase, the slowest files, the bytes read and
+        written and the utilization of the workers.
+    :param str stats_json:
+        File where the same stats are written as JSON.
+    :param str profile:
+        File where the cProfile stats of the main process are dumped, use --executor=serial to
+        include the work done on each file.
+    :param str journal:
+        File where the status and hash of each file are recorded (an SQLite database), with the
+        original content of the modified files saved on a directory next to it.
+    :param bool resume:
+        Continue the run recorded on the journal, the files already renamed are skipped and the
+        ones that failed are renamed again. The list of imports must be the same.
+    :param bool rollback:
+        Restore the original content of the files modified by the run recorded on the journal,
+        then remove the journal. Files changed after the run are not restored.
+    :param bool dry_run:
+        Don't modify any file, write the unified diff of each file that would be modified on
+        stdout instead, in the order the files are found. The paths on the diff are relative to
+        the current directory, so it can be applied later with `git apply` from there.
+    :param str diff_output:
+        File where the diff is written instead of stdout, implies --dry-run.
+    :param str index:
+        Path of the reverse index of the imports of the project (see `renamer index`). Only the
+        files that changed since the last run are parsed to update it, then only the files
+        that import one of the moved paths (or a parent or child of them) are renamed.
+    :param str server:
+        Address of a server started by `renamer serve` for the project, which renames the files
+        inside the given paths using the files and imports it keeps in memory. The discovery
+        options of the server are used.
+    :param str shard:
+        'INDEX/COUNT' to only rename one of COUNT slices of the files, so several machines can
+        rename a project together. The slice of each file depends on its path relative to the
+        project path, or on the size of the files with --balance-shards.
+    :param bool balance_shards:
+        Balance the total size of the files of each shard.
 
     """
-    rename_modules(project_path, import_file)
+    from module_renamer.commands import stats
+    from module_renamer.commands.discovery import FileDiscovery
+    from module_renamer.commands.rename_imports import rename_modules, rollback_rename
+    from module_renamer.commands.sharding import Shard
+
+    if (resume or rollback) and journal is None:
+        raise click.UsageError('--resume and --rollback require --journal')
+    if resume and rollback:
+        raise click.UsageError('--resume and --rollback can not be used together')
+    if (dry_run or diff_output is not None) and journal is not None:
+        raise click.UsageError('--dry-run and --diff-output can not be used with --journal')
+    if server is not None and (journal is not None or index is not None):
+        raise click.UsageError('--server can not be used with --journal or --index')
+    if shard is not None:
+        shard = Shard.parse(shard, balance_shards)
+        if server is not None:
+            raise click.UsageError('--shard can not be used with --server')
+
+    if rollback:
+        rollback_rename(import_file, journal)
+        return
+
+    discovery = FileDiscovery(include, exclude, use_gitignore=not no_gitignore,
+                              use_git=git_ls_files)
+    with stats.record(show_stats, stats_json, profile):
+        rename_modules(project_path, import_file, executor, jobs, discovery, error_log,
+                       journal_path=journal, resume=resume, dry_run=dry_run,
+                       diff_output=diff_output, index_path=index, server_address=server,
+                       shard=shard)
+
+
+@main.command()
+@click.argument('project_path', nargs=-1, type=click.Path(exists=True))
+@click.option('--index', type=click.Path(dir_okay=False), default=DEFAULT_INDEX_PATH,
+              help='Path of the index [Default: {0}]'.format(DEFAULT_INDEX_PATH))
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=None,
+              help='Number of workers [Default: number of CPUs]')
+@click.option('--executor', type=click.Choice(EXECUTOR_TYPES), default='process',
+              help='How the files are distributed among the workers [Default: process]')
+@click.option('--include', multiple=True,
+              help='Pattern of the files to be indexed, can be repeated [Default: *.py]')
+@click.option('--exclude', multiple=True,
+              help='Pattern of files or directories to be skipped, can be repeated')
+@click.option('--no-gitignore', is_flag=True, default=False,
+              help='Also index the files ignored by the .gitignore files')
+@click.option('--git-ls-files', is_flag=True, default=False,
+              help='List the files with "git ls-files" instead of walking on the directories')
+def index(project_path, index, jobs, executor, include, exclude, no_gitignore, git_ls_files):
+    """
+    Create or update the reverse index of the imports of a project.
+
+    The index maps each imported name to the files that import it, anywhere on the file. It is
+    updated incrementally, only the files whose content changed since the last update are
+    parsed again.
+
+    > renamer index project_path
+
+    > renamer who-imports home.room.door
+
+    > renamer rename project_path list_output.py --index=.renamer-index.sqlite
+
+    """
+    from module_renamer.commands.discovery import FileDiscovery
+    from module_renamer.commands.import_index import index_project
+
+    discovery = FileDiscovery(include, exclude, use_gitignore=not no_gitignore,
+                              use_git=git_ls_files)
+    index_project(project_path, index, executor, jobs, discovery)
+
+
+@main.command()
+@click.argument('project_path', nargs=-1, type=click.Path(exists=True))
+@click.option('--address', default=DEFAULT_SERVER_ADDRESS,
+              help='Path of the socket, or name of the pipe on Windows '
+                   '[Default: {0}]'.format(DEFAULT_SERVER_ADDRESS))
+@click.option('--poll-interval', type=float, default=1.0,
+              help='Seconds between each check for changed files [Default: 1]')
+@click.option('--max-cache-mb', type=click.IntRange(min=0), default=256,
+              help='Maximum size of the file contents kept in memory [Default: 256]')
+@click.option('--include', multiple=True,
+              help='Pattern of the files to be renamed, can be repeated [Default: *.py]')
+@click.option('--exclude', multiple=True,
+              help='Pattern of files or directories to be skipped, can be repeated')
+@click.option('--no-gitignore', is_flag=True, default=False,
+              help='Also rename the files ignored by the .gitignore files')
+@click.option('--git-ls-files', is_flag=True, default=False,
+              help='List the files with "git ls-files" instead of walking on the directories')
+@click.option('--stop', is_flag=True, default=False,
+              help='Stop the server listening on the address')
+def serve(project_path, address, poll_interval, max_cache_mb, include, exclude, no_gitignore,
+          git_ls_files, stop):
+    """
+    Keep a project in memory to answer rename and analyze requests quickly.
+
+    The server keeps the list of python files of the project, the names imported by each one
+    and the most recently used file contents, checking the file system for changes every
+    --poll-interval seconds. The commands rename and analyze send their requests to it with
+    --server.
+
+    > renamer serve project_path --address=/tmp/renamer.sock &
+
+    > renamer rename project_path list_output.py --server=/tmp/renamer.sock
+
+    > renamer serve --stop --address=/tmp/renamer.sock
+
+    """
+    from module_renamer.commands.discovery import FileDiscovery
+    from module_renamer.commands.serve import run_server, send_request
+
+    if stop:
+        send_request(address, {'command': 'stop'})
+        return
+    if poll_interval <= 0:
+        raise click.BadParameter('must be positive', param_hint='--poll-interval')
+    if not project_path:
+        raise click.UsageError('Missing the project path')
+
+    discovery = FileDiscovery(include, exclude, use_gitignore=not no_gitignore,
+                              use_git=git_ls_files)
+    run_server(project_path, address, discovery, poll_interval, max_cache_mb * 1024 * 1024)
+
+
+@main.command('who-imports')
+@click.argument('dotted_path', nargs=-1, required=True)
+@click.option('--index', type=click.Path(dir_okay=False), default=DEFAULT_INDEX_PATH,
+              help='Path of the index [Default: {0}]'.format(DEFAULT_INDEX_PATH))
+def who_imports(dotted_path, index):
+    """
+    List the files that would be visited by a rename of the given dotted paths.
+
+    These are the files that import the path itself, one of its parents or one of its
+    children, plus the files that could not be parsed, according to the index created by
+    `renamer index`.
+    """
+    from module_renamer.commands.import_index import who_imports
+
+    who_imports(dotted_path, index)
 
 
 if __name__ == "__main__":
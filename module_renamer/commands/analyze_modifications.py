@@ -1,13 +1,29 @@
 import ast
+import io
+import json
+import multiprocessing
 import os
-from collections import Counter, namedtuple
+import pprint
+import re
+import time
+from array import array
+from collections import defaultdict
 from contextlib import contextmanager
 
+import six
 from click import ClickException, confirm, echo
 from git import Repo
+from gitdb.exc import BadName
+from gitdb.util import hex_to_bin
 from tqdm import tqdm
 
-from module_renamer.commands.utils import walk_on_py_files
+from module_renamer.commands import stats
+from module_renamer.commands.discovery import FileDiscovery
+from module_renamer.commands.import_cache import ImportCache
+from module_renamer.commands.import_table import ID_TYPECODE, Import, ImportTable
+from module_renamer.commands.utils import (WORD_END, WORD_START, chunk_size_for, create_executor,
+                                           iter_completed, max_in_flight_for,
+                                           moves_file_format_for, split_in_chunks)
 
 CONFLICT_MSG = (
     "\n"
@@ -22,44 +38,107 @@ INFORMATIVE_CONFLICT_MSG = (
     "Otherwise this script will be aborted."
 )
 
-Import = namedtuple("Import", ["module", "name"])
 
-
-@contextmanager
-def checkout_branch(repo, branch_name):
+def analyze_modifications(project_path, compare_with, branch, output_file, incremental=False,
+                          use_cache=True, cache_dir=None, jobs=None, discovery=None,
+                          server_address=None, file_format=None, shard=None):
     """
-    Change the current git branch for the branch informed on branch_name
+    Track modifications between two different branches.
+    The output will be a list written directly to a file.
 
-    :param git.Repo repo: The git repository of the project.
+    The python files of each branch are read directly from the git object database, so the
+    working tree is never touched and may have uncommitted changes.
 
-    :param str branch_name: Name of the branch that Git should move into
-    """
+    When incremental is True only the files that differ between the branches are parsed,
+    see `get_imports_from_changed_files`.
 
-    if (repo.is_dirty() or len(repo.untracked_files)) != 0:
-        raise ClickException("The repository is dirty, please clean it first ")
+    The imports found on each file are cached by blob id on cache_dir, which defaults to a
+    directory inside the .git folder of the project.
 
-    current_branch = repo.active_branch.name
-    repo.branches[branch_name].checkout()
+    The files are parsed by `jobs` worker processes, defaulting to the number of CPUs.
 
-    try:
-        yield
-    finally:
-        getattr(repo.heads, current_branch).checkout()
+    Only the files accepted by the include and exclude patterns of discovery are analyzed.
+
+    When server_address is given the imports are found by the server started with
+    `renamer serve`, which keeps them in memory between runs, and only the conflicts are
+    checked here.
 
+    The output file is written on file_format, one of `constants.MOVES_FILE_FORMATS`, which
+    defaults to the format of its extension.
 
-def analyze_modifications(project_path, compare_with, branch, output_file):
+    When a shard is given only its slice of the files is analyzed, and the imports found are
+    written on the output file instead, to be combined with the ones of the other shards by
+    `merge_partial_imports`.
     """
-    Track modifications between two different branches.
-    The output will be a list written directly to a file.
+    if shard is not None:
+        repo = Repo(project_path)
+        with open_import_cache(repo, use_cache, cache_dir) as cache:
+            import_list_from_origin, import_list_from_working = find_imports_of_branches(
+                repo, compare_with, branch, False, cache, jobs, discovery, shard)
+        with stats.phase('write'):
+            write_partial_imports(import_list_from_origin, import_list_from_working, shard,
+                                  output_file)
+        stats.count('bytes_written', os.path.getsize(output_file))
+        return
+
+    if server_address is not None:
+        from module_renamer.commands.serve import send_request
+        moved_imports = send_request(server_address, {
+            'command': 'analyze',
+            'project_path': os.path.abspath(project_path),
+            'compare_with': compare_with,
+            'branch': branch,
+            'incremental': incremental,
+            'jobs': jobs,
+        })['moved_imports']
+    else:
+        repo = Repo(project_path)
+        with open_import_cache(repo, use_cache, cache_dir) as cache:
+            moved_imports = find_moved_imports(repo, compare_with, branch, incremental, cache,
+                                               jobs, discovery)
+
+    list_with_modified_imports = _check_for_conflicts(moved_imports)
+    with stats.phase('write'):
+        write_list_to_file(list_with_modified_imports, output_file, file_format)
+    stats.count('bytes_written', os.path.getsize(output_file))
+
+
+def find_moved_imports(repo, compare_with, branch, incremental=False, cache=None, jobs=None,
+                       discovery=None):
     """
+    Find the imports moved between two branches, see `analyze_modifications`.
+
+    :type repo: git.Repo
+    :param ImportCache cache: Cache of the imports found on each blob.
+    :return: As returned by `_find_moved_imports`, the conflicts are not checked.
+    :rtype: dict(str,list(str))
+    """
+    import_list_from_origin, import_list_from_working = find_imports_of_branches(
+        repo, compare_with, branch, incremental, cache, jobs, discovery)
+
+    with stats.phase('find moved imports'):
+        origin_filtered, working_filtered = _filter_import(import_list_from_origin,
+                                                           import_list_from_working)
+        return _find_moved_imports(origin_filtered, working_filtered)
 
-    full_project_path = os.path.join(project_path)
-    repo = Repo(project_path)
 
+def find_imports_of_branches(repo, compare_with, branch, incremental=False, cache=None,
+                             jobs=None, discovery=None, shard=None):
+    """
+    Find the imports of the python files of each branch, see `analyze_modifications`.
+
+    :param Shard shard: Only find the imports of the files of this shard, which can't be
+        used with incremental since the changed files are compared with all the others.
+    :return: The imports of the origin branch and the imports of the working branch, on the
+        same table.
+    :rtype: tuple(ImportSet,ImportSet)
+    """
     origin_branch = compare_with
 
     if branch:
         work_branch = branch
+    elif repo.head.is_detached:
+        work_branch = 'HEAD'
     else:
         work_branch = repo.active_branch.name
 
@@ -70,34 +149,255 @@ def analyze_modifications(project_path, compare_with, branch, output_file):
             "or use the option --branch and --compare-with ."
         )
 
-    list_of_py_files = [i for i in walk_on_py_files(full_project_path)]
-    with checkout_branch(repo, origin_branch):
-        import_list_from_origin = {imp for imp in get_imports(full_project_path, list_of_py_files)}
+    with stats.phase('list files'):
+        origin_py_files = list_py_blobs(repo, origin_branch, discovery)
+        working_py_files = list_py_blobs(repo, work_branch, discovery)
+        if shard is not None:
+            origin_py_files = list(shard.select(origin_py_files, _blob_path, _blob_size))
+            working_py_files = list(shard.select(working_py_files, _blob_path, _blob_size))
+
+    table = ImportTable()
+    if incremental:
+        return get_imports_from_changed_files(repo, origin_py_files, working_py_files, table,
+                                              cache, jobs)
+
+    # Both branches are scheduled together, so blobs present on both are parsed once
+    imports_by_blob = get_imports(repo, origin_py_files + working_py_files, table, cache, jobs)
+    return (imports_of_files(origin_py_files, imports_by_blob, table),
+            imports_of_files(working_py_files, imports_by_blob, table))
+
+
+def _blob_path(blob):
+    return blob.path
+
+
+def _blob_size(blob):
+    return blob.size
+
+
+def write_partial_imports(import_list_from_origin, import_list_from_working, shard, file_name):
+    """
+    Write the imports found by a shard, one JSON array per line after a header with the shard.
+
+    :type import_list_from_origin: ImportSet
+    :type import_list_from_working: ImportSet
+    :type shard: Shard
+    """
+    echo('Generating the file {0} with the imports of the shard {1}'.format(file_name, shard))
+    with io.open(file_name, mode='w', encoding='utf-8', newline='\n') as file:
+        file.write(u'{0}\n'.format(json.dumps({'shard': [shard.index, shard.count]})))
+        for branch, imports in (('origin', import_list_from_origin),
+                                ('working', import_list_from_working)):
+            for module, name in sorted(imports):
+                file.write(u'{0}\n'.format(json.dumps([branch, module, name])))
+
+
+def merge_partial_imports(partial_files, output_file, file_format=None):
+    """
+    Combine the imports written by every shard of an analyze, then write the list of moved
+    imports like `analyze_modifications`.
+
+    :param list(str) partial_files: The files written by each shard, in any order.
+    """
+    table = ImportTable()
+    import_ids = {'origin': array(ID_TYPECODE), 'working': array(ID_TYPECODE)}
+    shards = {}
+    for partial_file in partial_files:
+        with io.open(partial_file, mode='r', encoding='utf-8') as file:
+            try:
+                shard_index, shard_count = json.loads(next(file))['shard']
+                for line in file:
+                    branch, module, name = json.loads(line)
+                    import_ids[branch].append(table.import_id(module, name))
+            except (StopIteration, ValueError, KeyError, TypeError):
+                raise ClickException('The file {0} was not written by "renamer analyze '
+                                     '--shard"'.format(partial_file))
+        if shard_index in shards:
+            raise ClickException('The files {0} and {1} are from the same shard'
+                                 .format(shards[shard_index][0], partial_file))
+        shards[shard_index] = (partial_file, shard_count)
+
+    shard_counts = {shard_count for _, shard_count in shards.values()}
+    if len(shard_counts) > 1:
+        raise ClickException('The files are from analyzes with different numbers of shards')
+    shard_count = shard_counts.pop()
+    missing_shards = set(range(1, shard_count + 1)) - set(shards)
+    if missing_shards:
+        raise ClickException('The imports of the shard(s) {0} of {1} are missing'
+                             .format(', '.join(str(index) for index in sorted(missing_shards)),
+                                     shard_count))
+
+    with stats.phase('find moved imports'):
+        list_with_modified_imports = generate_list_with_modified_imports(
+            table.import_set([import_ids['origin']]), table.import_set([import_ids['working']]))
+    with stats.phase('write'):
+        write_list_to_file(list_with_modified_imports, output_file, file_format)
+
+
+@contextmanager
+def open_import_cache(repo, use_cache, cache_dir):
+    """
+    Open the cache of imports of the project, yielding None when the cache is disabled.
+
+    :param git.Repo repo: The git repository of the project.
+
+    :param bool use_cache: False to disable the cache.
+
+    :param str cache_dir: Directory of the cache, defaults to .git/module_renamer .
+    """
+    if not use_cache:
+        yield None
+        return
+
+    if cache_dir is None:
+        cache_dir = os.path.join(repo.git_dir, 'module_renamer')
+    with ImportCache(cache_dir) as cache:
+        yield cache
 
-    with checkout_branch(repo, work_branch):
-        import_list_from_working = {imp for imp in
-                                    get_imports(full_project_path, list_of_py_files)}
 
-    list_with_modified_imports = generate_list_with_modified_imports(import_list_from_origin,
-                                                                     import_list_from_working)
-    write_list_to_file(list_with_modified_imports, output_file)
+def list_py_blobs(repo, branch_name, discovery=None):
+    """
+    Return the python files of a branch as git blobs, without checking it out.
+
+    :param git.Repo repo: The git repository of the project.
+
+    :param str branch_name: Name of the branch (or any other git reference) to be read.
+
+    :param FileDiscovery discovery: Include and exclude patterns, the excluded trees are pruned.
+
+    :rtype: list(git.Blob)
+    """
+    if discovery is None:
+        discovery = FileDiscovery()
+
+    try:
+        tree = repo.commit(branch_name).tree
+    except (BadName, ValueError):
+        raise ClickException("Could not find the branch {0} .".format(branch_name))
+
+    return list(tree.traverse(
+        predicate=lambda item, _: item.type == 'blob' and discovery.accepts_file(item.path),
+        prune=lambda item, _: item.type == 'tree' and not discovery.accepts_dir(item.path),
+    ))
+
+
+def get_imports_from_changed_files(repo, origin_py_files, working_py_files, table, cache=None,
+                                   jobs=None):
+    """
+    Return the imports of both branches parsing only the files that changed between them.
+
+    Files are compared by their blob id, so added, deleted and renamed files are all considered
+    changed. The imports of a file that is identical on both branches would be on both sets
+    and discarded by `_filter_import`, so they are skipped, with one exception: an import
+    added or removed on a changed file may still be present on an unchanged file. To cover
+    that, the unchanged files that mention the name of any of these imports are parsed too.
+
+    The returned sets are not the complete sets of imports of each branch, but they are
+    guaranteed to produce the same result on `generate_list_with_modified_imports`.
+
+    :param ImportTable table: Where the imports found are added.
+    :rtype: tuple(ImportSet,ImportSet)
+    """
+    origin_ids = {blob.path: blob.binsha for blob in origin_py_files}
+    working_ids = {blob.path: blob.binsha for blob in working_py_files}
+
+    origin_changed = [blob for blob in origin_py_files
+                      if working_ids.get(blob.path) != blob.binsha]
+    working_changed = [blob for blob in working_py_files
+                       if origin_ids.get(blob.path) != blob.binsha]
+    unchanged = [blob for blob in origin_py_files if working_ids.get(blob.path) == blob.binsha]
+
+    imports_by_blob = get_imports(repo, origin_changed + working_changed, table, cache, jobs)
+    import_list_from_origin = imports_of_files(origin_changed, imports_by_blob, table)
+    import_list_from_working = imports_of_files(working_changed, imports_by_blob, table)
+
+    difference = import_list_from_origin.symmetric_difference(import_list_from_working)
+    if difference:
+        names_pattern = _compile_names_pattern(imp.name for imp in difference)
+        with stats.phase('filter unchanged files'):
+            mentioning_files = [blob for blob in unchanged
+                                if names_pattern.search(blob.data_stream.read())]
+        imports_by_blob = get_imports(repo, mentioning_files, table, cache, jobs)
+        imports_on_both = difference.intersection(imports_of_files(mentioning_files,
+                                                                   imports_by_blob, table))
+        import_list_from_origin.update(imports_on_both)
+        import_list_from_working.update(imports_on_both)
+
+    return import_list_from_origin, import_list_from_working
+
+
+def _compile_names_pattern(names):
+    """
+    Bytes pattern that matches any of the given imported names, for `import a.b` only the last
+    part of the name is used since there may be spaces around the dots.
+    """
+    names = set(names)
+    alternatives = sorted({re.escape(name.rsplit('.', 1)[-1]) for name in names if name != '*'})
+    pattern = (WORD_START + '(?:{0})'.format('|'.join(alternatives)) + WORD_END
+               if alternatives else r'(?!)')
+    if '*' in names:
+        pattern += r'|\*'
+    return re.compile(pattern.encode('utf-8'))
 
 
-def write_list_to_file(list_with_modified_imports, file_name):
+def write_list_to_file(list_with_modified_imports, file_name, file_format=None):
     """
-    Write the list of modified imports on a python file, the python file per default will be named
+    Write the list of modified imports on a file, the file per default will be named
     "list_output.py" but can be changed by passing the argument --output_file
 
-    The name of the list (inside the file) cannot be changed since it will be used later on the
-    script for renaming the project.
+    The name of the list (inside the python file) cannot be changed since it will be used later
+    on the script for renaming the project.
+
+    The list is sorted, so the same modifications always generate the same file.
+
+    :param str file_format: One of `constants.MOVES_FILE_FORMATS`, defaults to the format of the
+        extension of the file, or 'python'.
     """
     echo('Generating the file {0}'.format(file_name))
+    if file_format is None:
+        file_format = moves_file_format_for(file_name) or 'python'
 
-    with open(file_name, 'w') as file:
-        file.write("imports_to_move = ")
+    moves = sorted(list_with_modified_imports)
+    with io.open(file_name, mode='w', encoding='utf-8', newline='\n') as file:
+        if file_format == 'jsonl':
+            for old_path, new_path in moves:
+                file.write(u'{0}\n'.format(json.dumps([old_path, new_path])))
+        elif file_format == 'tsv':
+            for old_path, new_path in moves:
+                file.write(u'{0}\t{1}\n'.format(old_path, new_path))
+        else:
+            file.write(u'imports_to_move = ')
+            _write_moves_like_pprint(moves, file)
+            file.write(u'\n')
 
-        from pprint import pprint
-        pprint(list(list_with_modified_imports), stream=file, indent=4, width=120)
+
+# The layout of the python files, which used to be written by pprint
+PPRINT_INDENT = 4
+PPRINT_WIDTH = 120
+
+
+def _write_moves_like_pprint(moves, file):
+    """
+    Write the list of moves exactly like `pprint` would, one move at a time.
+
+    pprint checks each item for recursion and formats it again on each level, which is too slow
+    for lists with tens of thousands of moves. pprint is only used for the lists it would
+    split inside a move.
+    """
+    reprs = [repr(tuple(move)) for move in moves]
+    one_line_width = sum(len(move_repr) for move_repr in reprs) + 2 * len(reprs)
+    if one_line_width <= PPRINT_WIDTH:
+        file.write(u'[{0}]'.format(u', '.join(reprs)))
+    elif any(len(move_repr) > PPRINT_WIDTH - PPRINT_INDENT - 1 for move_repr in reprs):
+        file.write(six.text_type(pprint.pformat(moves, indent=PPRINT_INDENT, width=PPRINT_WIDTH)))
+    else:
+        separator = u',\n' + u' ' * PPRINT_INDENT
+        file.write(u'[' + u' ' * (PPRINT_INDENT - 1))
+        for i, move_repr in enumerate(reprs):
+            if i:
+                file.write(separator)
+            file.write(six.text_type(move_repr))
+        file.write(u']')
 
 
 def generate_list_with_modified_imports(import_list_from_origin, import_list_from_working):
@@ -105,7 +405,7 @@ def generate_list_with_modified_imports(import_list_from_origin, import_list_fro
     This methods looks for imports that keep the same name but has has different modules path
 
     :return: A list with unique elements that has the same name but different modules path
-    :rtype: set
+    :rtype: list(tuple(str,str))
     """
 
     origin_filtered, working_filtered = _filter_import(import_list_from_origin,
@@ -120,84 +420,200 @@ def generate_list_with_modified_imports(import_list_from_origin, import_list_fro
 
 def _filter_import(origin_import_list, working_import_list):
     """
-    Create a new set with elements present origin_list or working_list but not on both,
+    Keep only the imports present on origin_list or working_list but not on both,
     this helps to filter classes that could have same name but different modules.
+
+    :type origin_import_list: ImportSet
+    :type working_import_list: ImportSet
+    :rtype: tuple(ImportSet,ImportSet)
     """
-    difference = origin_import_list.symmetric_difference(working_import_list)
-    origin_filtered = origin_import_list.intersection(difference)
-    working_filtered = working_import_list.intersection(difference)
+    origin_filtered = origin_import_list.difference(working_import_list)
+    working_filtered = working_import_list.difference(origin_import_list)
     return origin_filtered, working_filtered
 
 
 def _find_moved_imports(list_with_import_from_origin_branch, list_with_import_from_working_branch):
     """
-    Return a list with tuples where the first element is the origin and the second element is
-    the branch with the modifications
-    """
-    list_with_modified_imports = {
-        (origin.module + "." + origin.name, working.module + "." + working.name)
-        for origin in list_with_import_from_origin_branch
-        for working in list_with_import_from_working_branch
-        if working.name is not '*'
-        if origin.name == working.name
-        if origin.module != working.module
-    }
-    return list_with_modified_imports
+    Return a dict mapping the path of each import from the origin branch to the list of paths
+    with the same name on the branch with the modifications
 
+    The imports from the working branch are grouped by name, so each import from the origin
+    is only compared with the imports that have the same name. The imports are compared by
+    the ids of their modules and names, the paths are only built for the moved imports.
 
-def _check_for_conflicts(list_with_modified_imports):
+    :type list_with_import_from_origin_branch: ImportSet
+    :type list_with_import_from_working_branch: ImportSet
+    :rtype: dict(str,list(str))
+    """
+    table = list_with_import_from_origin_branch.table
+    strings, modules, names = table.strings, table.modules, table.names
+    star_id = table.string_id('*')
+
+    working_modules_by_name = defaultdict(list)
+    for import_id in list_with_import_from_working_branch.ids():
+        if names[import_id] != star_id:
+            working_modules_by_name[names[import_id]].append(modules[import_id])
+
+    moved_imports = {}
+    for import_id in list_with_import_from_origin_branch.ids():
+        origin_module_id = modules[import_id]
+        new_module_ids = [working_module_id for working_module_id
+                          in working_modules_by_name.get(names[import_id], ())
+                          if working_module_id != origin_module_id]
+        if new_module_ids:
+            origin_name = strings[names[import_id]]
+            moved_imports[strings[origin_module_id] + "." + origin_name] = [
+                strings[working_module_id] + "." + origin_name
+                for working_module_id in new_module_ids]
+    return moved_imports
+
+
+def _check_for_conflicts(moved_imports):
     """
     Checks if there is more than one object with the same module path.
 
     If any conflict is found, the script will display the list of conflicts for the user
     to decide either abort the script or create the list without the conflicted module path.
+
+    :param dict(str,list(str)) moved_imports: As returned by `_find_moved_imports`.
+    :return: A list with tuples where the first element is the origin and the second element
+        is the branch with the modifications
+    :rtype: list(tuple(str,str))
     """
-    import_from = [modified_import[0] for modified_import in list(list_with_modified_imports)]
-    imports_with_conflict = [class_name
-                             for class_name, number_of_occurrences in Counter(import_from).items()
-                             if number_of_occurrences > 1]
+    imports_with_conflict = {old_path for old_path, new_paths in moved_imports.items()
+                             if len(new_paths) > 1}
     if len(imports_with_conflict) > 0:
-        echo(CONFLICT_MSG.format('\n -> '.join(imports_with_conflict)))
+        echo(CONFLICT_MSG.format('\n -> '.join(sorted(imports_with_conflict))))
+        # Aborts unless the user confirms, so the list is only built once, without conflicts
+        confirm(INFORMATIVE_CONFLICT_MSG, abort=True)
 
-        if confirm(INFORMATIVE_CONFLICT_MSG, abort=True):
-            list_with_modified_imports = [modified_import
-                                          for modified_import in list_with_modified_imports
-                                          if modified_import[0] not in imports_with_conflict
-                                          if modified_import[1] not in imports_with_conflict]
-    return list_with_modified_imports
+    return [(old_path, new_path)
+            for old_path, new_paths in moved_imports.items()
+            if old_path not in imports_with_conflict
+            for new_path in new_paths
+            if new_path not in imports_with_conflict]
 
 
-def get_imports(project_path, list_of_py_files):
-    # type: (str) -> Import
+def get_imports(repo, list_of_py_files, table, cache=None, jobs=None):
     """
-    Look for all .py files on the given project path and return the import statements found on
-    each file.
+    Return the import statements found on each one of the given python files, by blob id.
 
-    Note.: I inserted the TQDM here because was the only way that I could have an accurate
-    progress bar, feel free to share any thoughts or tips on how to improve this progress bar =)
+    Each distinct blob is parsed only once. The blobs missing from the cache are split in chunks
+    and parsed by a process pool, each worker reading the blobs directly from the repository.
 
-    :type project_path: str
-    :rtype: commands.utils.Import
+    The imports are added to the table as they arrive, so each module and name is kept only
+    once no matter how many files import it.
+
+    :param git.Repo repo: The repository where the blobs are read.
+    :param list(git.Blob) list_of_py_files: The python files, from any branch.
+    :param ImportTable table: Where the imports found are added.
+    :param ImportCache cache: Cache of the imports of each blob, None to parse every blob.
+    :param int jobs: Number of worker processes, defaults to the number of CPUs.
+    :return: The ids of the imports of each blob on the table.
+    :rtype: dict(str,array)
+    """
+    imports_by_blob = {}
+    blobs_to_parse = {}
+    with stats.phase('cache'):
+        for blob in list_of_py_files:
+            if blob.hexsha in imports_by_blob or blob.hexsha in blobs_to_parse:
+                continue
+            imports = cache.get(blob.hexsha) if cache is not None else None
+            if imports is None:
+                blobs_to_parse[blob.hexsha] = blob.path
+            else:
+                imports_by_blob[blob.hexsha] = table.ids_of(imports)
+    stats.count('cached_files', len(imports_by_blob))
+
+    blobs_to_parse = sorted(blobs_to_parse.items())
+    chunks = split_in_chunks(blobs_to_parse, chunk_size_for(len(blobs_to_parse), jobs))
+    executor_type = 'serial' if jobs == 1 else 'process'
+    executor = create_executor(executor_type, jobs, initializer=_init_worker,
+                               initargs=(repo.git_dir, stats.is_enabled()))
+    stats.set_value('workers', 1 if executor_type == 'serial'
+                    else jobs or multiprocessing.cpu_count())
+    with executor, stats.phase('executor'):
+        with tqdm(total=len(blobs_to_parse), unit='files', leave=False) as pbar:
+            # The results of a chunk are released as soon as they are on the table
+            for chunk, future in iter_completed(executor, _get_imports_from_chunk, chunks,
+                                                max_in_flight_for(jobs)):
+                chunk_results, chunk_stats = future.result()
+                stats.merge(chunk_stats)
+                for hexsha, imports in chunk_results:
+                    imports_by_blob[hexsha] = table.ids_of(imports)
+                    if cache is not None:
+                        cache.set(hexsha, imports)
+                pbar.update(len(chunk))
+
+    return imports_by_blob
+
+
+def imports_of_files(list_of_py_files, imports_by_blob, table):
     """
-    with tqdm(total=len(list_of_py_files), unit='files', leave=False, desc=project_path) as pbar:
-        for file_path in list_of_py_files:
-            pbar.update()
-            with open(file_path, mode='r') as file:
-                file_content = ast.parse(file.read(), file_path)
+    Return the set of imports found on all the given files.
 
-            for node in ast.iter_child_nodes(file_content):
-                if isinstance(node, ast.Import):
-                    module = ''
-                elif isinstance(node, ast.ImportFrom):
-                    # node.module can be None when the following statement is used: from . import foo
-                    if node.module is not None:
-                        module = node.module
-                    else:
-                        module = ''
-                else:
-                    continue
+    :type list_of_py_files: list(git.Blob)
+    :param dict(str,array) imports_by_blob: As returned by `get_imports`.
+    :param ImportTable table: The table used by `get_imports`.
+    :rtype: ImportSet
+    """
+    return table.import_set(imports_by_blob[blob.hexsha] for blob in list_of_py_files)
+
+
+# The repository opened by the current worker and whether it collects stats, set once by the
+# executor initializer
+_worker_repo = None
+_worker_collects_stats = False
 
-                for name_node in node.names:
-                    yield Import(module, name_node.name)
 
+def _init_worker(git_dir, collect_stats=False):
+    global _worker_repo, _worker_collects_stats
+    _worker_repo = Repo(git_dir)
+    _worker_collects_stats = collect_stats
+
+
+def _get_imports_from_chunk(blobs):
+    """
+    Parse a list of (blob id, path) tuples on a worker.
 
+    :return: The imports of each blob and the stats collected while parsing them (None if
+        disabled).
+    :rtype: tuple(list(tuple(str,list(Import))),dict)
+    """
+    results = []
+    with stats.collecting(_worker_collects_stats) as chunk_stats, stats.phase('worker'):
+        for hexsha, path in blobs:
+            start = time.time()
+            with stats.phase('read'):
+                source = _worker_repo.odb.stream(hex_to_bin(hexsha)).read()
+            stats.count('bytes_read', len(source))
+            with stats.phase('ast.parse'):
+                results.append((hexsha, list(get_imports_from_source(source, path))))
+            stats.add_file(path, time.time() - start)
+    return results, chunk_stats.as_dict() if chunk_stats is not None else None
+
+
+def get_imports_from_source(source, file_path):
+    """
+    Return the import statements found on the top level of a python module.
+
+    :param bytes source: The content of the python file.
+    :param str file_path: Path of the file, used on the error messages.
+    :rtype: commands.utils.Import
+    """
+    file_content = ast.parse(source, file_path)
+
+    for node in ast.iter_child_nodes(file_content):
+        if isinstance(node, ast.Import):
+            module = ''
+        elif isinstance(node, ast.ImportFrom):
+            # node.module can be None when the following statement is used: from . import foo
+            if node.module is not None:
+                module = node.module
+            else:
+                module = ''
+        else:
+            continue
+
+        for name_node in node.names:
+            yield Import(module, name_node.name)
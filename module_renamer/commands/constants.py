@@ -0,0 +1,10 @@
+"""
+Constants shared by the commands and the command line, kept apart from `utils` so the command
+line can use them without importing the dependencies of the commands.
+"""
+
+EXECUTOR_TYPES = ('process', 'thread', 'serial')
+
+# Formats of the file with the list of moved imports: a python module with the list
+# 'imports_to_move', one JSON array per line or one tab separated pair per line
+MOVES_FILE_FORMATS = ('python', 'jsonl', 'tsv')
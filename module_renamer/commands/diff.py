@@ -0,0 +1,84 @@
+"""
+Unified diffs of the files that would be modified by a rename, which can be applied with
+`git apply` or `patch -p1` from the current directory.
+"""
+import difflib
+import os
+
+from module_renamer.commands.utils import encode_source
+
+NO_NEWLINE_MARKER = b'\\ No newline at end of file\n'
+
+
+def unified_diff(file_path, source_code, new_source_code, encoding, newline, relative_to=None):
+    """
+    The unified diff between two versions of a file, as bytes.
+
+    The changed lines keep the encoding and the line endings of the file, while the headers are
+    written with '\\n' and the path of the file relative to the current directory, or to the
+    given one.
+
+    :param str file_path: Path of the file.
+    :param str source_code: Content of the file, with the line endings normalized to '\\n'.
+    :param str new_source_code: The renamed content, on the same format.
+    :param str encoding: Encoding of the file, as returned by `utils.decode_source`.
+    :param str newline: Line ending of the file, as returned by `utils.decode_source`.
+    :param str relative_to: Directory the paths of the headers are relative to, defaults to the
+        current directory.
+    :rtype: bytes
+    """
+    display_path = os.path.relpath(file_path, relative_to or os.curdir).replace(os.sep, '/')
+    lines = difflib.unified_diff(source_code.splitlines(True), new_source_code.splitlines(True),
+                                 'a/' + display_path, 'b/' + display_path)
+
+    diff = []
+    for line in lines:
+        if line.startswith(('---', '+++', '@@')) and line.endswith('\n'):
+            diff.append(line.encode('utf-8'))
+        elif line.endswith('\n'):
+            diff.append(encode_source(line, encoding, newline))
+        else:
+            diff.append(encode_source(line, encoding, newline) + b'\n' + NO_NEWLINE_MARKER)
+    return b''.join(diff)
+
+
+class OrderedDiffWriter(object):
+    """
+    Write the diffs of each chunk of files in the order the chunks were sent to the workers,
+    which is the order the files were found, no matter the order the workers finish them.
+
+    The diffs of a chunk are written as soon as every chunk sent before it is done, so at most
+    the chunks in flight are held in memory.
+
+    :param file stream: Binary stream where the diffs are written.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._sent_chunks = []
+        self._done_chunks = {}
+
+    def track(self, chunks):
+        """
+        Remember the order of the chunks as they are pulled by the executor.
+        """
+        for chunk in chunks:
+            self._sent_chunks.append(chunk)
+            yield chunk
+
+    def add(self, chunk, diffs):
+        """
+        :param list chunk: A chunk pulled from `track`.
+        :param list(bytes) diffs: The diff of each file of the chunk, None if unchanged.
+        """
+        self._done_chunks[id(chunk)] = diffs
+        written = 0
+        while written < len(self._sent_chunks) and \
+                id(self._sent_chunks[written]) in self._done_chunks:
+            for diff in self._done_chunks.pop(id(self._sent_chunks[written])):
+                if diff:
+                    self.stream.write(diff)
+            written += 1
+        if written:
+            del self._sent_chunks[:written]
+            self.stream.flush()
@@ -0,0 +1,255 @@
+import fnmatch
+import os
+import posixpath
+import re
+import subprocess
+import tempfile
+
+from click import ClickException
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover (Python 2)
+    from scandir import scandir
+
+# Directories that never have project files, always pruned
+DEFAULT_EXCLUDES = (
+    '.git', '.hg', '.svn', '.tox', '.nox', '.eggs', '*.egg-info', '__pycache__', 'node_modules',
+)
+
+# A directory with this file is a virtualenv
+VIRTUALENV_MARKER = 'pyvenv.cfg'
+
+
+class FileDiscovery(object):
+    """
+    Find the python files of a project, pruning the excluded directories as early as possible.
+
+    Patterns without a '/' are matched against the name of the file or directory, otherwise
+    against its path relative to the project, always using '/' as separator.
+
+    :param tuple(str) include:
+        Patterns of the files to be processed [Default: *.py].
+    :param tuple(str) exclude:
+        Patterns of files and directories to be skipped, in addition to DEFAULT_EXCLUDES.
+    :param bool use_gitignore:
+        Skip the files and directories ignored by the .gitignore files found on the project.
+    :param bool use_git:
+        List the files with `git ls-files`, which also respects the ignore rules of git, instead
+        of walking on the file system.
+    """
+
+    def __init__(self, include=(), exclude=(), use_gitignore=True, use_git=False):
+        self.include = tuple(include) or ('*.py',)
+        self.exclude = DEFAULT_EXCLUDES + tuple(exclude)
+        self.use_gitignore = use_gitignore
+        self.use_git = use_git
+
+    def accepts_file(self, relative_path):
+        name = posixpath.basename(relative_path)
+        return (_matches_any(self.include, relative_path, name) and
+                not _matches_any(self.exclude, relative_path, name))
+
+    def accepts_dir(self, relative_path):
+        return not _matches_any(self.exclude, relative_path, posixpath.basename(relative_path))
+
+    def walk(self, folder):
+        """
+        Yield the absolute path of each file of the project, as soon as it is found.
+
+        :param str folder: Root directory of the project.
+        """
+        if self.use_git:
+            return self._walk_with_git(folder)
+        return self._walk_with_scandir(folder)
+
+    def _walk_with_scandir(self, folder):
+        root = os.path.abspath(folder)
+        ignore_rules = []
+        info_exclude = os.path.join(root, '.git', 'info', 'exclude')
+        if self.use_gitignore and os.path.isfile(info_exclude):
+            ignore_rules = read_gitignore(info_exclude, '')
+
+        pending_dirs = [(root, '', ignore_rules)]
+        while pending_dirs:
+            dir_path, relative_dir, ignore_rules = pending_dirs.pop()
+            try:
+                entries = sorted(scandir(dir_path), key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            names = {entry.name for entry in entries}
+            if relative_dir and VIRTUALENV_MARKER in names:
+                continue
+            if self.use_gitignore and '.gitignore' in names:
+                ignore_rules = ignore_rules + read_gitignore(
+                    os.path.join(dir_path, '.gitignore'), relative_dir)
+
+            sub_dirs = []
+            for entry in entries:
+                relative_path = relative_dir + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if (self.accepts_dir(relative_path) and
+                            not is_ignored(ignore_rules, relative_path, is_dir=True)):
+                        sub_dirs.append((entry.path, relative_path + '/', ignore_rules))
+                elif (entry.is_file() and self.accepts_file(relative_path) and
+                      not is_ignored(ignore_rules, relative_path, is_dir=False)):
+                    yield entry.path
+
+            # The stack is reversed, so the directories are visited in alphabetical order
+            pending_dirs.extend(reversed(sub_dirs))
+
+    def _walk_with_git(self, folder):
+        root = os.path.abspath(folder)
+        accepted_dirs = {'': True}
+
+        def _accepts_dir(relative_dir):
+            if relative_dir not in accepted_dirs:
+                parent_dir = posixpath.dirname(relative_dir)
+                accepted_dirs[relative_dir] = (
+                    _accepts_dir(parent_dir) and self.accepts_dir(relative_dir) and
+                    not os.path.isfile(os.path.join(root, relative_dir, VIRTUALENV_MARKER)))
+            return accepted_dirs[relative_dir]
+
+        previous_path = None
+        for relative_path in _list_git_files(root, folder):
+            # Unmerged files are listed once for each stage
+            if relative_path == previous_path:
+                continue
+            previous_path = relative_path
+
+            if not _accepts_dir(posixpath.dirname(relative_path)):
+                continue
+            file_path = os.path.join(root, *relative_path.split('/'))
+            if self.accepts_file(relative_path) and os.path.isfile(file_path):
+                yield file_path
+
+
+def _list_git_files(root, folder):
+    """
+    Yield the paths, relative to root, of the files tracked or not ignored by git.
+
+    The errors of git go to a temporary file instead of a pipe, which git could fill while the
+    listing is still being read.
+
+    :param str root: Absolute path of the folder.
+    :param str folder: The folder as given by the user, for the error message.
+    """
+    command = ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard']
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(command, cwd=root, stdout=subprocess.PIPE, stderr=error_file)
+        for relative_path in _split_stream(process.stdout, b'\0'):
+            yield relative_path.decode('utf-8')
+
+        process.communicate()
+        if process.returncode != 0:
+            error_file.seek(0)
+            error = error_file.read().decode('utf-8', 'replace').strip()
+            raise ClickException("Could not list the files of {0} with git: {1}"
+                                 .format(folder, error))
+
+
+def read_gitignore(file_path, relative_dir):
+    """
+    Read the rules of a .gitignore file.
+
+    :param str file_path: Path of the .gitignore file.
+    :param str relative_dir: Directory of the file relative to the project, ending with '/'.
+    :return: A list of tuples with the compiled pattern, whether the rule is negated and whether
+        it only applies to directories.
+    :rtype: list(tuple(re.Pattern,bool,bool))
+    """
+    rules = []
+    with open(file_path, mode='rb') as file:
+        lines = file.read().decode('utf-8', 'replace').splitlines()
+
+    for line in lines:
+        line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        if line.startswith('\\'):
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # Patterns with a '/' are relative to the .gitignore directory, otherwise match any depth
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if not line:
+            continue
+
+        prefix = re.escape(relative_dir) + ('' if anchored else '(?:.*/)?')
+        rules.append((re.compile(prefix + _translate_glob(line) + '$'), negated, dir_only))
+    return rules
+
+
+def is_ignored(ignore_rules, relative_path, is_dir):
+    """
+    Like git, the last rule that matches the path decides if it is ignored.
+    """
+    ignored = False
+    for pattern, negated, dir_only in ignore_rules:
+        if dir_only and not is_dir:
+            continue
+        if pattern.match(relative_path):
+            ignored = not negated
+    return ignored
+
+
+def _translate_glob(pattern):
+    """
+    Translate a gitignore glob to a regex, where '*' doesn't match '/' but '**' does.
+    """
+    result = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            result.append('/.*')
+            i += 3
+        elif pattern[i] == '*':
+            result.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            result.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and pattern.find(']', i + 2) != -1:
+            end = pattern.find(']', i + 2)
+            content = pattern[i + 1:end]
+            if content.startswith('!'):
+                content = '^' + content[1:]
+            result.append('[' + content.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(result)
+
+
+def _matches_any(patterns, relative_path, name):
+    return any(fnmatch.fnmatch(relative_path if '/' in pattern else name, pattern)
+               for pattern in patterns)
+
+
+def _split_stream(stream, separator):
+    """
+    Yield the items of a stream separated by separator, as soon as they are read.
+    """
+    buffer = b''
+    for block in iter(lambda: stream.read(65536), b''):
+        buffer += block
+        items = buffer.split(separator)
+        buffer = items.pop()
+        for item in items:
+            yield item
+    if buffer:
+        yield buffer
@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# Must be increased whenever the imports extracted from a file change, invalidating the cache
+PARSER_VERSION = '1-py{0}.{1}'.format(*sys.version_info[:2])
+
+DEFAULT_MAX_ENTRIES = 500000
+
+CACHE_FILE_NAME = 'imports.sqlite'
+
+
+class ImportCache(object):
+    """
+    Persistent cache of the imports found on each python file, keyed by the git blob id.
+
+    Since a blob id is the hash of the file content, an entry never becomes stale and can be
+    shared between branches and runs. Entries from a different PARSER_VERSION are ignored.
+    New entries and the access times are only written when the cache is closed, evicting the
+    least recently used entries above max_entries. The new entries are kept already encoded
+    until then, so they don't hold on to the strings of every import found.
+
+    :param str cache_dir:
+        Directory where the cache file is stored, created if needed.
+    :param int max_entries:
+        Maximum number of files kept on the cache.
+    """
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_MAX_ENTRIES):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE_NAME))
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS imports ('
+            ' blob_id TEXT NOT NULL,'
+            ' parser_version TEXT NOT NULL,'
+            ' imports TEXT NOT NULL,'
+            ' last_used REAL NOT NULL,'
+            ' PRIMARY KEY (blob_id, parser_version))'
+        )
+        self._new_entries = {}
+        self._used_entries = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, blob_id):
+        """
+        :return: The list of (module, name) tuples of the file, or None if it is not cached.
+        :rtype: list(tuple(str,str))
+        """
+        encoded_imports = self._new_entries.get(blob_id)
+        if encoded_imports is None:
+            row = self._connection.execute(
+                'SELECT imports FROM imports WHERE blob_id = ? AND parser_version = ?',
+                (blob_id, PARSER_VERSION)).fetchone()
+            if row is None:
+                return None
+            self._used_entries.add(blob_id)
+            encoded_imports = row[0]
+
+        return [tuple(imp) for imp in json.loads(encoded_imports)]
+
+    def set(self, blob_id, imports):
+        """
+        :param str blob_id: The git blob id of the file.
+        :param list(tuple(str,str)) imports: The (module, name) tuples found on the file.
+        """
+        self._new_entries[blob_id] = json.dumps([list(imp) for imp in imports])
+
+    def close(self):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'UPDATE imports SET last_used = ? WHERE blob_id = ? AND parser_version = ?',
+                [(now, blob_id, PARSER_VERSION) for blob_id in self._used_entries])
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO imports VALUES (?, ?, ?, ?)',
+                [(blob_id, PARSER_VERSION, encoded_imports, now)
+                 for blob_id, encoded_imports in self._new_entries.items()])
+            self._evict()
+        self._connection.close()
+
+    def _evict(self):
+        number_of_entries = self._connection.execute('SELECT COUNT(*) FROM imports').fetchone()[0]
+        if number_of_entries > self.max_entries:
+            self._connection.execute(
+                'DELETE FROM imports WHERE rowid IN '
+                '(SELECT rowid FROM imports ORDER BY last_used LIMIT ?)',
+                (number_of_entries - self.max_entries,))
@@ -0,0 +1,231 @@
+import ast
+import hashlib
+import os
+import sqlite3
+import sys
+
+import click
+import six
+
+from module_renamer.commands import stats
+from module_renamer.commands.utils import (STREAMING_CHUNK_SIZE, create_executor, iter_chunks,
+                                           iter_completed, max_in_flight_for,
+                                           walk_on_all_py_files)
+
+# Must be increased whenever the names extracted from a file change, rebuilding the index
+INDEX_VERSION = '1-py{0}.{1}'.format(*sys.version_info[:2])
+
+
+def index_project(project_path, index_path, executor_type='process', jobs=None, discovery=None):
+    """
+    Create or update the reverse index of the imports of a project.
+
+    :param str|list(str) project_path: Path (or paths) of the project.
+    :param str index_path: Path of the index.
+    :param str executor_type: One of `constants.EXECUTOR_TYPES`.
+    :param int jobs: Number of workers, defaults to the number of CPUs.
+    :param FileDiscovery discovery: Settings used to find the python files of the project.
+    """
+    if isinstance(project_path, six.string_types):
+        project_path = [project_path]
+    with ImportIndex(index_path) as index, create_executor(executor_type, jobs) as executor:
+        file_paths, parsed_files = index.update(project_path, executor, max_in_flight_for(jobs),
+                                                discovery)
+    click.echo('{0} file(s) indexed, {1} file(s) parsed'.format(len(file_paths), parsed_files))
+
+
+def who_imports(dotted_paths, index_path):
+    """
+    Echo the files that may be affected by moving any of the given dotted paths, as found on
+    the index.
+    """
+    if not os.path.isfile(index_path):
+        raise click.ClickException('The index {0} does not exist, create it with '
+                                   '"renamer index"'.format(index_path))
+    with ImportIndex(index_path) as index:
+        for file_path in sorted(index.files_referencing(dotted_paths)):
+            click.echo(file_path)
+
+
+class ImportIndex(object):
+    """
+    Persistent reverse index of the imports of a project, mapping each imported dotted name to
+    the files that import it, so a rename only needs to visit the files that reference one of
+    the moved imports.
+
+    The index is updated incrementally: a file is only read again when its modification time
+    or size changed, and only parsed again when its content changed.
+
+    :param str path:
+        Path of the index, an SQLite database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != INDEX_VERSION:
+            self._create_tables()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def _create_tables(self):
+        with self._connection:
+            self._connection.execute('DROP TABLE IF EXISTS files')
+            self._connection.execute('DROP TABLE IF EXISTS names')
+            self._connection.execute(
+                'CREATE TABLE files ('
+                ' path TEXT PRIMARY KEY,'
+                ' mtime REAL NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' hash TEXT NOT NULL,'
+                ' error TEXT)'
+            )
+            self._connection.execute('CREATE TABLE names (name TEXT NOT NULL, path TEXT NOT NULL)')
+            self._connection.execute('CREATE INDEX names_by_name ON names (name)')
+            self._connection.execute('CREATE INDEX names_by_path ON names (path)')
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                                     (INDEX_VERSION,))
+
+    def update(self, project_path, executor, max_in_flight, discovery=None):
+        """
+        Bring the index up to date with the python files of the project.
+
+        The files removed from the project are removed from the index, the new and changed ones
+        are read and parsed on the executor.
+
+        :param list(str) project_path: The directories of the project.
+        :param concurrent.futures.Executor executor: Where the files are parsed.
+        :param int max_in_flight: Maximum number of chunks pending on the executor.
+        :param FileDiscovery discovery: Settings used to find the python files of the project.
+        :return: The path of each python file of the project, in the order they were found, and
+            the number of files parsed.
+        :rtype: tuple(list(str),int)
+        """
+        indexed_files = {
+            path: (mtime, size, content_hash)
+            for path, mtime, size, content_hash in self._connection.execute(
+                'SELECT path, mtime, size, hash FROM files')
+        }
+
+        file_paths = []
+        files_to_check = []
+        for file_path in stats.timed_iter('walk', walk_on_all_py_files(project_path, discovery)):
+            file_paths.append(file_path)
+            indexed_file = indexed_files.pop(file_path, None)
+            file_stat = os.stat(file_path)
+            if indexed_file is None:
+                files_to_check.append((file_path, None))
+            elif indexed_file[:2] != (file_stat.st_mtime, file_stat.st_size):
+                files_to_check.append((file_path, indexed_file[2]))
+
+        roots = [os.path.join(os.path.realpath(folder), '') for folder in project_path]
+        removed_files = [(file_path,) for file_path in indexed_files
+                         if any(file_path.startswith(root) for root in roots)]
+        with self._connection:
+            self._connection.executemany('DELETE FROM files WHERE path = ?', removed_files)
+            self._connection.executemany('DELETE FROM names WHERE path = ?', removed_files)
+
+        parsed_files = 0
+        chunks = iter_chunks(files_to_check, STREAMING_CHUNK_SIZE)
+        for _, future in iter_completed(executor, _index_chunk, chunks, max_in_flight):
+            with self._connection:
+                for file_path, mtime, size, content_hash, names, error in future.result():
+                    if names is None:
+                        # Same content, the stored names and parse error are still valid
+                        self._connection.execute(
+                            'UPDATE files SET mtime = ?, size = ? WHERE path = ?',
+                            (mtime, size, file_path))
+                        continue
+                    parsed_files += 1
+                    self._connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                             (file_path, mtime, size, content_hash, error))
+                    self._connection.execute('DELETE FROM names WHERE path = ?', (file_path,))
+                    self._connection.executemany('INSERT INTO names VALUES (?, ?)',
+                                                 [(name, file_path) for name in names])
+        stats.count('parsed_files', parsed_files)
+        return file_paths, parsed_files
+
+    def files_referencing(self, dotted_paths):
+        """
+        The files that may be affected by moving any of the given dotted paths: the ones that
+        import the path itself, one of its parents (which gives access to it as an attribute)
+        or one of its children, plus the files that could not be parsed.
+
+        :param iterable(str) dotted_paths: The old paths of the moved imports.
+        :rtype: set(str)
+        """
+        file_paths = {
+            file_path for file_path, in self._connection.execute(
+                'SELECT path FROM files WHERE error IS NOT NULL')
+        }
+        for dotted_path in dotted_paths:
+            parts = dotted_path.split('.')
+            parents = ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+            query = ('SELECT DISTINCT path FROM names WHERE name IN ({0}) OR '
+                     '(name >= ? AND name < ?)'.format(', '.join('?' * len(parents))))
+            # '/' comes right after '.', so this range has all the names inside dotted_path
+            file_paths.update(file_path for file_path, in self._connection.execute(
+                query, parents + [dotted_path + '.', dotted_path + '/']))
+        return file_paths
+
+
+def _index_chunk(files):
+    """
+    Read and parse a list of files on a worker, for `ImportIndex.update`.
+
+    :param list(tuple(str,str)) files: The path of each file and the hash of its content when
+        it was indexed, or None.
+    :return: The path, modification time, size, hash, imported names and the parse error of
+        each file, the names and the error are None if the content didn't change.
+    :rtype: list(tuple(str,float,int,str,list(str),str))
+    """
+    results = []
+    for file_path, indexed_hash in files:
+        file_stat = os.stat(file_path)
+        with open(file_path, mode='rb') as file:
+            source = file.read()
+        content_hash = hashlib.sha1(source).hexdigest()
+        names = None
+        error = None
+        if content_hash != indexed_hash:
+            try:
+                names = sorted(set(iter_imported_names(source, file_path)))
+            except (SyntaxError, ValueError) as exc:
+                names = []
+                error = str(exc)
+        results.append((file_path, file_stat.st_mtime, file_stat.st_size, content_hash, names,
+                        error))
+    return results
+
+
+def iter_imported_names(source, file_path='<string>'):
+    """
+    Yield the dotted name of everything imported by a python module, anywhere on the module.
+
+    `from a.b import c` yields 'a.b.c' and `from a.b import *` yields 'a.b'. Relative imports
+    are ignored, since they are never renamed.
+
+    :param bytes source: The content of the python file.
+    :param str file_path: Path of the file, used on the error messages.
+    """
+    for node in ast.walk(ast.parse(source, file_path)):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            for alias in node.names:
+                if alias.name == '*':
+                    yield node.module
+                else:
+                    yield node.module + '.' + alias.name
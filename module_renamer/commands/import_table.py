@@ -0,0 +1,185 @@
+import binascii
+from array import array
+from collections import namedtuple
+
+Import = namedtuple("Import", ["module", "name"])
+
+# Type of the arrays of ids, 4 bytes on every platform
+ID_TYPECODE = 'i'
+
+
+class ImportTable(object):
+    """
+    Compact table of the distinct imports found on a project.
+
+    Each module and name is stored once and each distinct import has a dense integer id, so
+    the imports of a file are an array of ids and the imports of a branch are a bitmap of
+    them (see `ImportSet`), instead of sets of tuples holding a copy of each string per file.
+
+    :ivar list(str) strings: The modules and names, by string id.
+    :ivar array modules: The string id of the module of each import, by import id.
+    :ivar array names: The string id of the name of each import, by import id.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._string_ids = {}
+        self.modules = array(ID_TYPECODE)
+        self.names = array(ID_TYPECODE)
+        self._import_ids = {}
+
+    def __len__(self):
+        return len(self.modules)
+
+    def string_id(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def import_id(self, module, name):
+        module_id = self.string_id(module)
+        name_id = self.string_id(name)
+        key = module_id << 32 | name_id
+        import_id = self._import_ids.get(key)
+        if import_id is None:
+            import_id = self._import_ids[key] = len(self.modules)
+            self.modules.append(module_id)
+            self.names.append(name_id)
+        return import_id
+
+    def find_import_id(self, module, name):
+        """
+        :return: The id of the import, or None if it is not on the table.
+        :rtype: int
+        """
+        module_id = self._string_ids.get(module)
+        name_id = self._string_ids.get(name)
+        if module_id is None or name_id is None:
+            return None
+        return self._import_ids.get(module_id << 32 | name_id)
+
+    def ids_of(self, imports):
+        """
+        :param iterable(tuple(str,str)) imports: The (module, name) of each import.
+        :return: The id of each import, adding the new ones to the table.
+        :rtype: array
+        """
+        return array(ID_TYPECODE, (self.import_id(module, name) for module, name in imports))
+
+    def get(self, import_id):
+        """
+        :rtype: Import
+        """
+        return Import(self.strings[self.modules[import_id]],
+                      self.strings[self.names[import_id]])
+
+    def import_set(self, id_arrays=()):
+        """
+        Create the set of the imports of all the given arrays of ids.
+
+        :param iterable(array) id_arrays: As returned by `ids_of`.
+        :rtype: ImportSet
+        """
+        bits = bytearray((len(self) + 7) // 8)
+        for ids in id_arrays:
+            for import_id in ids:
+                bits[import_id >> 3] |= 1 << (import_id & 7)
+        return ImportSet(self, _int_from_bytes(bits))
+
+
+class ImportSet(object):
+    """
+    Set of imports of an `ImportTable`, stored as a bitmap of their ids on a single integer, so
+    the set operations used by analyze run on whole words instead of on each import.
+
+    Iterating the set yields `Import` tuples, sorted by id.
+
+    :param ImportTable table: The table of the ids.
+    :param int bits: The bitmap, the import with id i is on the set when the bit i is set.
+    """
+
+    def __init__(self, table, bits=0):
+        self.table = table
+        self.bits = bits
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __bool__(self):
+        return self.bits != 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        get = self.table.get
+        return (get(import_id) for import_id in self.ids())
+
+    def __contains__(self, imp):
+        import_id = self.table.find_import_id(*imp)
+        return import_id is not None and bool(self.bits >> import_id & 1)
+
+    def __eq__(self, other):
+        return (isinstance(other, ImportSet) and self.table is other.table and
+                self.bits == other.bits)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def ids(self):
+        """
+        Yield the id of each import of the set, in increasing order.
+        """
+        for byte_index, byte in enumerate(_bytes_from_int(self.bits)):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield byte_index * 8 + bit
+
+    def _new(self, bits):
+        return ImportSet(self.table, bits)
+
+    def _check_table(self, other):
+        if other.table is not self.table:
+            raise ValueError('The sets are from different tables of imports')
+
+    def union(self, other):
+        self._check_table(other)
+        return self._new(self.bits | other.bits)
+
+    def intersection(self, other):
+        self._check_table(other)
+        return self._new(self.bits & other.bits)
+
+    def difference(self, other):
+        self._check_table(other)
+        return self._new(self.bits & ~other.bits)
+
+    def symmetric_difference(self, other):
+        self._check_table(other)
+        return self._new(self.bits ^ other.bits)
+
+    def update(self, other):
+        self._check_table(other)
+        self.bits |= other.bits
+
+
+def _int_from_bytes(data):
+    """
+    The integer of a little endian bytearray, like `int.from_bytes` (missing on python 2).
+    """
+    data.reverse()
+    return int(binascii.hexlify(data) or b'0', 16)
+
+
+def _bytes_from_int(value):
+    """
+    The little endian bytearray of a non negative integer, see `_int_from_bytes`.
+    """
+    hex_digits = '{0:x}'.format(value)
+    data = bytearray(binascii.unhexlify(hex_digits.zfill(len(hex_digits) + len(hex_digits) % 2)))
+    data.reverse()
+    return data
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+from click import ClickException
+
+from module_renamer.commands.utils import write_file_atomically
+
+FAILED = 'failed'
+
+# Recorded by the worker right before a file is replaced, the file may or may not have been
+# written when the run is interrupted
+PENDING = 'pending'
+
+# Statuses of the files that don't need to be renamed again when resuming a run, a pending file
+# is only renamed again when it doesn't have the content written by the run
+COMPLETED_STATUSES = ('skipped', 'unchanged', 'modified', PENDING)
+
+# Seconds a connection waits for the others, the workers write to the journal too
+LOCK_TIMEOUT = 60
+
+OBJECTS_DIR_SUFFIX = '.objects'
+
+
+class RenameJournal(object):
+    """
+    Checkpoint of a rename run, used to resume an interrupted run or to roll it back.
+
+    For each file processed it records the status and the hash of the content before and after
+    the rename. Before a file is modified its original content is saved on a directory next to
+    the journal, named by its hash, and the worker records it as pending (see `record_pending`),
+    so the originals can be restored by `rollback` even when the run is interrupted.
+
+    The journal is tied to the move plan of the run, it can only be resumed with the same plan.
+
+    :param str path:
+        Path of the journal, an SQLite database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_dir = path + OBJECTS_DIR_SUFFIX
+        self._connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' path TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' hash_before TEXT,'
+            ' hash_after TEXT,'
+            ' error TEXT)'
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    @property
+    def plan_digest(self):
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'plan_digest'").fetchone()
+        return row[0] if row is not None else None
+
+    def start(self, plan_digest, resume=False):
+        """
+        Start a new run, or resume the run recorded on the journal.
+
+        :param str plan_digest: As returned by `digest_of_moves`.
+        :param bool resume: True to continue the run recorded on the journal.
+        """
+        if resume:
+            if self.plan_digest is None:
+                raise ClickException('There is no run to be resumed on the journal {0}'
+                                     .format(self.path))
+            if self.plan_digest != plan_digest:
+                raise ClickException('The journal {0} was written with a different list of '
+                                     'imports to move'.format(self.path))
+            return
+
+        if self.plan_digest is not None:
+            raise ClickException('The journal {0} already has a run, use --resume to continue '
+                                 'it, --rollback to undo it or remove it'.format(self.path))
+        if not os.path.isdir(self.objects_dir):
+            os.makedirs(self.objects_dir)
+        with self._connection:
+            self._connection.execute("INSERT INTO meta VALUES ('plan_digest', ?)",
+                                     (plan_digest,))
+
+    def completed_hash(self, file_path):
+        """
+        :return: The hash of the file after it was renamed, or None if it must be renamed again.
+            A pending file is only renamed again when its content is not this hash.
+        :rtype: str
+        """
+        row = self._connection.execute(
+            'SELECT status, hash_after FROM files WHERE path = ?', (file_path,)).fetchone()
+        if row is None or row[0] not in COMPLETED_STATUSES:
+            return None
+        return row[1]
+
+    def record(self, file_results):
+        """
+        Record the result of a list of files at once.
+
+        :param list(tuple(str,str,str,str,str)) file_results: The path, status, hash before,
+            hash after and error message of each file.
+        """
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                         file_results)
+
+    def modified_files(self):
+        """
+        :return: The path, hash before and hash after of each file modified by the run, including
+            the pending ones.
+        :rtype: list(tuple(str,str,str))
+        """
+        return self._connection.execute(
+            "SELECT path, hash_before, hash_after FROM files WHERE status IN ('modified', ?) "
+            "ORDER BY path", (PENDING,)).fetchall()
+
+    def read_original(self, content_hash):
+        with open(os.path.join(self.objects_dir, content_hash), mode='rb') as file:
+            return file.read()
+
+    def remove(self):
+        """
+        Close the journal and remove it, with the original contents saved.
+        """
+        self.close()
+        os.remove(self.path)
+        shutil.rmtree(self.objects_dir, ignore_errors=True)
+
+
+def record_pending(journal_path, file_path, hash_before, hash_after):
+    """
+    Record a file as pending right before it is replaced, called by the workers.
+
+    The row is committed before the file is written, so an interrupted run can always be
+    rolled back. It is replaced by the final status of the file once the main process gets
+    the result of its chunk.
+    """
+    connection = sqlite3.connect(journal_path, timeout=LOCK_TIMEOUT)
+    try:
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, NULL)',
+                               (file_path, PENDING, hash_before, hash_after))
+    finally:
+        connection.close()
+
+
+def save_original(objects_dir, content):
+    """
+    Save the original content of a file before it is modified, called by the workers.
+
+    :return: The hash of the content.
+    :rtype: str
+    """
+    hash_of_content = content_hash(content)
+    object_path = os.path.join(objects_dir, hash_of_content)
+    if not os.path.isfile(object_path):
+        write_file_atomically(object_path, content)
+    return hash_of_content
+
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def digest_of_moves(moves):
+    """
+    Identify a move plan, the same moves in the same order always have the same digest.
+
+    :param list(tuple(str,str)) moves: The moves of the plan.
+    :rtype: str
+    """
+    return hashlib.sha1(json.dumps([list(move) for move in moves]).encode('utf-8')).hexdigest()
+
+
+def rollback(journal):
+    """
+    Restore the original content of the files modified by the run recorded on the journal.
+
+    A file is only restored when it still has the content written by the run, files changed
+    after the run are left as they are.
+
+    :return: The number of files restored and the list of files that could not be restored.
+    :rtype: tuple(int,list(str))
+    """
+    restored_files = 0
+    conflicts = []
+    for file_path, hash_before, hash_after in journal.modified_files():
+        try:
+            with open(file_path, mode='rb') as file:
+                current_hash = content_hash(file.read())
+        except IOError:
+            conflicts.append(file_path)
+            continue
+
+        if current_hash == hash_before:
+            continue
+        if current_hash != hash_after:
+            conflicts.append(file_path)
+            continue
+
+        write_file_atomically(file_path, journal.read_original(hash_before))
+        restored_files += 1
+    return restored_files, conflicts
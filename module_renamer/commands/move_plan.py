@@ -0,0 +1,260 @@
+import ast
+import io
+import json
+import re
+
+import six
+from click import ClickException
+
+from module_renamer.commands.utils import WORD_END, WORD_START, moves_file_format_for
+
+INVALID_MOVES_MSG = (
+    "\n"
+    "The file with the list of imports to move has invalid entries.\n"
+    "Each item of 'imports_to_move' must be a tuple with the old path and the new path.\n"
+    "These are the entries that are invalid: \n"
+    " -> {} \n"
+)
+
+_IDENTIFIER = re.compile(r'^[^\W\d]\w*$', re.UNICODE)
+
+# The layout of the python files written by the analyze command
+_WRITTEN_MOVE = re.compile(r"\('([\w.]+)', '([\w.]+)'\)", re.UNICODE)
+_WRITTEN_MOVES_FILE = re.compile(r"imports_to_move = \[(?:\s*{0},?)*\s*\]\s*\Z"
+                                 .format(_WRITTEN_MOVE.pattern), re.UNICODE)
+
+# Python allows whitespace and line continuations around the dots of a dotted name
+_DOT_SEPARATOR = r'[ \t\f\r\n\\]*\.[ \t\f\r\n\\]*'
+
+
+class MovePlan(object):
+    """
+    Validated list of moved imports, loaded once per run and shared by all the workers.
+
+    The moves keep the order from the original list, since each rename is applied on the
+    result of the previous one.
+
+    :ivar list(tuple(str,str)) moves:
+        List of tuples where the first element is the old path and the second is the new path.
+
+    :ivar dict(str,list(int)) index:
+        Maps each old path to the positions where it appears on `moves`.
+
+    :ivar candidate_pattern:
+        Compiled bytes pattern that matches any text a file must contain to be affected by
+        at least one of the moves, or None when there are no moves.
+    """
+
+    def __init__(self, moves):
+        self.moves = _validate_moves(moves)
+        self.index = {}
+        for position, (old_path, _) in enumerate(self.moves):
+            self.index.setdefault(old_path, []).append(position)
+        self.candidate_pattern = _compile_candidate_pattern(self.index)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def might_affect(self, source):
+        """
+        Cheap textual check used to skip files before parsing them.
+
+        A file can only be changed by a move when it imports the old path, either as
+        `import a.b.c`, `from a.b.c import d` or `from a.b import c`, so the module part of the
+        old path must be present on the source. False positives are fine, false negatives not.
+
+        :param bytes source: The raw content of the file.
+        :rtype: bool
+        """
+        if self.candidate_pattern is None:
+            return False
+        return self.candidate_pattern.search(source) is not None
+
+    def next_position(self, referenced_paths, position):
+        """
+        Find the next move, starting from position, whose old path is referenced by a module.
+
+        :param referenced_paths: The dotted paths imported by the module.
+        :param int position: Position on `moves` of the first move to be considered.
+        :return: The position of the move, or None if no other move affects the module.
+        :rtype: int
+        """
+        pending_positions = [
+            move_position
+            for old_path in referenced_paths if old_path in self.index
+            for move_position in self.index[old_path] if move_position >= position
+        ]
+        return min(pending_positions) if pending_positions else None
+
+
+def load_move_plan(path_to_moved_imports_file):
+    """
+    Load and validate the list of moved imports from the given file.
+
+    :param str path_to_moved_imports_file:
+        Path to the file with a list of moved imports, generated from analyze difference
+        command or created manually, on any of the `constants.MOVES_FILE_FORMATS`.
+
+    :rtype: MovePlan
+    """
+    return MovePlan(iter_moves(path_to_moved_imports_file))
+
+
+def iter_moves(path_to_moved_imports_file, file_format=None):
+    """
+    Yield the moves of a file with moved imports, without executing it.
+
+    The jsonl and tsv files are read one line at a time, ignoring empty lines and comments. The
+    list 'imports_to_move' of a python file must be a literal, like the ones written by the
+    analyze command.
+
+    :param str file_format: One of `constants.MOVES_FILE_FORMATS`, detected from the extension of
+        the file or its content by default.
+    :rtype: iterator(tuple)
+    """
+    if file_format is None:
+        file_format = (moves_file_format_for(path_to_moved_imports_file) or
+                       _detect_moves_file_format(path_to_moved_imports_file))
+
+    if file_format == 'python':
+        for move in _read_python_moves(path_to_moved_imports_file):
+            yield move
+        return
+
+    with io.open(path_to_moved_imports_file, mode='r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if file_format == 'tsv':
+                yield tuple(line.split('\t'))
+                continue
+            try:
+                move = json.loads(line)
+            except ValueError as exc:
+                raise ClickException('Invalid JSON on line {0} of {1}: {2}'
+                                     .format(line_number, path_to_moved_imports_file, exc))
+            yield tuple(move) if isinstance(move, list) else move
+
+
+def _detect_moves_file_format(path_to_moved_imports_file):
+    """
+    Detect the format of a file by its first line that is not empty or a comment.
+    """
+    with io.open(path_to_moved_imports_file, mode='r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('['):
+                return 'jsonl'
+            if '\t' in line and '=' not in line:
+                return 'tsv'
+            break
+    return 'python'
+
+
+def _read_python_moves(path_to_moved_imports_file):
+    with io.open(path_to_moved_imports_file, mode='rb') as file:
+        source = file.read()
+
+    # The files written by the analyze command are read without parsing them as python
+    text = source.decode('utf-8', 'replace')
+    if _WRITTEN_MOVES_FILE.match(text):
+        return _WRITTEN_MOVE.findall(text)
+
+    try:
+        tree = ast.parse(source, path_to_moved_imports_file)
+    except SyntaxError as exc:
+        raise ClickException('The file {0} is not valid python: {1}'
+                             .format(path_to_moved_imports_file, exc))
+
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and
+                                                target.id == 'imports_to_move'
+                                                for target in node.targets):
+            try:
+                moves = ast.literal_eval(node.value)
+            except (ValueError, TypeError, SyntaxError):
+                moves = None
+            if not isinstance(moves, (list, tuple)):
+                raise ClickException("The list 'imports_to_move' of the file {0} must be a "
+                                     "literal list, the file is not executed"
+                                     .format(path_to_moved_imports_file))
+            return moves
+    raise ClickException("The file {0} must have a list named 'imports_to_move'"
+                         .format(path_to_moved_imports_file))
+
+
+def _validate_moves(moves):
+    """
+    Check that every move is a pair of different dotted paths, raising a ClickException that
+    lists all invalid entries at once.
+    """
+    valid_moves = []
+    invalid_moves = []
+    for move in moves:
+        if _is_valid_move(move):
+            valid_moves.append(tuple(move))
+        else:
+            invalid_moves.append(repr(move))
+
+    if invalid_moves:
+        raise ClickException(INVALID_MOVES_MSG.format('\n -> '.join(invalid_moves)))
+    return valid_moves
+
+
+def _is_valid_move(move):
+    if not isinstance(move, (tuple, list)) or len(move) != 2:
+        return False
+    old_path, new_path = move
+    return _is_dotted_name(old_path) and _is_dotted_name(new_path) and old_path != new_path
+
+
+def _is_dotted_name(path):
+    if not isinstance(path, six.string_types):
+        return False
+    return all(_IDENTIFIER.match(part) for part in path.split('.'))
+
+
+def _compile_candidate_pattern(old_paths):
+    """
+    Build a single regex from the module part of every old path.
+
+    The paths are organized on a trie keyed by the dotted components, so paths sharing the same
+    package are factored together and a path that is prefix of another makes the longer one
+    redundant.
+    """
+    trie = {}
+    for old_path in old_paths:
+        parts = old_path.split('.')
+        if len(parts) > 1:
+            parts = parts[:-1]
+
+        node = trie
+        for part in parts:
+            if part in node and not node[part]:
+                break
+            node = node.setdefault(part, {})
+        else:
+            # An empty node marks the end of a path, anything below it is redundant
+            node.clear()
+
+    if not trie:
+        return None
+    pattern = WORD_START + _trie_to_pattern(trie)
+    return re.compile(pattern.encode('utf-8'))
+
+
+def _trie_to_pattern(node):
+    alternatives = []
+    for part in sorted(node):
+        child = node[part]
+        if child:
+            alternatives.append(re.escape(part) + _DOT_SEPARATOR + _trie_to_pattern(child))
+        else:
+            alternatives.append(re.escape(part) + WORD_END)
+    return '(?:' + '|'.join(alternatives) + ')'
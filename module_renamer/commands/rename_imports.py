@@ -1,99 +1,609 @@
-from concurrent import futures
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
 
+import click
 import pasta
 import six
-from click._unicodefun import click
 from pasta.augment import rename
+from pasta.base import scope
 from tqdm import tqdm
 
-from module_renamer.commands.utils import walk_on_py_files
+from module_renamer.commands import stats
+from module_renamer.commands.diff import OrderedDiffWriter, unified_diff
+from module_renamer.commands.import_index import ImportIndex
+from module_renamer.commands.journal import (FAILED, OBJECTS_DIR_SUFFIX, RenameJournal,
+                                             content_hash, digest_of_moves, record_pending,
+                                             rollback, save_original)
+from module_renamer.commands.move_plan import load_move_plan
+from module_renamer.commands.token_rename import rename_source_with_tokens
+from module_renamer.commands.utils import (STREAMING_CHUNK_SIZE, create_executor, decode_source,
+                                           encode_source, iter_chunks, iter_completed,
+                                           max_in_flight_for, walk_on_all_py_files,
+                                           write_file_atomically)
 
+SKIPPED = 'skipped'
+UNCHANGED = 'unchanged'
+MODIFIED = 'modified'
+# Already renamed by the previous run recorded on the journal
+RESUMED = 'resumed'
 
-def rename_modules(project_path, path_to_moved_imports_file):
-    for path in project_path:
-        execute_rename(path, path_to_moved_imports_file)
 
+def rename_modules(project_path, path_to_moved_imports_file, executor_type='process', jobs=None,
+                   discovery=None, error_log=None, journal_path=None, resume=False,
+                   dry_run=False, diff_output=None, index_path=None, server_address=None,
+                   shard=None):
+    """
+    :param bool dry_run: Write the unified diff of each file that would be modified on stdout
+        instead of renaming the files.
+    :param str diff_output: File where the diff is written instead of stdout, implies dry_run.
+    :param str index_path: Path of the reverse index of imports of the project, created if
+        needed, used to only visit the files that reference the moved imports.
+    :param str server_address: Address of the server started by `renamer serve`, which renames
+        the files instead of this process.
+    :param Shard shard: Only rename the files of this shard of the project.
+    """
+    with stats.phase('load move plan'):
+        move_plan = load_move_plan(path_to_moved_imports_file)
+
+    if server_address is not None:
+        rename_on_server(server_address, project_path, move_plan, dry_run, diff_output)
+        return
+
+    with _open_index(index_path) as index:
+        if diff_output is not None:
+            with open(diff_output, mode='wb') as diff_stream:
+                execute_rename(project_path, move_plan, executor_type, jobs, discovery,
+                               error_log, diff_stream=diff_stream, index=index, shard=shard)
+            return
+        if dry_run:
+            execute_rename(project_path, move_plan, executor_type, jobs, discovery, error_log,
+                           diff_stream=click.get_binary_stream('stdout'), index=index,
+                           shard=shard)
+            return
+
+        if journal_path is None:
+            execute_rename(project_path, move_plan, executor_type, jobs, discovery, error_log,
+                           index=index, shard=shard)
+            return
+
+        with RenameJournal(journal_path) as journal:
+            journal.start(digest_of_moves(move_plan.moves), resume)
+            execute_rename(project_path, move_plan, executor_type, jobs, discovery, error_log,
+                           journal, index=index, shard=shard)
+
+
+def rename_on_server(server_address, project_path, move_plan, dry_run=False, diff_output=None):
+    """
+    Ask the server started by `renamer serve` to rename the files of the project inside the
+    given paths, showing the results like `execute_rename`.
+    """
+    from module_renamer.commands.serve import send_request
+
+    if isinstance(project_path, six.string_types):
+        project_path = [project_path]
+    dry_run = dry_run or diff_output is not None
+    response = send_request(server_address, {
+        'command': 'rename',
+        'project_path': [os.path.abspath(folder) for folder in project_path],
+        'moves': move_plan.moves,
+        'dry_run': dry_run,
+        'cwd': os.getcwd(),
+    })
+
+    diff = response['diff'].encode('latin-1')
+    if diff_output is not None:
+        with open(diff_output, mode='wb') as diff_stream:
+            diff_stream.write(diff)
+    elif dry_run:
+        click.get_binary_stream('stdout').write(diff)
+
+    click.echo('{0} file(s) parsed, {1} file(s) skipped, {2} file(s) {3}'
+               .format(response['parsed'], response['skipped'], len(response['modified']),
+                       'would be modified' if dry_run else 'modified'),
+               err=dry_run)
+    if response['errors']:
+        list_of_exception = ExceptionList()
+        for file_name, message in response['errors']:
+            list_of_exception.append((message, file_name))
+        raise click.ClickException(list_of_exception.summary())
+
+
+@contextmanager
+def _open_index(index_path):
+    if index_path is None:
+        yield None
+        return
 
-def execute_rename(project_path, path_to_moved_imports_file):
+    with ImportIndex(index_path) as index:
+        yield index
+
+
+def rollback_rename(path_to_moved_imports_file, journal_path):
+    """
+    Restore the files modified by the run recorded on the journal, removing the journal when
+    every file is restored.
+
+    :param str path_to_moved_imports_file:
+        The list of changed imports used by the run, which must match the one on the journal.
+    :param str journal_path:
+        Path of the journal written by the run.
+    """
+    move_plan = load_move_plan(path_to_moved_imports_file)
+    if not os.path.isfile(journal_path):
+        raise click.ClickException('The journal {0} does not exist'.format(journal_path))
+
+    journal = RenameJournal(journal_path)
+    try:
+        if journal.plan_digest != digest_of_moves(move_plan.moves):
+            raise click.ClickException('The journal {0} was written with a different list of '
+                                       'imports to move'.format(journal_path))
+        restored_files, conflicts = rollback(journal)
+    except Exception:
+        journal.close()
+        raise
+
+    click.echo('{0} file(s) restored'.format(restored_files))
+    if conflicts:
+        journal.close()
+        raise click.ClickException(
+            'The following file(s) were changed after the rename and were not restored: \n' +
+            '\n'.join(conflicts))
+    journal.remove()
+
+
+def execute_rename(project_path, move_plan, executor_type='process', jobs=None, discovery=None,
+                   error_log=None, journal=None, diff_stream=None, index=None, shard=None):
     """
     Main loop that interacts over all python files from the project and delegate
     to an executor to parse each file
 
-    :param str project_path:
-        Path to the project that is going to be parsed.
+    The files are sent to the workers as soon as they are found, keeping a bounded number of
+    chunks in flight, so the memory used doesn't grow with the size of the project. When
+    several paths are given they share the same workers, and a file reachable from more than
+    one path is renamed only once.
 
-    :param str path_to_moved_imports_file:
-        Path of the file with the list of changed imports.
+    :param str|list(str) project_path:
+        Path (or paths) to the project that is going to be parsed.
+
+    :param MovePlan move_plan:
+        The list of changed imports, sent once to each worker.
+
+    :param str executor_type:
+        One of `constants.EXECUTOR_TYPES`.
+
+    :param int jobs:
+        Number of workers, defaults to the number of CPUs.
+
+    :param FileDiscovery discovery:
+        Settings used to find the python files of the project.
+
+    :param str error_log:
+        File where the exceptions are written when there are too many to keep in memory.
+
+    :param RenameJournal journal:
+        Where the result of each file is recorded, the files already renamed by the run
+        recorded on it are skipped.
+
+    :param file diff_stream:
+        Binary stream where the unified diff of each file that would be modified is written,
+        in the order the files are found, instead of writing the files. The summary is then
+        written on stderr.
+
+    :param ImportIndex index:
+        Reverse index of the imports of the project, updated before the rename and then used
+        to only visit the files that reference one of the moved imports.
+
+    :param Shard shard:
+        Only rename the files of this shard of the project, the other files are not counted.
     """
-    list_of_py_files = list(walk_on_py_files(project_path))
-    file_counter = len(list_of_py_files)
+    if isinstance(project_path, six.string_types):
+        project_path = [project_path]
+
+    journal_path = journal.path if journal is not None else None
+    executor = create_executor(executor_type, jobs, initializer=_init_worker,
+                               initargs=(move_plan, stats.is_enabled(), journal_path,
+                                         diff_stream is not None))
+    stats.set_value('workers', 1 if executor_type == 'serial'
+                    else jobs or multiprocessing.cpu_count())
+    with executor, stats.phase('executor'):
+        status_counter = Counter()
+        if index is not None:
+            with stats.phase('index'):
+                all_py_files, _ = index.update(project_path, executor, max_in_flight_for(jobs),
+                                               discovery)
+                if shard is not None:
+                    all_py_files = list(shard.select_files(project_path, all_py_files))
+                referencing_files = index.files_referencing(move_plan.index)
+            py_files = [file_path for file_path in all_py_files if file_path in referencing_files]
+            status_counter[SKIPPED] += len(all_py_files) - len(py_files)
+        else:
+            py_files = stats.timed_iter('walk', walk_on_all_py_files(project_path, discovery))
+            if shard is not None:
+                py_files = shard.select_files(project_path, py_files)
 
-    with futures.ThreadPoolExecutor(max_workers=30) as executor:
-        future_map = {
-            executor.submit(rename_file, py_file, path_to_moved_imports_file): py_file
-            for py_file in list_of_py_files
-        }
+        if journal is not None:
+            files = ((file_path, journal.completed_hash(file_path)) for file_path in py_files)
+        else:
+            files = ((file_path, None) for file_path in py_files)
+        chunks = iter_chunks(files, STREAMING_CHUNK_SIZE)
+        diff_writer = None
+        if diff_stream is not None:
+            diff_writer = OrderedDiffWriter(diff_stream)
+            chunks = diff_writer.track(chunks)
 
-        done_list = tqdm(futures.as_completed(future_map), total=file_counter, unit="files", leave=False)
-        list_of_exception = []
-        for future in done_list:
-            file_name = future_map[future]
+        progress_bar = tqdm(unit="files", leave=False)
+        list_of_exception = ExceptionList(error_log)
+        for chunk, future in iter_completed(executor, _rename_chunk, chunks,
+                                            max_in_flight_for(jobs)):
             try:
-                future.result()
+                chunk_results, chunk_stats = future.result()
             except Exception as exc:
-                list_of_exception.append((exc, file_name))
+                chunk_results = [(file_name, None, exc, None, None, None)
+                                 for file_name, _ in chunk]
+            else:
+                stats.merge(chunk_stats)
+
+            for file_name, status, exception, _, _, _ in chunk_results:
+                if exception is not None:
+                    list_of_exception.append((exception, file_name))
+                status_counter[status] += 1
+            if journal is not None:
+                journal.record([
+                    (file_name, status or FAILED, hash_before, hash_after,
+                     None if exception is None else str(exception))
+                    for file_name, status, exception, hash_before, hash_after, _ in chunk_results
+                    if status != RESUMED
+                ])
+            if diff_writer is not None:
+                diff_writer.add(chunk, [diff for _, _, _, _, _, diff in chunk_results])
+            progress_bar.update(len(chunk))
+        progress_bar.close()
+
+        file_counter = sum(status_counter.values()) - status_counter[RESUMED]
+        click.echo('{0} file(s) parsed, {1} file(s) skipped, {2} file(s) {3}'
+                   .format(file_counter - status_counter[SKIPPED], status_counter[SKIPPED],
+                           status_counter[MODIFIED],
+                           'would be modified' if diff_writer is not None else 'modified'),
+                   err=diff_writer is not None)
+        if status_counter[RESUMED]:
+            click.echo('{0} file(s) already renamed by the previous run'
+                       .format(status_counter[RESUMED]))
 
         if list_of_exception:
-            summary_of_exceptions = ['The following exception(s) has occurred while parsing the files: \n']
-            for exception, file_name in list_of_exception:
-                msg = 'File {0} generated an exception: {1}'.format(file_name, exception)
-                summary_of_exceptions.append(msg)
+            raise click.ClickException(list_of_exception.summary())
+
+
+class ExceptionList(object):
+    """
+    List of (exception, file name) tuples that keeps at most MAX_EXCEPTIONS_IN_MEMORY items.
+
+    Once this limit is reached, all exceptions are also written to a log file, which is only
+    created when needed.
+
+    :param str log_path:
+        Path of the log file, defaults to a new temporary file.
+    """
+
+    MAX_EXCEPTIONS_IN_MEMORY = 100
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.exceptions = []
+        self.number_of_exceptions = 0
+        self._log_file = None
+
+    def __len__(self):
+        return self.number_of_exceptions
+
+    def append(self, exception_and_file_name):
+        self.number_of_exceptions += 1
+        if len(self.exceptions) < self.MAX_EXCEPTIONS_IN_MEMORY:
+            self.exceptions.append(exception_and_file_name)
+            return
+
+        if self._log_file is None:
+            self._open_log_file()
+        self._log_file.write(self._format(*exception_and_file_name) + '\n')
+
+    def summary(self):
+        summary_of_exceptions = [
+            'The following exception(s) has occurred while parsing the files: \n']
+        for exception, file_name in self.exceptions:
+            summary_of_exceptions.append(self._format(exception, file_name))
+
+        if self._log_file is not None:
+            self._log_file.close()
+            summary_of_exceptions.append(
+                '... and {0} more exception(s), the complete list was written to {1}'
+                .format(self.number_of_exceptions - len(self.exceptions), self.log_path))
+        return '\n'.join(summary_of_exceptions)
+
+    def _open_log_file(self):
+        if self.log_path is None:
+            file_descriptor, self.log_path = tempfile.mkstemp(prefix='renamer-', suffix='.log')
+            self._log_file = io.open(file_descriptor, mode='w', encoding='utf-8')
+        else:
+            self._log_file = io.open(self.log_path, mode='w', encoding='utf-8')
+
+        for exception, file_name in self.exceptions:
+            self._log_file.write(self._format(exception, file_name) + '\n')
+
+    @staticmethod
+    def _format(exception, file_name):
+        return u'File {0} generated an exception: {1}'.format(file_name, exception)
+
+
+# The move plan of the current worker, whether it collects stats, the journal where the files
+# are recorded before being written (None without a journal) and whether it only makes the diff
+# of the files instead of writing them, set once by the executor initializer
+_worker_move_plan = None
+_worker_collects_stats = False
+_worker_journal_path = None
+_worker_dry_run = False
+
+
+def _init_worker(move_plan, collect_stats=False, journal_path=None, dry_run=False):
+    global _worker_move_plan, _worker_collects_stats, _worker_journal_path, _worker_dry_run
+    _worker_move_plan = move_plan
+    _worker_collects_stats = collect_stats
+    _worker_journal_path = journal_path
+    _worker_dry_run = dry_run
+
 
-            raise click.ClickException('\n'.join([str(x) for x in summary_of_exceptions]))
+def _rename_chunk(files):
+    """
+    Rename a list of files on a worker.
+
+    Exceptions are converted to messages here since not every exception can be sent back
+    from a worker process.
+
+    :param list(tuple(str,str)) files: The path of each file and its hash after being renamed
+        by the previous run recorded on the journal, or None.
+    :return: A list of tuples with the file path, its status, the error message, the hash of
+        the file before and after the rename (only with a journal) and its diff (only on dry
+        runs), and the stats collected while renaming the files (None if disabled).
+    :rtype: tuple(list(tuple(str,str,str,str,str,bytes)),dict)
+    """
+    results = []
+    with stats.collecting(_worker_collects_stats) as chunk_stats, stats.phase('worker'):
+        for file_path, completed_hash in files:
+            start = time.time()
+            try:
+                status, hash_before, hash_after, diff = _rename_file_on_worker(file_path,
+                                                                               completed_hash)
+            except Exception as exc:
+                results.append((file_path, None, str(exc), None, None, None))
+            else:
+                results.append((file_path, status, None, hash_before, hash_after, diff))
+            stats.add_file(file_path, time.time() - start)
+    return results, chunk_stats.as_dict() if chunk_stats is not None else None
+
+
+def _rename_source_chunk(sources, move_plan=None):
+    """
+    Rename a list of sources in memory, used by `Renamer.rename_sources`.
+
+    :param list(tuple(str,str)) sources: The path and the source code of each file.
+    :param MovePlan move_plan: Defaults to the move plan of the worker.
+    :return: The path, the new source code (None if unchanged) and the error message of each
+        file.
+    :rtype: list(tuple(str,str,str))
+    """
+    if move_plan is None:
+        move_plan = _worker_move_plan
+    results = []
+    for file_path, source_code in sources:
+        try:
+            new_source_code = rename_candidate_source(source_code, move_plan, file_path)
+        except Exception as exc:
+            results.append((file_path, None, str(exc)))
+        else:
+            results.append((file_path, None if new_source_code == source_code
+                            else new_source_code, None))
+    return results
+
+
+def _rename_file_on_worker(file_path, completed_hash):
+    raw_source = _read_file(file_path)
+    if _worker_dry_run:
+        status, diff = _diff_candidate_source(file_path, raw_source, _worker_move_plan)
+        return status, None, None, diff
+
+    if _worker_journal_path is None:
+        status, _ = _rename_candidate_source(file_path, raw_source, _worker_move_plan)
+        return status, None, None, None
+
+    hash_before = content_hash(raw_source)
+    if hash_before == completed_hash:
+        return RESUMED, hash_before, hash_before, None
 
+    status, new_raw_source = _rename_candidate_source(file_path, raw_source, _worker_move_plan,
+                                                      _worker_journal_path)
+    hash_after = content_hash(new_raw_source) if new_raw_source is not None else hash_before
+    return status, hash_before, hash_after, None
 
-def rename_file(file_path, path_to_moved_imports_file):
+
+def rename_candidate_file(file_path, move_plan):
+    """
+    Rename the imports of a file only if its raw content mentions any of the moved imports.
+
+    :param str file_path:
+        Path of the file being parsed.
+    :param MovePlan move_plan:
+        The list of changed imports.
+
+    :return: SKIPPED if the file was skipped by the textual filter, otherwise MODIFIED or
+        UNCHANGED depending on whether the file was written.
+    :rtype: str
+    """
+    status, _ = _rename_candidate_source(file_path, _read_file(file_path), move_plan)
+    return status
+
+
+def _rename_candidate_source(file_path, raw_source, move_plan, journal_path=None):
+    """
+    :return: The status of the file and its new content, None if it was not modified.
+    :rtype: tuple(str,bytes)
+    """
+    with stats.phase('filter'):
+        is_candidate = move_plan.might_affect(raw_source)
+    if not is_candidate:
+        return SKIPPED, None
+
+    new_raw_source = _rename_raw_source(file_path, raw_source, move_plan, journal_path)
+    return (MODIFIED if new_raw_source is not None else UNCHANGED), new_raw_source
+
+
+def _diff_candidate_source(file_path, raw_source, move_plan, relative_to=None):
+    """
+    Like `_rename_candidate_source`, but returns the unified diff of the file instead of
+    writing it, with its path relative to the given directory (see `diff.unified_diff`).
+
+    :return: The status of the file and its diff, None if it would not be modified.
+    :rtype: tuple(str,bytes)
+    """
+    with stats.phase('filter'):
+        is_candidate = move_plan.might_affect(raw_source)
+    if not is_candidate:
+        return SKIPPED, None
+
+    original_source_code, encoding, newline = decode_source(raw_source)
+    source_code = rename_source(original_source_code, move_plan, file_path)
+    if source_code == original_source_code:
+        return UNCHANGED, None
+
+    with stats.phase('diff'):
+        diff = unified_diff(file_path, original_source_code, source_code, encoding, newline,
+                            relative_to)
+    stats.count('bytes_written', len(diff))
+    return MODIFIED, diff
+
+
+def rename_file(file_path, move_plan):
     """
     Iterates over the content of a file, looking for imports to be changed
 
+    The file is only written when its content changes, keeping its encoding and line endings.
+
     :param str file_path:
         Path of the file being parsed.
-    :param str path_to_moved_imports_file:
-        Path of the file with the list of changed imports.
+    :param MovePlan move_plan:
+        The list of changed imports.
+
+    :return: True if the file was modified.
+    :rtype: bool
     """
-    list_with_moved_imports = _get_list_of_moved_imports(path_to_moved_imports_file)
+    return _rename_raw_source(file_path, _read_file(file_path), move_plan) is not None
 
-    with open(file_path, mode='r') as file:
-        tree = pasta.parse(file.read())
-        for old_path, new_path in list_with_moved_imports:
-            try:
-                rename.rename_external(tree, old_path, new_path)
-            except ValueError:
-                raise click.ClickException("An error has occurred on the following path: {0} ,\n "
-                                     "while trying to rename from: {1} to {2}"
-                                     .format(file_path, old_path, new_path))
-        source_code = pasta.dump(tree)
 
-    with open(file_path, mode='w') as file:
-        file.write(source_code)
+def _read_file(file_path):
+    with stats.phase('read'):
+        with open(file_path, mode='rb') as file:
+            raw_source = file.read()
+    stats.count('bytes_read', len(raw_source))
+    return raw_source
 
 
-def _get_list_of_moved_imports(path_to_moved_imports_file):
+def _rename_raw_source(file_path, raw_source, move_plan, journal_path=None):
     """
-    Return a list of moved imports from a given python file path
+    Write the renamed content of a file. With a journal, its original content is saved and the
+    file is recorded as pending first.
 
-    :param str path_to_moved_imports_file:
-        Path to the python file with a list of moved imports,
-        generated from analyze difference command or created manually.
+    :return: The new content of the file, None if it was not modified.
+    :rtype: bytes
+    """
+    original_source_code, encoding, newline = decode_source(raw_source)
+    source_code = rename_source(original_source_code, move_plan, file_path)
+    if source_code == original_source_code:
+        return None
+
+    with stats.phase('write'):
+        new_raw_source = encode_source(source_code, encoding, newline)
+        if journal_path is not None:
+            hash_before = save_original(journal_path + OBJECTS_DIR_SUFFIX, raw_source)
+            record_pending(journal_path, file_path, hash_before, content_hash(new_raw_source))
+        write_file_atomically(file_path, new_raw_source)
+    stats.count('bytes_written', len(new_raw_source))
+    return new_raw_source
+
+
+def rename_candidate_source(source_code, move_plan, file_path='<string>'):
+    """
+    Like `rename_source`, but returning the source code as it is when it doesn't mention any
+    of the moved imports.
+    """
+    with stats.phase('filter'):
+        is_candidate = move_plan.might_affect(source_code.encode('utf-8'))
+    if not is_candidate:
+        return source_code
+    return rename_source(source_code, move_plan, file_path)
+
+
+def rename_source(source_code, move_plan, file_path='<string>'):
+    """
+    Return the given source code with all moves from the plan applied.
+
+    The import statements are first rewritten directly on the tokens of the source, only
+    falling back to a full pasta round trip when the result wouldn't be the same.
+
+    :param str source_code:
+        Content of a python module.
+    :param MovePlan move_plan:
+        The list of changed imports.
+    :param str file_path:
+        Path used on the error messages.
+    :rtype: str
+    """
+    with stats.phase('tokens'):
+        renamed_source_code = rename_source_with_tokens(source_code, move_plan)
+    if renamed_source_code is not None:
+        return renamed_source_code
+
+    with stats.phase('pasta.parse'):
+        tree = pasta.parse(source_code)
+    rename_tree(tree, move_plan, file_path)
+    with stats.phase('pasta.dump'):
+        return pasta.dump(tree)
+
+
+def rename_tree(tree, move_plan, file_path='<string>'):
+    """
+    Apply all moves from the plan on a pasta tree, producing the same result as calling
+    `rename.rename_external` for each move in order.
+
+    The external references of the module are collected once and looked up on the plan index,
+    so `rename.rename_external` is only called for the moves that reference an imported name,
+    instead of for every move of the plan. This is not a single pass over the tree: each of
+    these calls analyzes the scope of the tree again, and so does this function after a move
+    changes the tree, since the change may introduce references used by a later move.
 
+    :return: True if any changes were made, False otherwise.
+    :rtype: bool
     """
-    if six.PY2:
-        import imp
-        import_from_user = imp.load_source('moved_imports', path_to_moved_imports_file)
-    else:
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("moved_imports", path_to_moved_imports_file)
-        import_from_user = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(import_from_user)
+    has_changed = False
+    position = 0
+    with stats.phase('scope.analyze'):
+        external_references = scope.analyze(tree).external_references
+    while True:
+        position = move_plan.next_position(external_references, position)
+        if position is None:
+            return has_changed
 
-    return import_from_user.imports_to_move
+        old_path, new_path = move_plan.moves[position]
+        try:
+            with stats.phase('rename_external'):
+                changed = rename.rename_external(tree, old_path, new_path)
+        except ValueError:
+            raise click.ClickException("An error has occurred on the following path: {0} ,\n "
+                                       "while trying to rename from: {1} to {2}"
+                                       .format(file_path, old_path, new_path))
+        if changed:
+            has_changed = True
+            with stats.phase('scope.analyze'):
+                external_references = scope.analyze(tree).external_references
+        position += 1
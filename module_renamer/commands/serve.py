@@ -0,0 +1,395 @@
+"""
+Long running server that keeps a project warm between renames: the list of python files and the
+names imported by each one are kept in memory and updated by polling the file system, so a
+rename only reads and renames the files that reference the moved imports, without paying for
+the startup of the command and the discovery of the files again.
+
+The requests are JSON objects sent over a local socket (a named pipe on Windows), see
+`send_request`.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from multiprocessing.connection import Client, Listener
+
+import click
+from git import Repo
+
+from module_renamer.commands.analyze_modifications import find_moved_imports
+from module_renamer.commands.import_index import iter_imported_names
+from module_renamer.commands.move_plan import MovePlan
+from module_renamer.commands.rename_imports import (MODIFIED, SKIPPED, _diff_candidate_source,
+                                                    _read_file, _rename_candidate_source)
+from module_renamer.commands.utils import walk_on_all_py_files
+
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Number of blobs whose imports are kept in memory for the analyze requests
+DEFAULT_MAX_CACHED_BLOBS = 500000
+
+
+class SourceCache(object):
+    """
+    Least recently used cache of the content of the files, bounded by the total size of the
+    contents.
+
+    :param int max_bytes: Maximum size of the contents kept.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size_in_bytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, file_path, stat_key):
+        """
+        :param tuple stat_key: The modification time and size of the file, as returned by
+            `_stat_key`.
+        :return: The content of the file, or None if it is not cached or changed since.
+        :rtype: bytes
+        """
+        entry = self._entries.pop(file_path, None)
+        if entry is None:
+            return None
+        if entry[0] != stat_key:
+            self.size_in_bytes -= len(entry[1])
+            return None
+        self._entries[file_path] = entry
+        return entry[1]
+
+    def set(self, file_path, stat_key, content):
+        self.discard(file_path)
+        if len(content) > self.max_bytes:
+            return
+        self._entries[file_path] = (stat_key, content)
+        self.size_in_bytes += len(content)
+        while self.size_in_bytes > self.max_bytes:
+            _, (_, evicted_content) = self._entries.popitem(last=False)
+            self.size_in_bytes -= len(evicted_content)
+
+    def discard(self, file_path):
+        entry = self._entries.pop(file_path, None)
+        if entry is not None:
+            self.size_in_bytes -= len(entry[1])
+
+
+class MemoryImportCache(object):
+    """
+    Least recently used cache of the imports found on each blob, with the same interface as
+    `ImportCache`, kept only in memory.
+
+    :param int max_entries: Maximum number of blobs kept.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_CACHED_BLOBS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, blob_id):
+        imports = self._entries.pop(blob_id, None)
+        if imports is not None:
+            self._entries[blob_id] = imports
+        return imports
+
+    def set(self, blob_id, imports):
+        self._entries.pop(blob_id, None)
+        self._entries[blob_id] = [tuple(imp) for imp in imports]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RenameServer(object):
+    """
+    The state kept by `renamer serve` and the handling of each request.
+
+    :param list(str) project_path: The directories of the project.
+    :param FileDiscovery discovery: Settings used to find the python files of the project.
+    :param int max_cache_bytes: Maximum size of the file contents kept in memory.
+    """
+
+    def __init__(self, project_path, discovery=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.project_path = [os.path.realpath(folder) for folder in project_path]
+        self.discovery = discovery
+        self.sources = SourceCache(max_cache_bytes)
+        self.import_cache = MemoryImportCache()
+        # The path of each python file, in the order they are found
+        self.file_paths = []
+        # Maps each file to its stat key and the names it imports (None if it can't be parsed)
+        self._files = {}
+        # Maps each imported name to the files that import it, and each dotted prefix of an
+        # imported name to the files that import it or a name inside it
+        self._importers = defaultdict(set)
+        self._importers_inside = defaultdict(set)
+        self._unparsable_files = set()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Update the list of files and the imported names of the files changed since the last
+        refresh.
+        """
+        file_paths = []
+        removed_files = set(self._files)
+        for file_path in walk_on_all_py_files(self.project_path, self.discovery):
+            file_paths.append(file_path)
+            removed_files.discard(file_path)
+            try:
+                stat_key = _stat_key(file_path)
+            except OSError:
+                continue
+            if file_path not in self._files or self._files[file_path][0] != stat_key:
+                self._update_file(file_path, stat_key)
+
+        for file_path in removed_files:
+            self._remove_file(file_path)
+        self.file_paths = file_paths
+
+    def files_referencing(self, dotted_paths):
+        """
+        The files that may be affected by moving any of the given dotted paths, like
+        `ImportIndex.files_referencing`.
+
+        :rtype: set(str)
+        """
+        file_paths = set(self._unparsable_files)
+        for dotted_path in dotted_paths:
+            parts = dotted_path.split('.')
+            for i in range(1, len(parts)):
+                file_paths.update(self._importers.get('.'.join(parts[:i]), ()))
+            file_paths.update(self._importers_inside.get(dotted_path, ()))
+        return file_paths
+
+    def handle(self, request):
+        """
+        Answer a request, errors are reported on the 'error' key of the response.
+
+        :param dict request: The 'command' and its arguments.
+        :rtype: dict
+        """
+        if not isinstance(request, dict):
+            return {'error': 'The request must be a JSON object'}
+        try:
+            command = request['command']
+            if command == 'rename':
+                return self.rename(request.get('project_path') or self.project_path,
+                                   request['moves'], request.get('dry_run', False),
+                                   request.get('cwd'))
+            if command == 'analyze':
+                return self.analyze(request['project_path'], request['compare_with'],
+                                    request.get('branch'), request.get('incremental', False),
+                                    request.get('jobs'))
+            if command == 'refresh':
+                self.refresh()
+                return {'files': len(self.file_paths)}
+            if command == 'stop':
+                return {}
+            raise click.ClickException('Unknown command: {0}'.format(command))
+        except click.ClickException as exc:
+            return {'error': exc.format_message()}
+        except Exception as exc:
+            return {'error': '{0}: {1}'.format(type(exc).__name__, exc)}
+
+    def rename(self, project_path, moves, dry_run=False, cwd=None):
+        """
+        Rename the files of the project inside the given directories.
+
+        The paths on the diff are relative to the current directory of the client, given by
+        `cwd`, so it can be applied from there, defaults to the one of the server.
+
+        :return: The number of files 'parsed' and 'skipped', the list of 'modified' files, the
+            (file, message) 'errors' and the 'diff' of the files on dry runs, decoded as
+            latin-1 since each file keeps its own encoding.
+        :rtype: dict
+        """
+        move_plan = MovePlan([tuple(move) for move in moves])
+        roots = [os.path.join(os.path.realpath(folder), '') for folder in project_path]
+        file_paths = [file_path for file_path in self.file_paths
+                      if any(file_path.startswith(root) for root in roots)]
+        referencing_files = self.files_referencing(move_plan.index)
+
+        response = {'parsed': 0, 'skipped': 0, 'modified': [], 'errors': [], 'diff': ''}
+        diffs = []
+        for file_path in file_paths:
+            if file_path not in referencing_files:
+                response['skipped'] += 1
+                continue
+            try:
+                raw_source = self._read_file(file_path)
+                if dry_run:
+                    status, diff = _diff_candidate_source(file_path, raw_source, move_plan,
+                                                          cwd)
+                    if diff is not None:
+                        diffs.append(diff)
+                else:
+                    status, new_raw_source = _rename_candidate_source(file_path, raw_source,
+                                                                      move_plan)
+                    if new_raw_source is not None:
+                        self._update_file(file_path, _stat_key(file_path), new_raw_source)
+            except Exception as exc:
+                response['parsed'] += 1
+                response['errors'].append((file_path, str(exc)))
+                continue
+
+            if status == SKIPPED:
+                response['skipped'] += 1
+                continue
+            response['parsed'] += 1
+            if status == MODIFIED:
+                response['modified'].append(file_path)
+        response['diff'] = b''.join(diffs).decode('latin-1')
+        return response
+
+    def analyze(self, project_path, compare_with, branch, incremental=False, jobs=None):
+        """
+        :return: The 'moved_imports' between the branches, the conflicts are checked by the
+            client.
+        :rtype: dict
+        """
+        moved_imports = find_moved_imports(Repo(project_path), compare_with, branch, incremental,
+                                           self.import_cache, jobs, self.discovery)
+        return {'moved_imports': moved_imports}
+
+    def _read_file(self, file_path):
+        stat_key = _stat_key(file_path)
+        raw_source = self.sources.get(file_path, stat_key)
+        if raw_source is None:
+            raw_source = self._update_file(file_path, stat_key)
+        return raw_source
+
+    def _update_file(self, file_path, stat_key, raw_source=None):
+        if raw_source is None:
+            raw_source = _read_file(file_path)
+        self._remove_file(file_path)
+        self.sources.set(file_path, stat_key, raw_source)
+        try:
+            names = frozenset(iter_imported_names(raw_source, file_path))
+        except (SyntaxError, ValueError):
+            names = None
+            self._unparsable_files.add(file_path)
+        else:
+            for name in names:
+                self._importers[name].add(file_path)
+                parts = name.split('.')
+                for i in range(1, len(parts) + 1):
+                    self._importers_inside['.'.join(parts[:i])].add(file_path)
+        self._files[file_path] = (stat_key, names)
+        return raw_source
+
+    def _remove_file(self, file_path):
+        if file_path not in self._files:
+            return
+        _, names = self._files.pop(file_path)
+        self.sources.discard(file_path)
+        self._unparsable_files.discard(file_path)
+        for name in names or ():
+            _discard_from(self._importers, name, file_path)
+            parts = name.split('.')
+            for i in range(1, len(parts) + 1):
+                _discard_from(self._importers_inside, '.'.join(parts[:i]), file_path)
+
+
+def _discard_from(files_by_name, name, file_path):
+    file_paths = files_by_name.get(name)
+    if file_paths is not None:
+        file_paths.discard(file_path)
+        if not file_paths:
+            del files_by_name[name]
+
+
+def _stat_key(file_path):
+    file_stat = os.stat(file_path)
+    return file_stat.st_mtime, file_stat.st_size
+
+
+def run_server(project_path, address, discovery=None, poll_interval=1.0,
+               max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """
+    Answer the requests sent to the address until a 'stop' request is received.
+
+    The file system is polled for changes every poll_interval seconds, a 'refresh' request can
+    be sent to see the changes made since the last poll right away.
+
+    :param list(str) project_path: The directories of the project.
+    :param str address: Path of the socket, or the name of a pipe on Windows.
+    """
+    if os.path.exists(address):
+        try:
+            Client(address).close()
+        except (IOError, OSError):
+            # Left by a server that didn't stop cleanly
+            os.remove(address)
+        else:
+            raise click.ClickException('A server is already listening on {0}'.format(address))
+
+    click.echo('Reading the files of {0}'.format(', '.join(project_path)))
+    server = RenameServer(project_path, discovery, max_cache_bytes)
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def poll():
+        while not stopped.wait(poll_interval):
+            with lock:
+                server.refresh()
+
+    poller = threading.Thread(target=poll, name='renamer-poll')
+    poller.daemon = True
+
+    # Only the current user may connect to the socket
+    previous_umask = os.umask(0o077)
+    try:
+        listener = Listener(address)
+    finally:
+        os.umask(previous_umask)
+
+    poller.start()
+    click.echo('{0} file(s) found, listening on {1}'.format(len(server.file_paths), address))
+    try:
+        while not stopped.is_set():
+            connection = listener.accept()
+            try:
+                request = json.loads(connection.recv_bytes().decode('utf-8'))
+                start = time.time()
+                with lock:
+                    response = server.handle(request)
+                connection.send_bytes(json.dumps(response).encode('utf-8'))
+            except (EOFError, IOError, OSError, ValueError):
+                continue
+            finally:
+                connection.close()
+            command = request.get('command') if isinstance(request, dict) else None
+            click.echo('{0} answered in {1:.3f}s'.format(command, time.time() - start))
+            if command == 'stop':
+                stopped.set()
+    finally:
+        stopped.set()
+        listener.close()
+
+
+def send_request(address, request):
+    """
+    Send a request to the server started by `renamer serve`.
+
+    :param str address: The address given to the server.
+    :param dict request: The 'command' and its arguments, see `RenameServer.handle`.
+    :return: The response of the server.
+    :rtype: dict
+    """
+    try:
+        connection = Client(address)
+    except (IOError, OSError):
+        raise click.ClickException('No server is listening on {0}, start one with '
+                                   '"renamer serve"'.format(address))
+    try:
+        connection.send_bytes(json.dumps(request).encode('utf-8'))
+        response = json.loads(connection.recv_bytes().decode('utf-8'))
+    finally:
+        connection.close()
+
+    if 'error' in response:
+        raise click.ClickException(response['error'])
+    return response
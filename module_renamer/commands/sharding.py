@@ -0,0 +1,95 @@
+import hashlib
+import heapq
+import os
+
+import click
+
+
+class Shard(object):
+    """
+    One of the slices of the files of a project, so several machines can process a project
+    together, each one with a different index and the same count.
+
+    The slice of each file only depends on its path relative to the project, so every machine
+    computes the same partition. When balanced, the files are assigned to the slices by size
+    instead (the biggest files first, each one to the smallest slice so far), which requires
+    every machine to see the same files with the same sizes.
+
+    :param int index: The slice processed, from 1 to count.
+    :param int count: The number of slices.
+    :param bool balanced: Balance the total size of the files of each slice.
+    """
+
+    def __init__(self, index, count, balanced=False):
+        if not 1 <= index <= count:
+            raise ValueError('The index of the shard must be between 1 and {0}'.format(count))
+        self.index = index
+        self.count = count
+        self.balanced = balanced
+
+    def __str__(self):
+        return '{0}/{1}'.format(self.index, self.count)
+
+    @classmethod
+    def parse(cls, value, balanced=False):
+        """
+        :param str value: 'INDEX/COUNT', like '2/4'.
+        :rtype: Shard
+        """
+        try:
+            index, count = [int(part) for part in value.split('/')]
+            return cls(index, count, balanced)
+        except ValueError:
+            raise click.BadParameter('must be INDEX/COUNT, with INDEX from 1 to COUNT, '
+                                     'not {0}'.format(value), param_hint='--shard')
+
+    def select(self, items, key, size=None):
+        """
+        The items that belong to this shard, in the same order.
+
+        :param iterable items: All the items of the project.
+        :param callable key: Returns the path of an item relative to the project.
+        :param callable size: Returns the size of an item, only used when balanced.
+        :rtype: iterator
+        """
+        if not self.balanced:
+            return (item for item in items if stable_hash(key(item)) % self.count ==
+                    self.index - 1)
+
+        items = list(items)
+        sizes = [(-size(item), key(item), position) for position, item in enumerate(items)]
+        shard_sizes = [(0, shard_index) for shard_index in range(self.count)]
+        selected_positions = set()
+        for negative_size, _, position in sorted(sizes):
+            shard_size, shard_index = heapq.heappop(shard_sizes)
+            if shard_index == self.index - 1:
+                selected_positions.add(position)
+            heapq.heappush(shard_sizes, (shard_size - negative_size, shard_index))
+        return (item for position, item in enumerate(items) if position in selected_positions)
+
+    def select_files(self, project_path, file_paths):
+        """
+        The files of a project that belong to this shard, see `select`.
+
+        :param list(str) project_path: The directories of the project.
+        :param iterable(str) file_paths: The absolute paths of the files found on them.
+        :rtype: iterator(str)
+        """
+        roots = [os.path.join(os.path.realpath(folder), '') for folder in project_path]
+
+        def relative_path(file_path):
+            for root in roots:
+                if file_path.startswith(root):
+                    return file_path[len(root):].replace(os.sep, '/')
+            return file_path.replace(os.sep, '/')
+
+        return self.select(file_paths, relative_path, os.path.getsize)
+
+
+def stable_hash(text):
+    """
+    A hash of the text that is the same on every machine and version of python.
+
+    :rtype: int
+    """
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
@@ -0,0 +1,235 @@
+"""
+Optional instrumentation of the commands: time and number of calls of each phase, slowest files,
+bytes read and written, and how busy the workers were.
+
+The stats are collected per thread and only when enabled, so the instrumented code only pays for
+a function call otherwise. Each task sent to a worker collects its own stats, which are sent back
+with the result of the task and merged on the main process.
+"""
+import heapq
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import click
+
+# Number of files listed on the summary as the slowest ones
+SLOWEST_FILES = 10
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+_local = threading.local()
+
+
+class Stats(object):
+    """
+    Stats collected while running a command, or a part of it.
+
+    :ivar dict(str,list) phases: Maps the name of each phase to [seconds, calls].
+    :ivar Counter counters: Amounts like 'bytes_read' and 'bytes_written'.
+    :ivar list(tuple(float,str)) slowest_files: The seconds spent on each of the slowest files.
+    :ivar dict values: Facts about the run, like the number of 'workers'.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = Counter()
+        self.slowest_files = []
+        self.values = {}
+
+    def add_phase(self, name, seconds, calls=1):
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += calls
+
+    def add_file(self, file_path, seconds):
+        if len(self.slowest_files) < SLOWEST_FILES:
+            heapq.heappush(self.slowest_files, (seconds, file_path))
+        else:
+            heapq.heappushpop(self.slowest_files, (seconds, file_path))
+
+    def update(self, stats_dict):
+        """
+        Add the stats of a task, as returned by `as_dict`.
+        """
+        for name, phase in stats_dict['phases'].items():
+            self.add_phase(name, phase['seconds'], phase['calls'])
+        self.counters.update(stats_dict['counters'])
+        for file_stats in stats_dict['slowest_files']:
+            self.add_file(file_stats['path'], file_stats['seconds'])
+        self.values.update(stats_dict['values'])
+
+    def as_dict(self):
+        worker_seconds = self.phases.get('worker', [0.0])[0]
+        executor_seconds = self.phases.get('executor', [0.0])[0]
+        workers = self.values.get('workers')
+        utilization = None
+        if workers and executor_seconds:
+            utilization = worker_seconds / (workers * executor_seconds)
+
+        return {
+            'phases': {
+                name: {'seconds': seconds, 'calls': calls}
+                for name, (seconds, calls) in self.phases.items()
+            },
+            'counters': dict(self.counters),
+            'slowest_files': [
+                {'path': file_path, 'seconds': seconds}
+                for seconds, file_path in sorted(self.slowest_files, reverse=True)
+            ],
+            'values': dict(self.values),
+            'worker_utilization': utilization,
+        }
+
+    def summary(self):
+        stats_dict = self.as_dict()
+        lines = ['{0:<24} {1:>8} {2:>10}'.format('Phase', 'Calls', 'Seconds')]
+        for name, phase in sorted(stats_dict['phases'].items(),
+                                  key=lambda item: -item[1]['seconds']):
+            lines.append('{0:<24} {1:>8} {2:>10.3f}'
+                         .format(name, phase['calls'], phase['seconds']))
+
+        lines.append('')
+        lines.append('Bytes read: {0}, bytes written: {1}'.format(
+            self.counters['bytes_read'], self.counters['bytes_written']))
+        if stats_dict['worker_utilization'] is not None:
+            lines.append('Worker utilization: {0:.0%} of {1} worker(s)'.format(
+                stats_dict['worker_utilization'], self.values['workers']))
+
+        if stats_dict['slowest_files']:
+            lines.append('Slowest files:')
+            for file_stats in stats_dict['slowest_files']:
+                lines.append('  {0:>8.3f}s {1}'.format(file_stats['seconds'],
+                                                       file_stats['path']))
+        return '\n'.join(lines)
+
+
+def current():
+    """
+    The stats being collected by the current thread, None when disabled.
+
+    :rtype: Stats
+    """
+    return getattr(_local, 'stats', None)
+
+
+def is_enabled():
+    return current() is not None
+
+
+@contextmanager
+def collecting(enabled=True):
+    """
+    Collect the stats of the current thread on a new Stats object, which is yielded.
+
+    Nothing is collected when not enabled, yielding None.
+    """
+    if not enabled:
+        yield None
+        return
+
+    previous_stats = current()
+    _local.stats = Stats()
+    try:
+        yield _local.stats
+    finally:
+        _local.stats = previous_stats
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the time spent on the block to the given phase.
+    """
+    stats = current()
+    if stats is None:
+        yield
+        return
+
+    start = _timer()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, _timer() - start)
+
+
+def count(name, amount=1):
+    stats = current()
+    if stats is not None:
+        stats.counters[name] += amount
+
+
+def set_value(name, value):
+    stats = current()
+    if stats is not None:
+        stats.values[name] = value
+
+
+def add_file(file_path, seconds):
+    stats = current()
+    if stats is not None:
+        stats.add_file(file_path, seconds)
+
+
+def merge(stats_dict):
+    """
+    Merge the stats sent back by a worker, which are None when disabled.
+    """
+    stats = current()
+    if stats is not None and stats_dict is not None:
+        stats.update(stats_dict)
+
+
+def timed_iter(name, iterable):
+    """
+    Add the time spent producing each item of a lazy iterable to the given phase.
+    """
+    if not is_enabled():
+        return iter(iterable)
+    return _timed_iter(name, iter(iterable))
+
+
+def _timed_iter(name, iterator):
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextmanager
+def record(show_summary=False, json_path=None, profile_path=None):
+    """
+    Collect the stats of the command run inside the block, used by the command line.
+
+    :param bool show_summary: Echo a summary of the stats on stderr.
+    :param str json_path: File where all the stats are written as JSON.
+    :param str profile_path: File where the cProfile stats of the current process are dumped,
+        which can be read with `pstats`. The work done by worker processes is not included.
+    """
+    profiler = None
+    if profile_path is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    with collecting(show_summary or json_path is not None) as stats:
+        start = _timer()
+        try:
+            yield stats
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+
+            if stats is not None:
+                stats.add_phase('total', _timer() - start)
+                if show_summary:
+                    click.echo(stats.summary(), err=True)
+                if json_path is not None:
+                    with open(json_path, 'w') as file:
+                        json.dump(stats.as_dict(), file, indent=2, sort_keys=True)
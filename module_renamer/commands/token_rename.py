@@ -0,0 +1,385 @@
+"""
+Rename the imports of a module by replacing the tokens of its import statements in place.
+
+Most affected files only need an import line rewritten, so a full pasta round trip of the whole
+module is wasted work for them. This module replays on a light model of the import statements
+the same sequence of `rename.rename_external` calls done by `rename_imports.rename_tree`, and
+only returns a result when it is sure that pasta would produce exactly the same source.
+Everything else (split imports, relative imports, reads that would be renamed, ...) is left to
+the pasta path.
+"""
+import ast
+import re
+import tokenize
+from collections import Counter
+
+import six
+
+# Tokens that may precede the `from` keyword of an import statement
+_STATEMENT_SEPARATORS = (';', ':')
+
+
+class _UnsupportedSource(Exception):
+    """
+    Raised when the result of pasta can't be reproduced by replacing tokens.
+    """
+
+
+class _ImportedName(object):
+    """
+    A dotted name found on an import statement and the span of its tokens on the source.
+    """
+
+    def __init__(self, name, start, end, is_compact):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.is_compact = is_compact
+        self.is_modified = False
+
+    def rename(self, new_name):
+        self.name = new_name
+        self.is_modified = True
+
+
+class _ImportStatement(object):
+    """
+    Mirror of an `ast.Import` or `ast.ImportFrom` node, keeping the position of its tokens.
+
+    :ivar _ImportedName module: The module of an ImportFrom, None otherwise or when relative
+        without module (`from . import a`).
+    :ivar list(tuple(_ImportedName,str)) aliases: The imported names and their `as` names.
+    """
+
+    def __init__(self, is_from, start):
+        self.is_from = is_from
+        self.start = start
+        self.end = start
+        self.level = 0
+        self.module = None
+        self.aliases = []
+
+    def describe(self):
+        """
+        :return: The same description returned by `_describe_node` for the equivalent node.
+        """
+        module = self.module.name if self.module is not None else None
+        names = tuple((alias.name, asname) for alias, asname in self.aliases)
+        return self.is_from, self.level, module, names
+
+
+def rename_source_with_tokens(source_code, move_plan):
+    """
+    Return the given source code with all moves from the plan applied, or None if the rename
+    can't be done without pasta.
+
+    :param str source_code:
+        Content of a python module.
+    :param MovePlan move_plan:
+        The list of changed imports.
+    :rtype: str|None
+    """
+    try:
+        tree = ast.parse(source_code)
+        statements = _find_import_statements(source_code)
+        # The descriptions have None on them, which can't be sorted with strings on python 3
+        if Counter(_describe_node(node) for node in _iter_import_nodes(tree)) != Counter(
+                statement.describe() for statement in statements):
+            return None
+
+        renamed_names = set()
+        position = 0
+        external_references = _external_references(statements)
+        while True:
+            position = move_plan.next_position(external_references, position)
+            if position is None:
+                break
+
+            old_path, new_path = move_plan.moves[position]
+            if _rename_external(external_references, old_path, new_path, renamed_names):
+                external_references = _external_references(statements)
+            position += 1
+
+        return _replace_tokens(source_code, statements, renamed_names)
+    except (SyntaxError, tokenize.TokenError, _UnsupportedSource):
+        return None
+
+
+def _iter_import_nodes(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            yield node
+
+
+def _describe_node(node):
+    names = tuple((alias.name, alias.asname) for alias in node.names)
+    if isinstance(node, ast.ImportFrom):
+        return True, node.level or 0, node.module, names
+    return False, 0, None, names
+
+
+def _find_import_statements(source_code):
+    """
+    Find the import statements of a module on its tokens, in the order pasta visits them.
+
+    :rtype: list(_ImportStatement)
+    """
+    line_offsets = [0]
+    for line in six.StringIO(source_code):
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def _offset(position):
+        row, column = position
+        return line_offsets[row - 1] + column
+
+    tokens = [
+        (token[0], token[1], _offset(token[2]), _offset(token[3]))
+        for token in tokenize.generate_tokens(six.StringIO(source_code).readline)
+        if token[0] not in (tokenize.COMMENT, tokenize.NL)
+    ]
+
+    statements = []
+    index = 0
+    while index < len(tokens):
+        token_type, token_string = tokens[index][:2]
+        if token_type == tokenize.NAME and token_string == 'import':
+            index = _parse_import(tokens, index, statements)
+        elif (token_type == tokenize.NAME and token_string == 'from' and
+              _is_statement_start(tokens, index)):
+            index = _parse_import_from(tokens, index, statements)
+        else:
+            index += 1
+    return statements
+
+
+def _is_statement_start(tokens, index):
+    """
+    Tell the `from` of an import statement from the ones of `yield from` and `raise ... from`.
+    """
+    if index == 0:
+        return True
+    token_type, token_string = tokens[index - 1][:2]
+    if token_type == tokenize.OP:
+        return token_string in _STATEMENT_SEPARATORS
+    return token_type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+                          getattr(tokenize, 'ENCODING', None))
+
+
+def _parse_import(tokens, index, statements):
+    statement = _ImportStatement(is_from=False, start=tokens[index][2])
+    index += 1
+    while True:
+        dotted_name, index = _parse_dotted_name(tokens, index)
+        asname, index = _parse_asname(tokens, index)
+        statement.aliases.append((dotted_name, asname))
+        statement.end = tokens[index - 1][3]
+        if not _is_op(tokens, index, ','):
+            break
+        index += 1
+
+    statements.append(statement)
+    return index
+
+
+def _parse_import_from(tokens, index, statements):
+    statement = _ImportStatement(is_from=True, start=tokens[index][2])
+    index += 1
+    # Python 3 has a single token for '...'
+    while _is_op(tokens, index, '.') or _is_op(tokens, index, '...'):
+        statement.level += len(tokens[index][1])
+        index += 1
+    if not _is_name(tokens, index, 'import'):
+        statement.module, index = _parse_dotted_name(tokens, index)
+    if not _is_name(tokens, index, 'import'):
+        raise _UnsupportedSource()
+    index += 1
+
+    if _is_op(tokens, index, '*'):
+        statement.aliases.append((_ImportedName('*', tokens[index][2], tokens[index][3], True),
+                                  None))
+        index += 1
+    else:
+        in_parentheses = _is_op(tokens, index, '(')
+        if in_parentheses:
+            index += 1
+        while True:
+            if not _is_name(tokens, index):
+                raise _UnsupportedSource()
+            name = _ImportedName(tokens[index][1], tokens[index][2], tokens[index][3], True)
+            asname, index = _parse_asname(tokens, index + 1)
+            statement.aliases.append((name, asname))
+            if not _is_op(tokens, index, ','):
+                break
+            index += 1
+            if in_parentheses and _is_op(tokens, index, ')'):
+                break
+        if in_parentheses:
+            if not _is_op(tokens, index, ')'):
+                raise _UnsupportedSource()
+            index += 1
+
+    statement.end = tokens[index - 1][3]
+    statements.append(statement)
+    return index
+
+
+def _parse_dotted_name(tokens, index):
+    if not _is_name(tokens, index):
+        raise _UnsupportedSource()
+    parts = [tokens[index][1]]
+    start, end = tokens[index][2:]
+    is_compact = True
+    index += 1
+    while _is_op(tokens, index, '.') and _is_name(tokens, index + 1):
+        is_compact = is_compact and tokens[index][2] == end and tokens[index + 1][2] == end + 1
+        parts.append(tokens[index + 1][1])
+        end = tokens[index + 1][3]
+        index += 2
+    return _ImportedName('.'.join(parts), start, end, is_compact), index
+
+
+def _parse_asname(tokens, index):
+    if not _is_name(tokens, index, 'as'):
+        return None, index
+    if not _is_name(tokens, index + 1):
+        raise _UnsupportedSource()
+    return tokens[index + 1][1], index + 2
+
+
+def _is_op(tokens, index, string):
+    return index < len(tokens) and tokens[index][0] == tokenize.OP and tokens[index][1] == string
+
+
+def _is_name(tokens, index, string=None):
+    return (index < len(tokens) and tokens[index][0] == tokenize.NAME and
+            (string is None or tokens[index][1] == string))
+
+
+def _external_references(statements):
+    """
+    Same as `scope.analyze(tree).external_references`, mapping each dotted path to a list of
+    (statement, alias) tuples, where alias is None for the module of an ImportFrom.
+    """
+    references = {}
+    for statement in statements:
+        if statement.is_from:
+            if statement.module is None:
+                continue
+            module_parts = statement.module.name.split('.')
+            for i in range(1, len(module_parts) + 1):
+                references.setdefault('.'.join(module_parts[:i]), []).append((statement, None))
+            for alias, _ in statement.aliases:
+                references.setdefault(statement.module.name + '.' + alias.name, []).append(
+                    (statement, alias))
+        else:
+            for alias, _ in statement.aliases:
+                name_parts = alias.name.split('.')
+                for i in range(1, len(name_parts) + 1):
+                    references.setdefault('.'.join(name_parts[:i]), []).append(
+                        (statement, alias))
+    return references
+
+
+def _rename_external(external_references, old_name, new_name, renamed_names):
+    """
+    Mirror of `rename.rename_external`.
+
+    The reads renamed by pasta are not changed here, their first component is added to
+    renamed_names instead, so `_replace_tokens` can check that the module has none of them.
+
+    :return: True if any changes were made, False otherwise.
+    """
+    if old_name not in external_references:
+        return False
+
+    has_changed = False
+    renames = {}
+    already_changed = []
+    for statement, alias in external_references[old_name]:
+        if statement.is_from and statement not in already_changed:
+            _rename_name_in_import_from(statement, old_name, new_name)
+            renames[old_name.rsplit('.', 1)[-1]] = new_name.rsplit('.', 1)[-1]
+            already_changed.append(statement)
+            has_changed = True
+        elif alias is not None:
+            if statement.is_from:
+                raise _UnsupportedSource()
+            alias.rename(new_name + alias.name[len(old_name):])
+            if not _asname_of(statement, alias):
+                renames[old_name] = new_name
+            has_changed = True
+
+    for rename_old, rename_new in six.iteritems(renames):
+        if rename_old != rename_new:
+            renamed_names.add(rename_old.split('.')[0])
+    return has_changed
+
+
+def _rename_name_in_import_from(statement, old_name, new_name):
+    """
+    Mirror of `rename._rename_name_in_importfrom`, for the cases that don't split the import.
+    """
+    if statement.level:
+        raise _UnsupportedSource()
+
+    module_parts = statement.module.name.split('.')
+    old_parts = old_name.split('.')
+    new_parts = new_name.split('.')
+
+    if module_parts[:len(old_parts)] == old_parts:
+        statement.module.rename('.'.join(new_parts + module_parts[len(old_parts):]))
+        return
+
+    aliases_to_change = [alias for alias, _ in statement.aliases if alias.name == old_parts[-1]]
+    if len(aliases_to_change) != 1:
+        raise _UnsupportedSource()
+    aliases_to_change[0].rename(new_parts[-1])
+
+    if module_parts != new_parts[:-1]:
+        if len(statement.aliases) > 1 or len(new_parts) == 1:
+            raise _UnsupportedSource()
+        statement.module.rename('.'.join(new_parts[:-1]))
+
+
+def _asname_of(statement, alias):
+    for imported_name, asname in statement.aliases:
+        if imported_name is alias:
+            return asname
+
+
+def _replace_tokens(source_code, statements, renamed_names):
+    """
+    Write the modified names of the import statements on the source.
+
+    pasta renames the reads of some imported names, so the rename is only safe when none of
+    these names is found outside of the import statements.
+    """
+    if renamed_names:
+        source_outside_imports = []
+        end_of_last_statement = 0
+        for statement in statements:
+            source_outside_imports.append(source_code[end_of_last_statement:statement.start])
+            end_of_last_statement = statement.end
+        source_outside_imports.append(source_code[end_of_last_statement:])
+
+        pattern = re.compile(r'(?<!\w)(?:{0})(?!\w)'.format(
+            '|'.join(re.escape(name) for name in sorted(renamed_names))), re.UNICODE)
+        if pattern.search('\n'.join(source_outside_imports)):
+            raise _UnsupportedSource()
+
+    modified_names = [
+        imported_name
+        for statement in statements
+        for imported_name in [statement.module] + [alias for alias, _ in statement.aliases]
+        if imported_name is not None and imported_name.is_modified
+    ]
+    result = []
+    end_of_last_name = 0
+    for imported_name in sorted(modified_names, key=lambda name: name.start):
+        if not imported_name.is_compact:
+            raise _UnsupportedSource()
+        result.append(source_code[end_of_last_name:imported_name.start])
+        result.append(imported_name.name)
+        end_of_last_name = imported_name.end
+    result.append(source_code[end_of_last_name:])
+    return ''.join(result)
@@ -1,10 +1,303 @@
-import fnmatch
+import collections
+import itertools
+import multiprocessing
 import os
+import shutil
+import tempfile
 
-def walk_on_py_files(folder):
+from concurrent import futures
+
+from module_renamer.commands.constants import EXECUTOR_TYPES, MOVES_FILE_FORMATS  # noqa: F401
+from module_renamer.commands.discovery import FileDiscovery
+
+try:
+    from tokenize import detect_encoding
+except ImportError:  # pragma: no cover (Python 2)
+    from lib2to3.pgen2.tokenize import detect_encoding
+
+# Upper bound of files sent to a worker at once, big enough to amortize the IPC of process pools
+MAX_CHUNK_SIZE = 100
+
+# Files sent to a worker at once when the number of files is not known beforehand
+STREAMING_CHUNK_SIZE = 16
+
+# Boundaries of an identifier on a bytes pattern over utf-8 sources, where `\b` only knows the
+# ascii letters and would miss the names ending with a non ascii one
+WORD_START = r'(?<![0-9A-Za-z_\x80-\xff])'
+WORD_END = r'(?![0-9A-Za-z_\x80-\xff])'
+
+
+def walk_on_py_files(folder, discovery=None):
     """
     Walk through each python files in a directory
+
+    :param FileDiscovery discovery:
+        Settings used to find and prune the files, defaults to all python files not ignored.
+    """
+    if discovery is None:
+        discovery = FileDiscovery()
+    return discovery.walk(folder)
+
+
+def walk_on_all_py_files(folders, discovery=None):
+    """
+    Walk through each python files in all the given directories, yielding each file only once
+    even when the directories overlap.
+
+    :param list(str) folders: The directories, which may be nested inside each other.
+    :param FileDiscovery discovery: See `walk_on_py_files`.
+    """
+    roots = []
+    for folder in folders:
+        root = os.path.realpath(folder)
+        if root not in roots:
+            roots.append(root)
+
+    # The paths found are only tracked when a directory is inside another
+    overlapping = any(_is_inside(root, other_root) for root in roots for other_root in roots
+                      if root != other_root)
+    seen_paths = set()
+    for root in roots:
+        for path in walk_on_py_files(root, discovery):
+            if overlapping:
+                if path in seen_paths:
+                    continue
+                seen_paths.add(path)
+            yield path
+
+
+def _is_inside(path, directory):
+    return path.startswith(os.path.join(directory, ''))
+
+
+def create_executor(executor_type, jobs=None, initializer=None, initargs=()):
+    """
+    Create the executor used to distribute the work among the workers.
+
+    :param str executor_type:
+        One of EXECUTOR_TYPES. Process pools escape the GIL and should be used for CPU bound work,
+        'serial' runs everything on the current thread, which is useful for debugging.
+    :param int jobs:
+        Number of workers, defaults to the number of CPUs.
+    :param callable initializer:
+        Called once on each worker process (or once on the current process for the other
+        executors) with initargs, used to ship data shared by all the tasks.
+
+    :rtype: concurrent.futures.Executor
     """
-    for dir_path, _, files in os.walk(folder):
-        for filename in fnmatch.filter(files, '*.py'):
-            yield os.path.abspath(os.path.join(dir_path, filename))
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if executor_type == 'process':
+        if initializer is None:
+            return futures.ProcessPoolExecutor(max_workers=jobs)
+        try:
+            return futures.ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                                               initargs=initargs)
+        except TypeError:
+            # The process pools only accept an initializer since python 3.7 (and futures 3.2)
+            return _LazyInitializerProcessPoolExecutor(jobs, initializer, initargs)
+
+    if initializer is not None:
+        initializer(*initargs)
+    if executor_type == 'thread':
+        return futures.ThreadPoolExecutor(max_workers=jobs)
+    return SerialExecutor()
+
+
+class _LazyInitializerProcessPoolExecutor(futures.ProcessPoolExecutor):
+    """
+    Process pool for the interpreters that don't support an initializer: the initializer is
+    sent with each task and called by each worker before running its first task.
+    """
+
+    def __init__(self, max_workers, initializer, initargs):
+        super(_LazyInitializerProcessPoolExecutor, self).__init__(max_workers=max_workers)
+        initialization_id = '{0}-{1}'.format(os.getpid(), next(_initialization_ids))
+        self._initialization = (initialization_id, initializer, initargs)
+
+    def submit(self, fn, *args, **kwargs):
+        return super(_LazyInitializerProcessPoolExecutor, self).submit(
+            _run_initialized, self._initialization, fn, *args, **kwargs)
+
+
+_initialization_ids = itertools.count()
+
+# The initialization already done by the current worker of a _LazyInitializerProcessPoolExecutor
+_worker_initialization_id = None
+
+
+def _run_initialized(initialization, fn, *args, **kwargs):
+    global _worker_initialization_id
+    initialization_id, initializer, initargs = initialization
+    if _worker_initialization_id != initialization_id:
+        initializer(*initargs)
+        _worker_initialization_id = initialization_id
+    return fn(*args, **kwargs)
+
+
+class SerialExecutor(futures.Executor):
+    """
+    Executor that runs each task as soon as it is submitted, on the current thread.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def iter_completed(executor, fn, chunks, max_in_flight):
+    """
+    Submit fn(chunk) for each chunk, yielding (chunk, future) as soon as each one completes.
+
+    The chunks are pulled lazily and at most max_in_flight tasks are pending at any time, so
+    neither the chunks nor the futures of a huge work list are held in memory at once.
+    """
+    chunks = iter(chunks)
+    pending = {}
+    for chunk in itertools.islice(chunks, max_in_flight):
+        pending[executor.submit(fn, chunk)] = chunk
+
+    while pending:
+        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+            for chunk in itertools.islice(chunks, 1):
+                pending[executor.submit(fn, chunk)] = chunk
+
+
+def iter_in_order(executor, fn, chunks, max_in_flight):
+    """
+    Like `iter_completed`, but yielding (chunk, future) in the order the chunks were given.
+
+    A chunk that completes before the ones given before it waits for them, while the workers
+    keep busy with the next chunks.
+    """
+    chunks = iter(chunks)
+    pending = collections.deque()
+    for chunk in itertools.islice(chunks, max_in_flight):
+        pending.append((chunk, executor.submit(fn, chunk)))
+
+    while pending:
+        chunk, future = pending.popleft()
+        futures.wait([future])
+        yield chunk, future
+        for next_chunk in itertools.islice(chunks, 1):
+            pending.append((next_chunk, executor.submit(fn, next_chunk)))
+
+
+def max_in_flight_for(jobs=None):
+    """
+    Number of pending tasks that keeps every worker busy.
+    """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    return jobs * 4
+
+
+def chunk_size_for(number_of_items, jobs=None):
+    """
+    Size of the chunks that keeps every worker busy while sending as few tasks as possible.
+    """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    return max(1, min(MAX_CHUNK_SIZE, number_of_items // (jobs * 4)))
+
+
+def split_in_chunks(items, chunk_size):
+    """
+    Split a list in lists with at most chunk_size items.
+    """
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def iter_chunks(iterable, chunk_size):
+    """
+    Lazy version of `split_in_chunks`, for iterables of unknown size.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def moves_file_format_for(file_path):
+    """
+    The format of a file with moved imports according to its extension, None if unknown.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.py':
+        return 'python'
+    if extension[1:] in MOVES_FILE_FORMATS:
+        return extension[1:]
+    return None
+
+
+def decode_source(raw_source):
+    """
+    Decode the content of a python file, using the encoding declared on the file.
+
+    The line endings are normalized to '\\n', like when reading a file on text mode.
+
+    :param bytes raw_source: The content of the file.
+    :return: The source code, its encoding and the line ending used on the file.
+    :rtype: tuple(str,str,str)
+    """
+    lines = iter(raw_source.splitlines(True))
+    encoding, _ = detect_encoding(lambda: next(lines, b''))
+
+    newline = '\n'
+    first_line_end = raw_source.find(b'\n')
+    if first_line_end > 0 and raw_source[first_line_end - 1:first_line_end] == b'\r':
+        newline = '\r\n'
+    elif first_line_end == -1 and b'\r' in raw_source:
+        newline = '\r'
+
+    source_code = raw_source.decode(encoding).replace('\r\n', '\n').replace('\r', '\n')
+    return source_code, encoding, newline
+
+
+def encode_source(source_code, encoding, newline):
+    """
+    Inverse of `decode_source`.
+
+    :rtype: bytes
+    """
+    if newline != '\n':
+        source_code = source_code.replace('\n', newline)
+    return source_code.encode(encoding)
+
+
+def write_file_atomically(file_path, content):
+    """
+    Write the content on a temporary file on the same directory and then replace the original
+    file, so it is never left half written. The permissions of the original file are kept.
+
+    When the path is a symbolic link the file it points to is replaced, keeping the link.
+
+    :param str file_path: Path of the file, which is created if it doesn't exist.
+    :param bytes content: The new content of the file.
+    """
+    file_path = os.path.realpath(file_path)
+    directory, file_name = os.path.split(file_path)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + file_name,
+                                                  suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(content)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        _replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+# os.rename can't overwrite files on Windows and os.replace is not available on Python 2
+_replace = getattr(os, 'replace', os.rename)
@@ -0,0 +1,120 @@
+"""
+Library API to rename the imports of python sources held in memory.
+"""
+import collections
+import functools
+
+from module_renamer.commands.utils import (STREAMING_CHUNK_SIZE, create_executor, iter_chunks,
+                                           iter_in_order, max_in_flight_for)
+
+# The heavy dependencies (pasta, six) are only imported when a Renamer is created, so importing
+# the package stays cheap for the command line.
+
+
+class RenameResult(collections.namedtuple('RenameResult', 'path source_code changed error')):
+    """
+    The result of renaming one of the sources given to `Renamer.rename_sources`.
+
+    :ivar str path: The path given with the source, only used to identify it.
+    :ivar str source_code: The renamed source code, or the original one if it was not changed or
+        could not be renamed.
+    :ivar bool changed: Whether the source code was changed.
+    :ivar str error: The error message when the source could not be renamed, otherwise None.
+    """
+
+    __slots__ = ()
+
+
+class Renamer(object):
+    """
+    Rename the imports of python sources in memory, without reading or writing any file.
+
+    The list of moves is validated and indexed once, so the same Renamer should be used for all
+    the sources renamed with it. The workers used by `rename_sources` are started on its first
+    call and kept until `close` is called, so use it as a context manager:
+
+    >>> with Renamer([('a.b.c', 'x.y.c')]) as renamer:
+    ...     renamer.rename_source('from a.b import c\\n')
+    'from x.y import c\\n'
+
+    :param list(tuple(str,str)) moves:
+        The old path and the new path of each moved import, applied in order. Raises
+        ClickException when any of them is invalid.
+    :param str executor_type:
+        One of `constants.EXECUTOR_TYPES`, used by `rename_sources`.
+    :param int jobs:
+        Number of workers used by `rename_sources`, defaults to the number of CPUs.
+    """
+
+    def __init__(self, moves, executor_type='process', jobs=None):
+        from module_renamer.commands.move_plan import MovePlan
+        self.move_plan = MovePlan(moves)
+        self.executor_type = executor_type
+        self.jobs = jobs
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the workers used by `rename_sources`, if they were started.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def rename_source(self, source_code, path='<string>'):
+        """
+        Rename the imports of a single source, on the current thread.
+
+        :param str source_code: Content of a python module.
+        :param str path: Path used on the error messages.
+        :return: The renamed source code, the same object when nothing was changed.
+        :rtype: str
+        """
+        from module_renamer.commands.rename_imports import rename_candidate_source
+        new_source_code = rename_candidate_source(source_code, self.move_plan, path)
+        # A source that mentions a moved import may still need no change
+        return source_code if new_source_code == source_code else new_source_code
+
+    def rename_sources(self, sources):
+        """
+        Rename the imports of many sources in parallel.
+
+        The sources are sent to the workers in chunks as they are pulled from the iterable, and
+        the results are yielded in the same order. A source that can't be renamed doesn't stop
+        the others, its error is reported on the result instead.
+
+        :param iterable(tuple(str,str)) sources: The path and the source code of each file.
+        :rtype: iterator(RenameResult)
+        """
+        from module_renamer.commands.rename_imports import _rename_source_chunk
+
+        if self.executor_type == 'process':
+            rename_chunk = _rename_source_chunk
+        else:
+            # Threads share the globals of the module, so the plan is given to each task
+            rename_chunk = functools.partial(_rename_source_chunk, move_plan=self.move_plan)
+
+        chunks = iter_chunks(sources, STREAMING_CHUNK_SIZE)
+        for chunk, future in iter_in_order(self._get_executor(), rename_chunk, chunks,
+                                           max_in_flight_for(self.jobs)):
+            for (path, source_code), (_, new_source_code, error) in zip(chunk, future.result()):
+                if new_source_code is None:
+                    yield RenameResult(path, source_code, False, error)
+                else:
+                    yield RenameResult(path, new_source_code, True, None)
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_type == 'process':
+                from module_renamer.commands.rename_imports import _init_worker
+                self._executor = create_executor('process', self.jobs, initializer=_init_worker,
+                                                 initargs=(self.move_plan,))
+            else:
+                self._executor = create_executor(self.executor_type, self.jobs)
+        return self._executor
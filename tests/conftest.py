@@ -0,0 +1,16 @@
+import pytest
+from concurrent import futures
+
+
+class _ProcessPoolExecutorWithoutInitializer(futures.ProcessPoolExecutor):
+    """
+    The process pool of python < 3.7, which doesn't accept an initializer.
+    """
+
+    def __init__(self, max_workers=None):
+        super(_ProcessPoolExecutorWithoutInitializer, self).__init__(max_workers=max_workers)
+
+
+@pytest.fixture
+def process_pool_without_initializer(monkeypatch):
+    monkeypatch.setattr(futures, 'ProcessPoolExecutor', _ProcessPoolExecutorWithoutInitializer)
@@ -1,7 +1,10 @@
 # coding=utf-8
 
 
+import io
 import os
+import pprint
+import sys
 
 import git
 import pytest
@@ -44,15 +47,21 @@ def create_scenario():
     return _create_scenario
 
 
-@pytest.fixture()
-def run_cli():
+@pytest.fixture(params=['full-scan', 'incremental'])
+def run_cli(request):
+    """
+    Every scenario must have the same output with and without the --incremental flag
+    """
     def _run_cli(repo, text_input=None):
         runner = CliRunner()
 
         output_file = _output_file(repo)
         output_arg = '--output-file={0}'.format(output_file)
+        args = [repo.working_dir, output_arg]
+        if request.param == 'incremental':
+            args.append('--incremental')
 
-        return runner.invoke(analyze, [repo.working_dir, output_arg], input=text_input)
+        return runner.invoke(analyze, args, input=text_input)
 
     return _run_cli
 
@@ -117,5 +126,312 @@ def test_analyze_save_conflict(repo, create_scenario, run_cli):
         assert "imports_to_move = [('m.n', 'w.n')]" in file.read()
 
 
+def test_analyze_does_not_touch_working_tree(repo, create_scenario, run_cli):
+    imports_for_file_a = ['from a.b import c\n', 'from d.e import f\n']
+    imports_for_file_b = ['from x.x import c\n', 'from j.k import l\n']
+    create_scenario(repo, imports_for_file_a, imports_for_file_b)
+
+    # Uncommitted changes are ignored, only the committed content of each branch is analyzed
+    file_path = os.path.join(repo.working_dir, 'file_a.py')
+    with open(file_path, mode='w') as file:
+        file.write('from uncommitted import c\n')
+    with open(os.path.join(repo.working_dir, 'untracked.py'), mode='w') as file:
+        file.write('from untracked import c\n')
+
+    result = run_cli(repo)
+
+    assert result.exit_code == 0
+    assert repo.active_branch.name == 'new_branch'
+    with open(file_path, mode='r') as file:
+        assert file.read() == 'from uncommitted import c\n'
+
+    output_file = _output_file(repo)
+    with open(output_file, mode='r') as file:
+        assert "imports_to_move = [('a.b.c', 'x.x.c')]" in file.read()
+
+
+def test_analyze_with_unknown_branch(repo, create_scenario):
+    create_scenario(repo, ['from a.b import c\n'], ['from x.x import c\n'])
+
+    result = CliRunner().invoke(analyze, [repo.working_dir, '--compare-with=unknown',
+                                          '--output-file={0}'.format(_output_file(repo))])
+
+    assert result.exit_code == 1
+    assert "Could not find the branch unknown" in result.output
+
+
+@pytest.mark.parametrize('kept_name', [
+    'f',
+    pytest.param(u'café', marks=pytest.mark.skipif(sys.version_info[0] < 3,
+                                                   reason='Python 2 names are ascii only')),
+])
+def test_analyze_with_import_kept_on_unchanged_file(repo, run_cli, kept_name):
+    files_on_master = {
+        'file_a.py': u'from a.b import c\nfrom d.e import {0}\n'.format(kept_name),
+        'file_b.py': u'from d.e import {0}\n'.format(kept_name),
+        'file_c.py': 'from m import n\n',
+        os.path.join('pkg', 'file_d.py'): 'import os\n',
+    }
+    os.makedirs(os.path.join(repo.working_dir, 'pkg'))
+    for file_name, content in files_on_master.items():
+        with io.open(os.path.join(repo.working_dir, file_name), mode='w', encoding='utf-8') as file:
+            file.write(content)
+    repo.index.add(list(files_on_master))
+    repo.index.commit("commit on master")
+    repo.heads.master.checkout(b='new_branch')
+
+    # d.e.f is still imported by file_b.py, so it must not be reported as moved
+    with io.open(os.path.join(repo.working_dir, 'file_a.py'), mode='w', encoding='utf-8') as file:
+        file.write(u'from x.x import c\nfrom y import {0}\n'.format(kept_name))
+    os.rename(os.path.join(repo.working_dir, 'file_c.py'),
+              os.path.join(repo.working_dir, 'pkg', 'file_c.py'))
+    repo.index.remove(['file_c.py'])
+    repo.index.add(['file_a.py', os.path.join('pkg', 'file_c.py')])
+    repo.index.commit("commit on working branch")
+
+    result = run_cli(repo)
+
+    assert result.exit_code == 0
+    with open(_output_file(repo), mode='r') as file:
+        assert "imports_to_move = [('a.b.c', 'x.x.c')]" in file.read()
+
+
+@pytest.mark.parametrize('cache_option', [None, '--no-cache', '--cache-dir'])
+def test_analyze_uses_cache_of_imports(repo, create_scenario, tmpdir, monkeypatch, cache_option):
+    from module_renamer.commands import analyze_modifications
+
+    create_scenario(repo, ['from a.b import c\n'], ['from x.x import c\n'])
+    args = [repo.working_dir, '--output-file={0}'.format(_output_file(repo)), '--jobs=1']
+    if cache_option == '--no-cache':
+        args.append(cache_option)
+    elif cache_option == '--cache-dir':
+        args.append('--cache-dir={0}'.format(tmpdir.join('cache')))
+
+    parsed_files = []
+    original_get_imports_from_source = analyze_modifications.get_imports_from_source
+
+    def get_imports_from_source(source, file_path):
+        parsed_files.append(file_path)
+        return original_get_imports_from_source(source, file_path)
+
+    monkeypatch.setattr(analyze_modifications, 'get_imports_from_source',
+                        get_imports_from_source)
+
+    assert CliRunner().invoke(analyze, args).exit_code == 0
+    assert len(parsed_files) == 2
+
+    del parsed_files[:]
+    assert CliRunner().invoke(analyze, args).exit_code == 0
+    assert len(parsed_files) == (2 if cache_option == '--no-cache' else 0)
+    with open(_output_file(repo), mode='r') as file:
+        assert "imports_to_move = [('a.b.c', 'x.x.c')]" in file.read()
+
+    if cache_option == '--cache-dir':
+        assert tmpdir.join('cache', 'imports.sqlite').check()
+
+
+@pytest.mark.parametrize('initializer_support', [True, False])
+def test_analyze_in_parallel_has_deterministic_output(repo, initializer_support, request):
+    if not initializer_support:
+        request.getfixturevalue('process_pool_without_initializer')
+
+    for i in range(20):
+        with open(os.path.join(repo.working_dir, 'file_{0}.py'.format(i)), mode='w') as file:
+            file.write('from a.b import c{0}\nfrom d import e\n'.format(i))
+    repo.index.add(['file_{0}.py'.format(i) for i in range(20)])
+    repo.index.commit("commit on master")
+    repo.heads.master.checkout(b='new_branch')
+
+    for i in range(20):
+        with open(os.path.join(repo.working_dir, 'file_{0}.py'.format(i)), mode='w') as file:
+            file.write('from x.y import c{0}\nfrom d import e\n'.format(i))
+    repo.index.add(['file_{0}.py'.format(i) for i in range(20)])
+    repo.index.commit("commit on working branch")
+
+    outputs = []
+    for jobs in ['1', '3']:
+        result = CliRunner().invoke(analyze, [repo.working_dir, '--no-cache', '--jobs', jobs,
+                                              '--output-file={0}'.format(_output_file(repo))])
+        assert result.exit_code == 0
+        with open(_output_file(repo), mode='r') as file:
+            outputs.append(file.read())
+
+    assert outputs[0] == outputs[1]
+    expected_moves = sorted(('a.b.c{0}'.format(i), 'x.y.c{0}'.format(i)) for i in range(20))
+    assert outputs[0] == 'imports_to_move = {0}\n'.format(
+        pprint.pformat(expected_moves, indent=4, width=120))
+
+
+def test_analyze_with_exclude(repo, create_scenario):
+    create_scenario(repo, ['from a.b import c\n'], ['from x.x import c\n'])
+
+    result = CliRunner().invoke(analyze, [repo.working_dir, '--exclude=file_a.py',
+                                          '--output-file={0}'.format(_output_file(repo))])
+
+    assert result.exit_code == 0
+    with open(_output_file(repo), mode='r') as file:
+        assert "imports_to_move = []" in file.read()
+
+
+def test_analyze_with_stats(repo, create_scenario, tmpdir):
+    import json
+    import pstats
+
+    create_scenario(repo, ['from a.b import c\n'], ['from x.x import c\n'])
+    stats_file = str(tmpdir.join('stats.json'))
+    profile_file = str(tmpdir.join('analyze.prof'))
+
+    result = CliRunner().invoke(analyze, [repo.working_dir, '--no-cache', '--jobs=1', '--stats',
+                                          '--stats-json', stats_file, '--profile', profile_file,
+                                          '--output-file={0}'.format(_output_file(repo))])
+
+    assert result.exit_code == 0, result.output
+    assert "Bytes read:" in result.output
+    with open(stats_file) as file:
+        stats = json.load(file)
+    assert stats['phases']['ast.parse']['calls'] == 2
+    assert stats['phases']['list files']['calls'] == 1
+    assert stats['phases']['find moved imports']['calls'] == 1
+    assert stats['counters']['bytes_read'] == len('from a.b import c\n') * 2
+    assert [file_stats['path'] for file_stats in stats['slowest_files']] == ['file_a.py'] * 2
+    function_names = {function[2] for function in pstats.Stats(profile_file).stats}
+    assert 'get_imports_from_source' in function_names
+
+
+def test_find_moved_imports_compares_only_imports_with_the_same_name():
+    """
+    The join between the imports from both branches groups them by name, so each import is
+    only compared with the ones that have the same name (a cartesian product would compare
+    every pair).
+    """
+    from module_renamer.commands.analyze_modifications import _find_moved_imports
+    from module_renamer.commands.import_table import ImportTable
+
+    comparisons = []
+
+    class _CountingId(int):
+        def __ne__(self, other):
+            comparisons.append(other)
+            return int(self) != int(other)
+
+        __hash__ = int.__hash__
+
+    modules = ['package_{0}.module'.format(i) for i in range(100)]
+    for number_of_imports in (100, 1000, 10000):
+        table = ImportTable()
+        origin = table.import_set([table.ids_of(
+            (modules[i % 100], 'Name{0}'.format(i)) for i in range(number_of_imports))])
+        working = table.import_set([table.ids_of(
+            (modules[(i + 1) % 100], 'Name{0}'.format(i)) for i in range(number_of_imports))])
+        table.modules = [_CountingId(module_id) for module_id in table.modules]
+        del comparisons[:]
+
+        moved_imports = _find_moved_imports(origin, working)
+
+        assert len(moved_imports) == number_of_imports
+        assert len(comparisons) == number_of_imports
+
+
 def _output_file(repo):
     return os.path.join(repo.working_dir, "test_list_output.py")
+
+
+@pytest.mark.parametrize('number_of_moves, path_length', [
+    (0, 5), (1, 5), (3, 10), (4, 20), (50, 20), (2, 60), (3, 120),
+])
+def test_write_list_to_file_like_pprint(tmpdir, number_of_moves, path_length):
+    from module_renamer.commands.analyze_modifications import write_list_to_file
+
+    moves = [('a' * path_length + '.c{0}'.format(i), 'x' * path_length + '.c{0}'.format(i))
+             for i in range(number_of_moves)]
+    output_file = str(tmpdir.join('list_output.py'))
+
+    write_list_to_file(moves, output_file)
+
+    with open(output_file) as file:
+        assert file.read() == 'imports_to_move = {0}\n'.format(
+            pprint.pformat(sorted(moves), indent=4, width=120))
+
+
+@pytest.mark.parametrize('file_format', ['python', 'jsonl', 'tsv'])
+def test_analyze_with_format(repo, create_scenario, file_format):
+    from module_renamer.commands.move_plan import load_move_plan
+
+    create_scenario(repo, ['from a.b import c\n', 'from a.b import d\n'],
+                    ['from x.y import c\n', 'from x.z import d\n'])
+    output_file = os.path.join(repo.working_dir, 'moves.out')
+
+    result = CliRunner().invoke(analyze, [repo.working_dir, '--output-file', output_file,
+                                          '--format', file_format])
+
+    assert result.exit_code == 0, result.output
+    with open(output_file) as file:
+        content = file.read()
+    assert content.startswith({'python': 'imports_to_move = ', 'jsonl': '["a.b.c", "x.y.c"]\n',
+                               'tsv': 'a.b.c\tx.y.c\n'}[file_format])
+    assert load_move_plan(output_file).moves == [('a.b.c', 'x.y.c'), ('a.b.d', 'x.z.d')]
+
+
+@pytest.mark.parametrize('balance_option', [[], ['--balance-shards']])
+def test_analyze_with_shards_and_merge(repo, balance_option):
+    from module_renamer.cli import merge
+
+    for i in range(20):
+        with open(os.path.join(repo.working_dir, 'file_{0}.py'.format(i)), mode='w') as file:
+            file.write('from a.b import c{0}\n'.format(i) + 'from d import e\n' * i)
+    repo.index.add(['file_{0}.py'.format(i) for i in range(20)])
+    repo.index.commit("commit on master")
+    repo.heads.master.checkout(b='new_branch')
+
+    # The new import of each name is on another file, possibly on another shard
+    for i in range(20):
+        with open(os.path.join(repo.working_dir, 'file_{0}.py'.format(i)), mode='w') as file:
+            file.write('from x.y import c{0}\n'.format((i + 7) % 20) + 'from d import e\n' * i)
+    repo.index.add(['file_{0}.py'.format(i) for i in range(20)])
+    repo.index.commit("commit on working branch")
+
+    result = CliRunner().invoke(analyze, [repo.working_dir, '--no-cache',
+                                          '--output-file={0}'.format(_output_file(repo))])
+    assert result.exit_code == 0, result.output
+    with open(_output_file(repo)) as file:
+        expected_output = file.read()
+
+    partial_files = []
+    for index in range(1, 4):
+        partial_file = os.path.join(repo.working_dir, 'shard_{0}.jsonl'.format(index))
+        result = CliRunner().invoke(analyze, [repo.working_dir, '--no-cache',
+                                              '--shard={0}/3'.format(index),
+                                              '--output-file', partial_file] + balance_option)
+        assert result.exit_code == 0, result.output
+        partial_files.append(partial_file)
+
+    merged_file = os.path.join(repo.working_dir, 'merged.py')
+    result = CliRunner().invoke(merge, partial_files[::-1] + ['--output-file', merged_file])
+
+    assert result.exit_code == 0, result.output
+    with open(merged_file) as file:
+        assert file.read() == expected_output
+
+    result = CliRunner().invoke(merge, partial_files[:2] + ['--output-file', merged_file])
+
+    assert result.exit_code != 0
+    assert 'The imports of the shard(s) 3 of 3 are missing' in result.output
+
+    result = CliRunner().invoke(merge, partial_files[:1] * 2 + ['--output-file', merged_file])
+
+    assert result.exit_code != 0
+    assert 'are from the same shard' in result.output
+
+
+@pytest.mark.parametrize('args, message', [
+    (['--shard=3/2'], 'must be INDEX/COUNT'),
+    (['--shard=a'], 'must be INDEX/COUNT'),
+    (['--shard=1/2', '--incremental'], 'can not be used with --incremental'),
+])
+def test_analyze_with_invalid_shard(repo, create_scenario, args, message):
+    create_scenario(repo, ['from a.b import c\n'], ['from x.x import c\n'])
+
+    result = CliRunner().invoke(analyze, [repo.working_dir] + args)
+
+    assert result.exit_code != 0
+    assert message in result.output
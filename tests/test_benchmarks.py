@@ -0,0 +1,59 @@
+import os
+
+from click.testing import CliRunner
+
+from benchmarks.runner import format_results, run_benchmarks
+from benchmarks.synthetic_repo import RepoSpec, WORKING_BRANCH, create_synthetic_repo
+from module_renamer.cli import analyze
+
+
+def test_synthetic_repo_is_reproducible(tmpdir):
+    spec = RepoSpec(number_of_files=30, imports_per_file=3, moved_symbols=5, seed=1)
+    first_repo = create_synthetic_repo(str(tmpdir.join('first')), spec)
+    second_repo = create_synthetic_repo(str(tmpdir.join('second')), spec)
+
+    assert len(first_repo.moves) == 5
+    assert first_repo.moves == second_repo.moves
+    for file_path in first_repo.file_paths:
+        assert (tmpdir.join('first', file_path).read() ==
+                tmpdir.join('second', file_path).read())
+
+
+def test_synthetic_repo_moves_are_found_by_analyze(tmpdir):
+    spec = RepoSpec(number_of_files=30, imports_per_file=3, moved_symbols=5)
+    synthetic_repo = create_synthetic_repo(str(tmpdir.join('repo')), spec)
+    output_file = str(tmpdir.join('list_output.py'))
+
+    result = CliRunner().invoke(analyze, [synthetic_repo.path, '--branch', WORKING_BRANCH,
+                                          '--output-file', output_file, '--jobs=1'])
+
+    assert result.exit_code == 0, result.output
+    with open(output_file) as file:
+        namespace = {}
+        exec(file.read(), namespace)
+    assert namespace['imports_to_move'] == synthetic_repo.moves
+
+
+def test_run_benchmarks(tmpdir):
+    spec = RepoSpec(number_of_files=20, imports_per_file=2, moved_symbols=3)
+    stage_names = ['analyze', 'rename']
+    results = run_benchmarks(spec, stage_names, {'jobs': 1, 'executor': 'serial'},
+                             str(tmpdir.join('repo')))
+
+    assert results['spec'] == spec.as_dict()
+    assert sorted(results['stages']) == stage_names
+    for stage in results['stages'].values():
+        assert stage['items'] > 0
+        assert stage['seconds'] >= 0
+
+    # The repository is reused and left unchanged by the rename
+    assert os.path.isfile(str(tmpdir.join('repo', '.git', 'synthetic_repo.pickle')))
+    run_benchmarks(spec, ['rename'], {'jobs': 1, 'executor': 'serial'}, str(tmpdir.join('repo')))
+
+    traced_results = run_benchmarks(spec, ['analyze.find_moved_imports'],
+                                    {'jobs': 1, 'executor': 'serial', 'trace_memory': True},
+                                    str(tmpdir.join('repo')))
+    assert traced_results['stages']['analyze.find_moved_imports']['traced_peak_kb'] >= 0
+
+    table = format_results(results, previous_results=results)
+    assert 'analyze' in table and '1.00x' in table
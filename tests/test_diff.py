@@ -0,0 +1,36 @@
+import io
+
+from module_renamer.commands.diff import OrderedDiffWriter, unified_diff
+
+
+def test_unified_diff_keeps_line_endings_and_missing_newline():
+    diff = unified_diff('src/a.py', u'import a\nx = 1', u'import b\nx = 1', 'utf-8', '\r\n')
+
+    assert diff == (b'--- a/src/a.py\n'
+                    b'+++ b/src/a.py\n'
+                    b'@@ -1,2 +1,2 @@\n'
+                    b'-import a\r\n'
+                    b'+import b\r\n'
+                    b' x = 1\n'
+                    b'\\ No newline at end of file\n')
+
+
+def test_unified_diff_relative_to_directory(tmpdir):
+    file_path = str(tmpdir.join('src', 'a.py'))
+    diff = unified_diff(file_path, u'import a\n', u'import b\n', 'utf-8', '\n',
+                        relative_to=str(tmpdir))
+
+    assert diff.startswith(b'--- a/src/a.py\n+++ b/src/a.py\n')
+
+
+def test_ordered_diff_writer():
+    stream = io.BytesIO()
+    writer = OrderedDiffWriter(stream)
+    chunks = list(writer.track([['a', 'b'], ['c'], ['d']]))
+
+    writer.add(chunks[1], [b'c\n'])
+    assert stream.getvalue() == b''
+    writer.add(chunks[0], [b'a\n', None])
+    assert stream.getvalue() == b'a\nc\n'
+    writer.add(chunks[2], [b'd\n'])
+    assert stream.getvalue() == b'a\nc\nd\n'
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+
+import git
+import pytest
+from click import ClickException
+
+from module_renamer.commands.discovery import FileDiscovery
+
+
+@pytest.fixture()
+def project(tmpdir):
+    files = {
+        'a.py': '',
+        'b.txt': '',
+        '.gitignore': 'build/\n*_generated.py\n!keep_generated.py\n/root_only.py\n',
+        'root_only.py': '',
+        'build/c.py': '',
+        'pkg/d.py': '',
+        'pkg/root_only.py': '',
+        'pkg/e_generated.py': '',
+        'pkg/keep_generated.py': '',
+        'pkg/.gitignore': 'local.py\n',
+        'pkg/local.py': '',
+        'pkg/sub/f.py': '',
+        'venv/pyvenv.cfg': '',
+        'venv/lib/g.py': '',
+        'node_modules/h.py': '',
+        'vendor/i.py': '',
+    }
+    for file_name, content in files.items():
+        file_path = os.path.join(str(tmpdir), *file_name.split('/'))
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, mode='w') as file:
+            file.write(content)
+    return str(tmpdir)
+
+
+def _relative_paths(project, paths):
+    return [os.path.relpath(path, project).replace(os.sep, '/') for path in paths]
+
+
+def test_walk_with_scandir(project):
+    paths = FileDiscovery().walk(project)
+
+    assert _relative_paths(project, paths) == [
+        'a.py',
+        'pkg/d.py',
+        'pkg/keep_generated.py',
+        'pkg/root_only.py',
+        'pkg/sub/f.py',
+        'vendor/i.py',
+    ]
+
+
+def test_walk_with_scandir_include_and_exclude(project):
+    discovery = FileDiscovery(include=['*.py', '*.txt'], exclude=['vendor', 'pkg/sub/*.py'],
+                              use_gitignore=False)
+
+    assert _relative_paths(project, discovery.walk(project)) == [
+        'a.py',
+        'b.txt',
+        'root_only.py',
+        'build/c.py',
+        'pkg/d.py',
+        'pkg/e_generated.py',
+        'pkg/keep_generated.py',
+        'pkg/local.py',
+        'pkg/root_only.py',
+    ]
+
+
+def test_walk_with_git(project):
+    repo = git.Repo.init(project)
+    repo.index.add(['a.py', 'pkg/d.py'])
+    repo.index.commit('initial commit')
+    repo.close()
+    os.remove(os.path.join(project, 'a.py'))
+
+    paths = FileDiscovery(exclude=['vendor'], use_git=True).walk(project)
+
+    assert sorted(_relative_paths(project, paths)) == [
+        'pkg/d.py',
+        'pkg/keep_generated.py',
+        'pkg/root_only.py',
+        'pkg/sub/f.py',
+    ]
+
+
+def test_walk_with_git_outside_of_a_repository(tmpdir, monkeypatch):
+    monkeypatch.setenv('GIT_CEILING_DIRECTORIES', str(tmpdir))
+    folder = str(tmpdir.mkdir('not_a_repo'))
+
+    with pytest.raises(ClickException) as error:
+        list(FileDiscovery(use_git=True).walk(folder))
+
+    assert 'Could not list the files of {0} with git: '.format(folder) in error.value.message
+    assert 'not a git repository' in error.value.message
+
+
+def test_walk_with_git_with_many_errors(project, monkeypatch):
+    """
+    The errors of git must not block the listing when they are more than a pipe can hold.
+    """
+    from module_renamer.commands import discovery
+
+    original_popen = subprocess.Popen
+    script = ("import sys; sys.stderr.write('warning\\n' * 100000); "
+              "sys.stdout.write('a.py\\0pkg/d.py\\0')")
+
+    def _popen(command, **kwargs):
+        return original_popen([sys.executable, '-c', script], **kwargs)
+
+    monkeypatch.setattr(discovery.subprocess, 'Popen', _popen)
+
+    paths = FileDiscovery(use_git=True).walk(project)
+
+    assert sorted(_relative_paths(project, paths)) == ['a.py', 'pkg/d.py']
@@ -0,0 +1,35 @@
+from module_renamer.commands.import_cache import ImportCache
+
+
+def test_import_cache(tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    with ImportCache(cache_dir) as cache:
+        assert cache.get('blob_a') is None
+        cache.set('blob_a', [('a.b', 'c'), ('', 'os')])
+        assert cache.get('blob_a') == [('a.b', 'c'), ('', 'os')]
+
+    with ImportCache(cache_dir) as cache:
+        assert cache.get('blob_a') == [('a.b', 'c'), ('', 'os')]
+        assert cache.get('blob_b') is None
+
+
+def test_import_cache_evicts_least_recently_used(tmpdir, monkeypatch):
+    from module_renamer.commands import import_cache
+
+    cache_dir = str(tmpdir.join('cache'))
+    clock = iter(range(10))
+    monkeypatch.setattr(import_cache.time, 'time', lambda: next(clock))
+
+    with ImportCache(cache_dir, max_entries=2) as cache:
+        cache.set('blob_a', [('a', 'b')])
+    with ImportCache(cache_dir, max_entries=2) as cache:
+        cache.set('blob_b', [('c', 'd')])
+    with ImportCache(cache_dir, max_entries=2) as cache:
+        assert cache.get('blob_a') == [('a', 'b')]
+    with ImportCache(cache_dir, max_entries=2) as cache:
+        cache.set('blob_c', [('e', 'f')])
+
+    with ImportCache(cache_dir, max_entries=2) as cache:
+        assert cache.get('blob_a') == [('a', 'b')]
+        assert cache.get('blob_b') is None
+        assert cache.get('blob_c') == [('e', 'f')]
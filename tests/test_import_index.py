@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from module_renamer.commands.import_index import ImportIndex, iter_imported_names
+from module_renamer.commands.utils import SerialExecutor
+
+
+def test_iter_imported_names():
+    source = (b'import a.b.c as q, d\n'
+              b'from e.f import g, h\n'
+              b'from i import *\n'
+              b'from . import j\n'
+              b'from .k import l\n'
+              b'def m():\n'
+              b'    import n.o\n')
+
+    assert sorted(iter_imported_names(source)) == ['a.b.c', 'd', 'e.f.g', 'e.f.h', 'i', 'n.o']
+
+
+@pytest.fixture
+def project(tmpdir):
+    tmpdir.join('src', 'parent.py').write('import a\n', ensure=True)
+    tmpdir.join('src', 'module.py').write('from a.b import c\n')
+    tmpdir.join('src', 'child.py').write('from a.b.c.d import e\n')
+    tmpdir.join('src', 'other.py').write('from a.bc import d\n')
+    tmpdir.join('src', 'invalid.py').write('from a.b impot c\n')
+    return tmpdir
+
+
+def test_files_referencing(project):
+    with ImportIndex(str(project.join('index.sqlite'))) as index:
+        file_paths, parsed_files = index.update([str(project.join('src'))], SerialExecutor(), 1)
+        assert parsed_files == len(file_paths) == 5
+
+        def referencing(*dotted_paths):
+            return sorted(os.path.basename(path) for path in index.files_referencing(dotted_paths))
+
+        assert referencing('a.b.c') == ['child.py', 'invalid.py', 'module.py', 'parent.py']
+        assert referencing('a.bc.d') == ['invalid.py', 'other.py', 'parent.py']
+        assert referencing('x.y', 'a.b.c.d.e') == ['child.py', 'invalid.py', 'module.py',
+                                                   'parent.py']
+        assert referencing('x.y') == ['invalid.py']
+
+
+def test_update_is_incremental(project):
+    src = project.join('src')
+    with ImportIndex(str(project.join('index.sqlite'))) as index:
+        index.update([str(src)], SerialExecutor(), 1)
+
+    src.join('invalid.py').write('from a.b import c\n')
+    src.join('other.py').remove()
+    src.join('new.py').write('import x.y\n')
+    # Only the modification time changed
+    os.utime(str(src.join('parent.py')), (0, 0))
+
+    with ImportIndex(str(project.join('index.sqlite'))) as index:
+        file_paths, parsed_files = index.update([str(src)], SerialExecutor(), 1)
+
+        assert sorted(os.path.basename(path) for path in file_paths) == [
+            'child.py', 'invalid.py', 'module.py', 'new.py', 'parent.py']
+        assert parsed_files == 2
+        assert sorted(os.path.basename(path) for path in index.files_referencing(['x'])) == \
+            ['new.py']
+        assert sorted(os.path.basename(path) for path in index.files_referencing(['a.bc'])) == \
+            ['parent.py']
+
+
+def test_update_keeps_the_parse_error_when_only_the_modification_time_changed(project):
+    src = project.join('src')
+    with ImportIndex(str(project.join('index.sqlite'))) as index:
+        index.update([str(src)], SerialExecutor(), 1)
+        assert [os.path.basename(path) for path in index.files_referencing(['x'])] == \
+            ['invalid.py']
+
+    os.utime(str(src.join('invalid.py')), (0, 0))
+
+    with ImportIndex(str(project.join('index.sqlite'))) as index:
+        _, parsed_files = index.update([str(src)], SerialExecutor(), 1)
+
+        assert parsed_files == 0
+        assert [os.path.basename(path) for path in index.files_referencing(['x'])] == \
+            ['invalid.py']
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from module_renamer.commands.import_table import Import, ImportSet, ImportTable
+
+
+def test_import_table_interns_strings():
+    table = ImportTable()
+
+    first_ids = table.ids_of([('a.b', 'c'), ('a.b', 'd'), ('a.b', 'c')])
+    second_ids = table.ids_of([(u'a.b', u'c'), ('x', 'a.b')])
+
+    assert list(first_ids) == [0, 1, 0]
+    assert list(second_ids) == [0, 2]
+    assert len(table) == 3
+    assert table.strings == ['a.b', 'c', 'd', 'x']
+    assert table.get(2) == Import('x', 'a.b')
+    assert table.find_import_id('a.b', 'd') == 1
+    assert table.find_import_id('a.b', 'x') is None
+    assert table.find_import_id('y', 'c') is None
+
+
+def test_import_sets_match_python_sets():
+    randomizer = random.Random(0)
+    imports = [('package_{0}.module_{1}'.format(i % 7, i % 13), 'Name{0}'.format(i % 11))
+               for i in range(500)]
+    table = ImportTable()
+    origin = set(randomizer.sample(imports, 300))
+    working = set(randomizer.sample(imports, 300))
+    origin_set = table.import_set([table.ids_of(sorted(origin))])
+    working_set = table.import_set([table.ids_of(sorted(working)[:100]),
+                                    table.ids_of(sorted(working)[100:])])
+
+    assert set(origin_set) == origin
+    assert len(origin_set) == len(origin)
+    assert set(origin_set.union(working_set)) == origin | working
+    assert set(origin_set.intersection(working_set)) == origin & working
+    assert set(origin_set.difference(working_set)) == origin - working
+    assert set(origin_set.symmetric_difference(working_set)) == origin ^ working
+    assert all(imp in origin_set for imp in origin)
+    assert not any(imp in origin_set for imp in working - origin)
+    assert ('unknown', 'Name') not in origin_set
+    assert list(origin_set.ids()) == sorted(origin_set.ids())
+
+    origin_set.update(working_set)
+    assert set(origin_set) == origin | working
+
+
+def test_empty_import_set():
+    table = ImportTable()
+    empty = table.import_set()
+
+    assert not empty
+    assert len(empty) == 0
+    assert list(empty) == []
+    assert empty == ImportSet(table)
+    assert empty != ImportSet(ImportTable())
+
+
+def test_import_sets_of_different_tables():
+    with pytest.raises(ValueError):
+        ImportTable().import_set().union(ImportTable().import_set())
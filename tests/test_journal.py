@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from click import ClickException
+
+from module_renamer.commands.journal import (RenameJournal, content_hash, digest_of_moves,
+                                             record_pending, rollback, save_original)
+
+
+def test_digest_of_moves():
+    moves = [('a.b.c', 'x.c'), ('d.e', 'y.e')]
+    assert digest_of_moves(moves) == digest_of_moves([list(move) for move in moves])
+    assert digest_of_moves(moves) != digest_of_moves(moves[::-1])
+
+
+def test_start_and_resume(tmpdir):
+    journal_path = str(tmpdir.join('rename.journal'))
+    with RenameJournal(journal_path) as journal:
+        with pytest.raises(ClickException, match='no run to be resumed'):
+            journal.start('digest', resume=True)
+        journal.start('digest')
+        assert os.path.isdir(journal.objects_dir)
+        journal.record([('a.py', 'modified', 'before', 'after', None),
+                        ('b.py', 'failed', None, None, 'invalid syntax')])
+
+    with RenameJournal(journal_path) as journal:
+        with pytest.raises(ClickException, match='already has a run'):
+            journal.start('digest')
+        with pytest.raises(ClickException, match='different list of imports'):
+            journal.start('other digest', resume=True)
+        journal.start('digest', resume=True)
+        assert journal.completed_hash('a.py') == 'after'
+        assert journal.completed_hash('b.py') is None
+        assert journal.completed_hash('c.py') is None
+
+
+def test_pending_files(tmpdir):
+    journal_path = str(tmpdir.join('rename.journal'))
+    with RenameJournal(journal_path) as journal:
+        journal.start('digest')
+        # Recorded by a worker, while the main process keeps the journal open
+        record_pending(journal_path, 'a.py', 'before', 'after')
+
+        assert journal.completed_hash('a.py') == 'after'
+        assert journal.modified_files() == [('a.py', 'before', 'after')]
+
+        journal.record([('a.py', 'modified', 'before', 'after', None)])
+        assert journal.modified_files() == [('a.py', 'before', 'after')]
+
+
+def test_rollback(tmpdir):
+    journal_path = str(tmpdir.join('rename.journal'))
+    journal = RenameJournal(journal_path)
+    journal.start('digest')
+
+    file_results = []
+    for name in ('restored', 'changed', 'already_restored'):
+        file_path = str(tmpdir.join(name + '.py'))
+        hash_before = save_original(journal.objects_dir, b'import a\n')
+        tmpdir.join(name + '.py').write_binary(b'import b\n')
+        file_results.append((file_path, 'modified', hash_before, content_hash(b'import b\n'),
+                             None))
+    journal.record(file_results)
+    tmpdir.join('changed.py').write_binary(b'import c\n')
+    tmpdir.join('already_restored.py').write_binary(b'import a\n')
+
+    restored_files, conflicts = rollback(journal)
+
+    assert restored_files == 1
+    assert conflicts == [str(tmpdir.join('changed.py'))]
+    assert tmpdir.join('restored.py').read_binary() == b'import a\n'
+    assert tmpdir.join('changed.py').read_binary() == b'import c\n'
+
+    journal.remove()
+    assert not os.path.exists(journal_path)
+    assert not os.path.exists(journal.objects_dir)
@@ -17,3 +17,60 @@ def test_command_line_interface():
     help_result = runner.invoke(cli.main, ['--help'])
     assert help_result.exit_code == 0
     assert '--help  Show this message and exit.' in help_result.output
+
+
+# Modules only imported when a command runs, see the comment on cli.py
+HEAVY_MODULES = ['git', 'pasta', 'tqdm', 'six', 'multiprocessing', 'concurrent.futures',
+                 'module_renamer.renamer', 'module_renamer.commands.utils',
+                 'module_renamer.commands.rename_imports',
+                 'module_renamer.commands.analyze_modifications']
+
+# Time spent importing cli.py, not counting click itself
+IMPORT_TIME_BUDGET_IN_MICROSECONDS = 100000
+
+
+def _run_python(*args):
+    import os
+    import subprocess
+    import sys
+
+    env = dict(os.environ)
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root_dir, env.get('PYTHONPATH', '')])
+    process = subprocess.Popen([sys.executable] + list(args), env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    assert process.returncode == 0, error
+    return output.decode('utf-8'), error.decode('utf-8')
+
+
+def test_command_line_interface_imports_commands_lazily():
+    output, _ = _run_python('-c', 'import sys, module_renamer.cli; print(sorted(sys.modules))')
+
+    imported_modules = set(eval(output))
+    assert [module for module in HEAVY_MODULES if module in imported_modules] == []
+
+
+def test_command_line_interface_import_time():
+    import sys
+
+    import pytest
+
+    if sys.version_info < (3, 7):
+        pytest.skip('-X importtime requires Python 3.7')
+
+    # The best of a few runs, to reduce the noise of a busy machine
+    import_times = []
+    for _ in range(3):
+        _, error = _run_python('-X', 'importtime', '-c', 'import module_renamer.cli')
+        cumulative_times = {}
+        for line in error.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative_time, module = line.split('|')
+            if cumulative_time.strip().isdigit():
+                cumulative_times[module.strip()] = int(cumulative_time)
+        import_times.append(cumulative_times['module_renamer.cli'] -
+                            cumulative_times.get('click', 0))
+
+    assert min(import_times) < IMPORT_TIME_BUDGET_IN_MICROSECONDS
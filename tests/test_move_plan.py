@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from module_renamer.commands.move_plan import MovePlan
+
+
+@pytest.mark.parametrize('source, expected', [
+    (b'from a.b import c\n', True),
+    (b'import a.b.c\n', True),
+    (b'from a.b.c.d import e\n', True),
+    (b'from a . b import (\n    c,\n)\n', True),
+    (b'import a.\\\n    b.c\n', True),
+    (b'from x.y import c\n', False),
+    (b'from a.bc import d\n', False),
+    (b'import pkg_b\n', False),
+    (b'import pkg\n', True),
+    (u'from café import X\n'.encode('utf-8'), True),
+    (u'from cafés import X\n'.encode('utf-8'), False),
+    (u'import écafé\n'.encode('utf-8'), False),
+])
+def test_might_affect(source, expected):
+    move_plan = MovePlan([('a.b.c', 'x.x.c'), ('a.b.d.e', 'x.x.e'), ('pkg', 'new_pkg'),
+                          (u'café.X', 'new.X')])
+    assert move_plan.might_affect(source) is expected
+
+
+def test_might_affect_without_moves():
+    assert not MovePlan([]).might_affect(b'import a\n')
+
+
+@pytest.mark.parametrize('file_name, content', [
+    ('list_output.py', "# comment\nimports_to_move = [('a.b.c', 'x.c'), ('d.e', 'y.e')]\n"),
+    ('moves.jsonl', '["a.b.c", "x.c"]\n\n# comment\n["d.e", "y.e"]\n'),
+    ('moves.tsv', 'a.b.c\tx.c\n# comment\nd.e\ty.e\n'),
+    ('moves.txt', '["a.b.c", "x.c"]\n["d.e", "y.e"]\n'),
+    ('moves', '# comment\na.b.c\tx.c\nd.e\ty.e\n'),
+    ('moves', "imports_to_move = [\n    ('a.b.c', 'x.c'),\n    ('d.e', 'y.e')]\n"),
+])
+def test_load_move_plan(tmpdir, file_name, content):
+    from module_renamer.commands.move_plan import load_move_plan
+
+    tmpdir.join(file_name).write(content)
+
+    assert load_move_plan(str(tmpdir.join(file_name))).moves == [('a.b.c', 'x.c'), ('d.e', 'y.e')]
+
+
+@pytest.mark.parametrize('file_name, content, message', [
+    ('list_output.py', "imports_to_move = [('a.b', 'x.b')] + open('f').read()\n",
+     'must be a literal list, the file is not executed'),
+    ('list_output.py', "imports_to_move = 1\n", 'must be a literal list'),
+    ('list_output.py', "moves = []\n", "must have a list named 'imports_to_move'"),
+    ('list_output.py', "imports_to_move = [\n", 'is not valid python'),
+    ('moves.jsonl', '["a.b", "x.b"]\n["a.c", \n', 'Invalid JSON on line 2'),
+    ('moves.tsv', 'a.b\tx.b\na.c\n', "('a.c',)"),
+])
+def test_load_move_plan_with_invalid_file(tmpdir, file_name, content, message):
+    from click import ClickException
+
+    from module_renamer.commands.move_plan import load_move_plan
+
+    tmpdir.join(file_name).write(content)
+
+    with pytest.raises(ClickException) as exc_info:
+        load_move_plan(str(tmpdir.join(file_name)))
+    assert message in exc_info.value.message
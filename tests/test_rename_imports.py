@@ -6,10 +6,10 @@ from module_renamer.cli import rename
 
 @pytest.fixture
 def run_cli_rename():
-    def _run_cli_rename(project_path, file_path):
+    def _run_cli_rename(project_path, file_path, *options):
         from click.testing import CliRunner
         runner = CliRunner()
-        return runner.invoke(rename, [project_path, file_path])
+        return runner.invoke(rename, [project_path, file_path] + list(options))
 
     return _run_cli_rename
 
@@ -36,6 +36,28 @@ def test_run_rename(tmpdir, run_cli_rename):
         assert file.read() == "from x.x import c\nfrom d.e import f\n"
 
 
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='Requires symbolic links')
+def test_run_rename_through_symlink(tmpdir, run_cli_rename):
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    os.makedirs(os.path.join(str(tmpdir), 'shared'))
+    real_path = os.path.join(str(tmpdir), 'shared', 'real.py')
+    link_path = os.path.join(str(tmpdir), 'src', 'link.py')
+    with open(real_path, 'w+') as file:
+        file.writelines(['from a.b import c\n'])
+    os.symlink(os.path.join(os.pardir, 'shared', 'real.py'), link_path)
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    result = run_cli_rename(os.path.join(str(tmpdir), 'src'), file_with_the_imports_to_move)
+
+    assert result.exit_code == 0
+    assert os.path.islink(link_path)
+    with open(real_path, mode='r') as file:
+        assert file.read() == "from x.x import c\n"
+
+
 def test_run_rename_with_exception(tmpdir, run_cli_rename):
     # Create Test Case Scenario
     os.makedirs(os.path.join(str(tmpdir), 'src'))
@@ -57,6 +79,649 @@ def test_run_rename_with_exception(tmpdir, run_cli_rename):
     assert "file_a.py generated an exception: invalid syntax" in result.output
 
 
+def test_run_rename_with_invalid_moves(tmpdir, run_cli_rename):
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    file_path = os.path.join(str(tmpdir), 'src', 'file_a.py')
+
+    with open(file_path, 'w+') as file:
+        file.writelines(['from a.b import c\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c'), ('a.b.d',), ('e.f', 'e.f')]")
+
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move)
+
+    assert result.exit_code == 1
+    assert "('a.b.d',)" in result.output
+    assert "('e.f', 'e.f')" in result.output
+    with open(file_path, mode='r') as file:
+        assert file.read() == "from a.b import c\n"
+
+
+def test_move_plan_is_loaded_once(tmpdir, run_cli_rename, monkeypatch):
+    from module_renamer.commands import move_plan
+
+    for name in ['src_a', 'src_b']:
+        os.makedirs(os.path.join(str(tmpdir), name))
+        for file_name in ['file_a.py', 'file_b.py']:
+            with open(os.path.join(str(tmpdir), name, file_name), 'w+') as file:
+                file.writelines(['from a.b import c\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    calls = []
+    original_iter_moves = move_plan.iter_moves
+
+    def iter_moves(path, file_format=None):
+        calls.append(path)
+        return original_iter_moves(path, file_format)
+
+    monkeypatch.setattr(move_plan, 'iter_moves', iter_moves)
+
+    from click.testing import CliRunner
+    result = CliRunner().invoke(rename, [os.path.join(str(tmpdir), 'src_a'),
+                                         os.path.join(str(tmpdir), 'src_b'),
+                                         file_with_the_imports_to_move])
+
+    assert result.exit_code == 0
+    assert calls == [file_with_the_imports_to_move]
+    with open(os.path.join(str(tmpdir), 'src_b', 'file_b.py'), mode='r') as file:
+        assert file.read() == "from x.x import c\n"
+
+
+def test_run_rename_skips_unaffected_files(tmpdir, run_cli_rename):
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    file_path = os.path.join(str(tmpdir), 'src', 'file_a.py')
+    unaffected_file_path = os.path.join(str(tmpdir), 'src', 'file_b.py')
+
+    with open(file_path, 'w+') as file:
+        file.writelines(['from a.b import c\n'])
+    # Invalid syntax is not reported for files that are never parsed
+    with open(unaffected_file_path, 'w+') as file:
+        file.writelines(['from d.e impot f\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move)
+
+    assert result.exit_code == 0
+    assert "1 file(s) parsed, 1 file(s) skipped" in result.output
+    with open(file_path, mode='r') as file:
+        assert file.read() == "from x.x import c\n"
+
+
+SOURCES_FOR_DIFFERENTIAL_TEST = [
+    'from a.b import c\nfrom d.e import f\n',
+    'import a.b.c\n\na.b.c.run()\n',
+    'import a.b.c as alias\n\nalias.run()\n',
+    'from a.b import c, g\n\nc.run(g)\n',
+    'from a.b.c import Klass\n\nKlass()\n',
+    'from a import b\n\nb.c.run()\n',
+    'from x.x import c\nfrom y.y import d\n',
+    'import os\n\n\ndef foo():\n    from a.b import c\n    return c\n',
+]
+
+MOVES_FOR_DIFFERENTIAL_TEST = [
+    [('a.b.c', 'x.x.c')],
+    [('a.b.c', 'x.x.c'), ('a.b.g', 'x.g'), ('a.b.c.Klass', 'k.Klass')],
+    # Chained moves, the second one only applies after the first
+    [('a.b.c', 'x.x.c'), ('x.x.c', 'z.c'), ('y.y.d', 'w.d')],
+    [('x.x.c', 'z.c'), ('a.b.c', 'x.x.c')],
+    [('a.b', 'q.b'), ('d.e.f', 'r.f')],
+]
+
+
+@pytest.mark.parametrize('moves', MOVES_FOR_DIFFERENTIAL_TEST)
+@pytest.mark.parametrize('source_code', SOURCES_FOR_DIFFERENTIAL_TEST)
+def test_rename_source_matches_rename_per_move(source_code, moves):
+    import pasta
+    from pasta.augment import rename as pasta_rename
+
+    from module_renamer.commands.move_plan import MovePlan
+    from module_renamer.commands.rename_imports import rename_source
+
+    tree = pasta.parse(source_code)
+    for old_path, new_path in moves:
+        pasta_rename.rename_external(tree, old_path, new_path)
+
+    assert rename_source(source_code, MovePlan(moves)) == pasta.dump(tree)
+
+
+@pytest.mark.parametrize('executor', ['process', 'process-without-initializer', 'thread',
+                                      'serial'])
+def test_run_rename_with_executor(tmpdir, run_cli_rename, executor, request):
+    if executor == 'process-without-initializer':
+        request.getfixturevalue('process_pool_without_initializer')
+        executor = 'process'
+
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    file_paths = [os.path.join(str(tmpdir), 'src', 'file_{0}.py'.format(i)) for i in range(10)]
+    for file_path in file_paths:
+        with open(file_path, 'w+') as file:
+            file.writelines(['from a.b import c\n', 'from d.e import f\n'])
+
+    broken_file_path = os.path.join(str(tmpdir), 'src', 'broken.py')
+    with open(broken_file_path, 'w+') as file:
+        file.writelines(['from a.b impot c\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move,
+                            '--executor', executor, '--jobs', '2')
+
+    assert result.exit_code == 1
+    assert "broken.py generated an exception: invalid syntax" in result.output
+    for file_path in file_paths:
+        with open(file_path, mode='r') as file:
+            assert file.read() == "from x.x import c\nfrom d.e import f\n"
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread', 'serial'])
+def test_run_rename_with_stats(tmpdir, run_cli_rename, executor):
+    import json
+
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    for i in range(5):
+        with open(os.path.join(str(tmpdir), 'src', 'file_{0}.py'.format(i)), 'w+') as file:
+            file.writelines(['from a.b import c, d\n'] if i else ['import os\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    stats_file = os.path.join(str(tmpdir), 'stats.json')
+    profile_file = os.path.join(str(tmpdir), 'rename.prof')
+    result = run_cli_rename(os.path.join(str(tmpdir), 'src'), file_with_the_imports_to_move,
+                            '--executor', executor, '--jobs', '2', '--stats',
+                            '--stats-json', stats_file, '--profile', profile_file)
+
+    assert result.exit_code == 0, result.output
+    assert "Slowest files:" in result.output
+    with open(stats_file) as file:
+        stats = json.load(file)
+    phases = stats['phases']
+    assert phases['read']['calls'] == 5
+    assert phases['filter']['calls'] == 5
+    assert phases['tokens']['calls'] == 4
+    # The imports must be split, which is only done by pasta
+    assert phases['pasta.parse']['calls'] == 4
+    assert phases['rename_external']['calls'] == 4
+    assert phases['write']['calls'] == 4
+    assert stats['counters']['bytes_written'] > 0
+    assert len(stats['slowest_files']) == 5
+    assert stats['values']['workers'] == (1 if executor == 'serial' else 2)
+    assert stats['worker_utilization'] > 0
+    assert os.path.isfile(profile_file)
+
+
+def test_run_rename_keeps_unchanged_files(tmpdir, run_cli_rename):
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    file_path = os.path.join(str(tmpdir), 'src', 'file_a.py')
+    unchanged_file_path = os.path.join(str(tmpdir), 'src', 'file_b.py')
+
+    with open(file_path, 'w+') as file:
+        file.writelines(['from a.b import c\n'])
+    # Mentions the moved module but doesn't import the moved name
+    with open(unchanged_file_path, 'w+') as file:
+        file.writelines(['from a.b import d\n'])
+    os.utime(unchanged_file_path, (0, 0))
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move)
+
+    assert result.exit_code == 0
+    assert "2 file(s) parsed, 0 file(s) skipped, 1 file(s) modified" in result.output
+    assert os.stat(unchanged_file_path).st_mtime == 0
+    assert sorted(os.listdir(path_to_directory)) == ['file_a.py', 'file_b.py']
+
+
+def test_run_rename_keeps_encoding_line_endings_and_permissions(tmpdir, run_cli_rename):
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    file_path = os.path.join(str(tmpdir), 'src', 'file_a.py')
+
+    with open(file_path, 'wb') as file:
+        file.write(u'# coding: latin-1\r\n# Ol\xe1\r\nfrom a.b import c\r\n'.encode('latin-1'))
+    os.chmod(file_path, 0o750)
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move)
+
+    assert result.exit_code == 0
+    with open(file_path, mode='rb') as file:
+        expected = u'# coding: latin-1\r\n# Ol\xe1\r\nfrom x.x import c\r\n'.encode('latin-1')
+        assert file.read() == expected
+    assert os.stat(file_path).st_mode & 0o777 == 0o750
+
+
+def test_run_rename_with_too_many_exceptions(tmpdir, run_cli_rename, monkeypatch):
+    from module_renamer.commands.rename_imports import ExceptionList
+    monkeypatch.setattr(ExceptionList, 'MAX_EXCEPTIONS_IN_MEMORY', 2)
+
+    os.makedirs(os.path.join(str(tmpdir), 'src'))
+    for i in range(5):
+        with open(os.path.join(str(tmpdir), 'src', 'file_{0}.py'.format(i)), 'w+') as file:
+            file.writelines(['from a.b impot c\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    error_log = os.path.join(str(tmpdir), 'errors.log')
+    path_to_directory = os.path.join(str(tmpdir), 'src')
+    result = run_cli_rename(path_to_directory, file_with_the_imports_to_move,
+                            '--executor', 'serial', '--error-log', error_log)
+
+    assert result.exit_code == 1
+    assert result.output.count("generated an exception: invalid syntax") == 2
+    assert "... and 3 more exception(s), the complete list was written to " in result.output
+    with open(error_log, mode='r') as file:
+        assert file.read().count("generated an exception: invalid syntax") == 5
+
+
+def test_iter_completed_keeps_bounded_number_of_tasks():
+    from module_renamer.commands.utils import SerialExecutor, iter_completed
+
+    pulled_chunks = []
+
+    def _chunks():
+        for i in range(20):
+            pulled_chunks.append(i)
+            yield [i]
+
+    completed = []
+    for chunk, future in iter_completed(SerialExecutor(), lambda chunk: chunk[0] * 2, _chunks(),
+                                        max_in_flight=3):
+        assert len(pulled_chunks) - len(completed) <= 3
+        completed.append(future.result())
+
+    assert sorted(completed) == [i * 2 for i in range(20)]
+
+
+def test_run_rename_with_overlapping_paths(tmpdir):
+    from click.testing import CliRunner
+
+    os.makedirs(os.path.join(str(tmpdir), 'src', 'sub'))
+    os.makedirs(os.path.join(str(tmpdir), 'other'))
+    file_paths = [os.path.join(str(tmpdir), 'src', 'file_a.py'),
+                  os.path.join(str(tmpdir), 'src', 'sub', 'file_b.py'),
+                  os.path.join(str(tmpdir), 'other', 'file_c.py')]
+    for file_path in file_paths:
+        with open(file_path, 'w+') as file:
+            file.writelines(['from a.b import c\n'])
+
+    file_with_the_imports_to_move = os.path.join(str(tmpdir), "list_output.py")
+    with open(file_with_the_imports_to_move, 'w+') as file:
+        file.writelines("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    result = CliRunner().invoke(rename, [os.path.join(str(tmpdir), 'src', 'sub'),
+                                         os.path.join(str(tmpdir), 'src'),
+                                         os.path.join(str(tmpdir), 'other'),
+                                         os.path.join(str(tmpdir), 'src'),
+                                         file_with_the_imports_to_move])
+
+    assert result.exit_code == 0
+    assert "3 file(s) parsed, 0 file(s) skipped, 3 file(s) modified" in result.output
+    for file_path in file_paths:
+        with open(file_path, mode='r') as file:
+            assert file.read() == "from x.x import c\n"
+
+
+SOURCES_WITH_FORMATTING = [
+    'from a.b import c\nx = foo( c )\ny = c .d\nz = [c]\n',
+    'from a . b import c\n',
+    'from a.b import (c)\n',
+    'from a.b import (\n    c,  # comment\n)\n',
+    'from  a.b  import  c as  d\n',
+    'from a.b import \\\n    c\n',
+    'from a.b import c;import os\n',
+    'import  a.b.c  as  q , os\n',
+    'import os, a.b.c\n',
+    'import a.b.c\nimport a.b.d\n',
+    'import a as q\nfrom a import *\n',
+    'from a.b.c import *\n',
+    'from .b import c\nfrom ... import c\n',
+    'from a import b, b\n',
+    'from a.b import c\nc = 3\n',
+    'if True: import a.b.c as q\n',
+    'class A(object):\n    import a.b\n',
+    'try:\n    from a.b import c\nexcept ImportError:\n    c = None\n',
+    'def g():\n    yield from a\n\n\nraise X from Y\nfrom a.b import c\n',
+    '"""Docstring."""\nfrom a.b import c\n\n\n@c\ndef f(x=c, *, y: c = c) -> c:\n'
+    '    return lambda q=c: (c ,c)\n\n\nprint(f"{c}  { c !r}", f\'{c:>10}\')\n',
+    # Imports with and without `as` or module, whose descriptions have None
+    'import numpy\nimport numpy as np\nfrom a.b import C\n',
+    'from . import x\nfrom .m import y\nimport a.b\n',
+]
+
+MOVES_WITH_FORMATTING = [
+    [('a.b.c', 'x.x.c')],
+    [('a.b.c', 'x.x.e')],
+    [('a.b.c', 'a.b.z')],
+    [('a.b', 'x.y')],
+    [('a', 'x.y')],
+    [('b.c', 'x.c')],
+    [('a.b.c', 'x')],
+    [('a', 'q'), ('a.b.c', 'r.s.c')],
+    [('a.b.C', 'c.d.C')],
+    [('a.b', 'c.d')],
+]
+
+
+def _rename_with_pasta(source_code, moves):
+    import pasta
+    from pasta.augment import rename as pasta_rename
+
+    tree = pasta.parse(source_code)
+    for old_path, new_path in moves:
+        pasta_rename.rename_external(tree, old_path, new_path)
+    return pasta.dump(tree)
+
+
+@pytest.mark.parametrize('moves', MOVES_FOR_DIFFERENTIAL_TEST + MOVES_WITH_FORMATTING)
+@pytest.mark.parametrize('source_code', SOURCES_FOR_DIFFERENTIAL_TEST + SOURCES_WITH_FORMATTING)
+def test_rename_with_tokens_matches_pasta(source_code, moves):
+    """
+    The token rename may give up on a source, but when it doesn't the result must be
+    byte-identical to the one from pasta.
+    """
+    from module_renamer.commands.move_plan import MovePlan
+    from module_renamer.commands.token_rename import rename_source_with_tokens
+
+    renamed_source_code = rename_source_with_tokens(source_code, MovePlan(moves))
+    if renamed_source_code is not None:
+        assert renamed_source_code == _rename_with_pasta(source_code, moves)
+
+
+@pytest.mark.parametrize('source_code, moves', [
+    ('import numpy\nimport numpy as np\nfrom a.b import C\n', [('a.b.C', 'c.d.C')]),
+    ('from . import x\nfrom .m import y\nimport a.b\n', [('a.b', 'c.d')]),
+])
+def test_rename_source_with_imports_without_module_or_alias(source_code, moves):
+    from module_renamer.commands.move_plan import MovePlan
+    from module_renamer.commands.rename_imports import rename_source
+
+    assert rename_source(source_code, MovePlan(moves)) == _rename_with_pasta(source_code, moves)
+
+
+@pytest.mark.parametrize('source_code, moves, expected', [
+    ('from a.b import c\n\nc.run()\n', [('a.b.c', 'x.x.c')], 'from x.x import c\n\nc.run()\n'),
+    ('from a.b import (c,\n    d)\n', [('a.b', 'x.y')], 'from x.y import (c,\n    d)\n'),
+    ('import a.b.c as q\n', [('a.b', 'x')], 'import x.c as q\n'),
+    ('import a.b.c\n', [('a.b.c', 'x.y.c')], 'import x.y.c\n'),
+    ('from a.b import c\n', [('a.b.c', 'x.x.c'), ('x.x.c', 'z.c')], 'from z import c\n'),
+    ('def f():\n    from a.b import c\n', [('a.b.c', 'x.x.d')], 'def f():\n    from x.x import d\n'),
+    ('from d.e import f\n', [('a.b.c', 'x.x.c')], 'from d.e import f\n'),
+])
+def test_rename_with_tokens(source_code, moves, expected):
+    from module_renamer.commands.move_plan import MovePlan
+    from module_renamer.commands.token_rename import rename_source_with_tokens
+
+    assert rename_source_with_tokens(source_code, MovePlan(moves)) == expected
+
+
+@pytest.mark.parametrize('source_code, moves', [
+    # The import must be split
+    ('from a.b import c, d\n', [('a.b.c', 'x.x.c')]),
+    # pasta renames the reads of the imported name
+    ('import a.b.c\n\na.b.c.run()\n', [('a.b.c', 'x.y.c')]),
+    ('from a.b import c\n\nc.run()\n', [('a.b.c', 'x.x.e')]),
+    # Relative imports
+    ('from .b import c\n', [('b.c', 'x.c')]),
+    # Comments or line continuations inside of the renamed name
+    ('from a.\\\n    b import c\n', [('a.b.c', 'x.x.c')]),
+    # Invalid syntax, the error is raised by pasta
+    ('from a.b import\n', [('a.b.c', 'x.x.c')]),
+])
+def test_rename_with_tokens_falls_back_to_pasta(source_code, moves):
+    from module_renamer.commands.move_plan import MovePlan
+    from module_renamer.commands.token_rename import rename_source_with_tokens
+
+    assert rename_source_with_tokens(source_code, MovePlan(moves)) is None
+
+
+def test_run_rename_with_journal(tmpdir, run_cli_rename):
+    tmpdir.join('src', 'file_a.py').write('from a.b import c\n', ensure=True)
+    tmpdir.join('src', 'file_b.py').write('from a.b impot c\n')
+    tmpdir.join('src', 'file_c.py').write('import os\n')
+    import_file = tmpdir.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.x.c')]")
+    journal_path = str(tmpdir.join('rename.journal'))
+
+    result = run_cli_rename(str(tmpdir.join('src')), str(import_file), '--journal', journal_path,
+                            '--executor=serial')
+    assert result.exit_code == 1
+    assert tmpdir.join('src', 'file_a.py').read() == 'from x.x import c\n'
+
+    # Only the file that failed is renamed when resuming
+    result = run_cli_rename(str(tmpdir.join('src')), str(import_file), '--journal', journal_path,
+                            '--executor=serial')
+    assert 'already has a run' in result.output
+    tmpdir.join('src', 'file_b.py').write('from a.b import c\n')
+    result = run_cli_rename(str(tmpdir.join('src')), str(import_file), '--journal', journal_path,
+                            '--resume', '--executor=serial')
+    assert result.exit_code == 0, result.output
+    assert '1 file(s) parsed, 0 file(s) skipped, 1 file(s) modified' in result.output
+    assert '2 file(s) already renamed by the previous run' in result.output
+    assert tmpdir.join('src', 'file_b.py').read() == 'from x.x import c\n'
+
+    # The rollback needs the same list of imports
+    other_import_file = tmpdir.join('other_list_output.py')
+    other_import_file.write("imports_to_move = [('a.b.c', 'y.y.c')]")
+    result = run_cli_rename(str(other_import_file), '--journal', journal_path, '--rollback')
+    assert 'different list of imports' in result.output
+
+    result = run_cli_rename(str(import_file), '--journal', journal_path, '--rollback')
+    assert result.exit_code == 0, result.output
+    assert '2 file(s) restored' in result.output
+    assert tmpdir.join('src', 'file_a.py').read() == 'from a.b import c\n'
+    assert tmpdir.join('src', 'file_b.py').read() == 'from a.b import c\n'
+    assert tmpdir.join('src', 'file_c.py').read() == 'import os\n'
+    assert not os.path.exists(journal_path)
+
+
+@pytest.mark.parametrize('resume', [False, True])
+def test_run_rename_interrupted_with_journal(tmpdir, run_cli_rename, monkeypatch, resume):
+    from module_renamer.commands import rename_imports
+
+    sources = ['from a.b import c\nx = {0}\n'.format(i) for i in range(5)]
+    for i, source_code in enumerate(sources):
+        tmpdir.join('src', 'file_{0}.py'.format(i)).write(source_code, ensure=True)
+    import_file = tmpdir.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.x.c')]")
+    journal_path = str(tmpdir.join('rename.journal'))
+
+    original_write_file_atomically = rename_imports.write_file_atomically
+    written_files = []
+
+    def write_file_atomically(file_path, content):
+        if len(written_files) == 2:
+            raise KeyboardInterrupt()
+        original_write_file_atomically(file_path, content)
+        written_files.append(file_path)
+
+    monkeypatch.setattr(rename_imports, 'write_file_atomically', write_file_atomically)
+    with pytest.raises(KeyboardInterrupt):
+        rename_imports.rename_modules(str(tmpdir.join('src')), str(import_file),
+                                      executor_type='serial', journal_path=journal_path)
+    monkeypatch.setattr(rename_imports, 'write_file_atomically',
+                        original_write_file_atomically)
+
+    renamed = [i for i, source_code in enumerate(sources)
+               if tmpdir.join('src', 'file_{0}.py'.format(i)).read() != source_code]
+    assert len(renamed) == 2
+
+    if resume:
+        result = run_cli_rename(str(tmpdir.join('src')), str(import_file), '--journal',
+                                journal_path, '--resume', '--executor=serial')
+        assert result.exit_code == 0, result.output
+        assert '2 file(s) already renamed by the previous run' in result.output
+        for i in range(len(sources)):
+            assert tmpdir.join('src', 'file_{0}.py'.format(i)).read() == \
+                'from x.x import c\nx = {0}\n'.format(i)
+
+    result = run_cli_rename(str(import_file), '--journal', journal_path, '--rollback')
+    assert result.exit_code == 0, result.output
+    assert '{0} file(s) restored'.format(5 if resume else 2) in result.output
+    for i, source_code in enumerate(sources):
+        assert tmpdir.join('src', 'file_{0}.py'.format(i)).read() == source_code
+
+
+def test_run_rename_resume_requires_journal(tmpdir, run_cli_rename):
+    import_file = tmpdir.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.x.c')]")
+
+    result = run_cli_rename(str(tmpdir), str(import_file), '--resume')
+
+    assert result.exit_code == 2
+    assert '--resume and --rollback require --journal' in result.output
+
+
+@pytest.mark.parametrize('executor', ['process', 'serial'])
+def test_run_rename_with_diff_output(tmpdir, run_cli_rename, monkeypatch, executor):
+    import subprocess
+
+    sources = {
+        'file_a.py': b'from a.b import c\n',
+        'file_b.py': b'import os\r\nfrom a.b import c\r\n',
+        'file_c.py': b'# -*- coding: latin-1 -*-\nfrom a.b import c  # \xe9',
+        'file_d.py': b'import os\n',
+    }
+    for name, content in sources.items():
+        tmpdir.join('src', name).write_binary(content, ensure=True)
+    import_file = tmpdir.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.x.c')]")
+    monkeypatch.chdir(str(tmpdir))
+
+    result = run_cli_rename('src', str(import_file), '--diff-output', 'rename.diff',
+                            '--executor', executor)
+
+    assert result.exit_code == 0, result.output
+    assert '3 file(s) would be modified' in result.output
+    for name, content in sources.items():
+        assert tmpdir.join('src', name).read_binary() == content
+    diff = tmpdir.join('rename.diff').read_binary()
+    assert diff.index(b'a/src/file_a.py') < diff.index(b'a/src/file_b.py') < \
+        diff.index(b'a/src/file_c.py')
+
+    # Applying the diff gives the same result as renaming the files
+    subprocess.check_call(['git', 'init', '-q'])
+    subprocess.check_call(['git', 'apply', 'rename.diff'])
+    applied = {name: tmpdir.join('src', name).read_binary() for name in sources}
+    result = run_cli_rename('src', str(import_file), '--executor', executor)
+    assert result.exit_code == 0, result.output
+    assert applied == {name: tmpdir.join('src', name).read_binary() for name in sources}
+    assert applied['file_b.py'] == b'import os\r\nfrom x.x import c\r\n'
+
+
+def test_run_rename_with_dry_run(tmpdir, run_cli_rename, monkeypatch):
+    tmpdir.join('src', 'file_a.py').write('from a.b import c\n', ensure=True)
+    import_file = tmpdir.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.x.c')]")
+    monkeypatch.chdir(str(tmpdir))
+
+    result = run_cli_rename('src', str(import_file), '--dry-run', '--executor=serial')
+
+    assert result.exit_code == 0, result.output
+    assert '-from a.b import c\n+from x.x import c\n' in result.output
+    assert tmpdir.join('src', 'file_a.py').read() == 'from a.b import c\n'
+
+
+@pytest.mark.parametrize('executor', ['process', 'serial'])
+def test_run_rename_with_index(tmpdir, run_cli_rename, executor):
+    from click.testing import CliRunner
+
+    from module_renamer.cli import index, who_imports
+
+    sources = SOURCES_FOR_DIFFERENTIAL_TEST + SOURCES_WITH_FORMATTING
+    moves = (MOVES_FOR_DIFFERENTIAL_TEST[2] + MOVES_FOR_DIFFERENTIAL_TEST[4] +
+             MOVES_WITH_FORMATTING[-1])
+    for directory in ('with_index', 'without_index'):
+        for i, source_code in enumerate(sources):
+            tmpdir.join(directory, 'file_{0}.py'.format(i)).write(source_code, ensure=True)
+    import_file = tmpdir.join('list_output.py')
+    import_file.write('imports_to_move = {0!r}'.format(moves))
+    index_path = str(tmpdir.join('index.sqlite'))
+
+    result = CliRunner().invoke(index, [str(tmpdir.join('with_index')), '--index', index_path,
+                                        '--executor', executor])
+    assert result.exit_code == 0, result.output
+    assert '{0} file(s) indexed, {0} file(s) parsed'.format(len(sources)) in result.output
+
+    result = CliRunner().invoke(who_imports, ['a.b.c', '--index', index_path])
+    assert result.exit_code == 0, result.output
+    assert str(tmpdir.join('with_index', 'file_0.py')) in result.output.splitlines()
+
+    result = run_cli_rename(str(tmpdir.join('with_index')), str(import_file), '--index',
+                            index_path, '--executor', executor)
+    assert result.exit_code == 0, result.output
+    result = run_cli_rename(str(tmpdir.join('without_index')), str(import_file),
+                            '--executor', executor)
+    assert result.exit_code == 0, result.output
+
+    for i in range(len(sources)):
+        file_name = 'file_{0}.py'.format(i)
+        assert tmpdir.join('with_index', file_name).read() == \
+            tmpdir.join('without_index', file_name).read()
+
+
+def test_who_imports_without_index(tmpdir):
+    from click.testing import CliRunner
+
+    from module_renamer.cli import who_imports
+
+    result = CliRunner().invoke(who_imports, ['a.b.c', '--index', str(tmpdir.join('index'))])
+
+    assert result.exit_code == 1
+    assert 'create it with "renamer index"' in result.output
+
 
+@pytest.mark.parametrize('balance_option', [[], ['--balance-shards']])
+def test_run_rename_with_shards(tmpdir, run_cli_rename, balance_option):
+    sources = SOURCES_FOR_DIFFERENTIAL_TEST + SOURCES_WITH_FORMATTING
+    moves = (MOVES_FOR_DIFFERENTIAL_TEST[2] + MOVES_FOR_DIFFERENTIAL_TEST[4] +
+             MOVES_WITH_FORMATTING[-1])
+    # Each shard renames its own copy of the project, like a different machine would
+    directories = ['shard_1', 'shard_2', 'full']
+    for directory in directories:
+        for i, source_code in enumerate(sources):
+            tmpdir.join(directory, 'file_{0}.py'.format(i)).write(source_code, ensure=True)
+    import_file = tmpdir.join('list_output.py')
+    import_file.write('imports_to_move = {0!r}'.format(moves))
 
+    for index, directory in enumerate(directories[:2], start=1):
+        result = run_cli_rename(str(tmpdir.join(directory)), str(import_file),
+                                '--shard={0}/2'.format(index), *balance_option)
+        assert result.exit_code == 0, result.output
+    result = run_cli_rename(str(tmpdir.join('full')), str(import_file))
+    assert result.exit_code == 0, result.output
 
+    renamed_by_shard = {directory: set() for directory in directories}
+    for directory in directories:
+        for i, source_code in enumerate(sources):
+            if tmpdir.join(directory, 'file_{0}.py'.format(i)).read() != source_code:
+                renamed_by_shard[directory].add(i)
+    assert renamed_by_shard['shard_1'] and renamed_by_shard['shard_2']
+    assert not renamed_by_shard['shard_1'] & renamed_by_shard['shard_2']
+    assert renamed_by_shard['shard_1'] | renamed_by_shard['shard_2'] == renamed_by_shard['full']
+    for i in renamed_by_shard['full']:
+        directory = 'shard_1' if i in renamed_by_shard['shard_1'] else 'shard_2'
+        file_name = 'file_{0}.py'.format(i)
+        assert tmpdir.join(directory, file_name).read() == tmpdir.join('full', file_name).read()
@@ -0,0 +1,58 @@
+import pytest
+from click import ClickException
+
+from module_renamer import RenameResult, Renamer
+
+
+def test_rename_source():
+    renamer = Renamer([('a.b.c', 'x.y.c'), ('d.e', 'z.e')])
+
+    assert renamer.rename_source('from a.b import c\nimport d.e\n') == \
+        'from x.y import c\nimport z.e\n'
+    source_code = 'import os\n'
+    assert renamer.rename_source(source_code) is source_code
+
+    # Renamed by pasta, but the second move undoes the first one
+    renamer = Renamer([('a.b.c', 'x.y.c'), ('x.y.c', 'a.b.c')])
+    source_code = 'import a.b.c\n\na.b.c.run()\n'
+    assert renamer.rename_source(source_code) is source_code
+
+
+def test_renamer_with_invalid_moves():
+    with pytest.raises(ClickException):
+        Renamer([('a.b.c', 'x y')])
+
+
+@pytest.mark.parametrize('executor', ['process', 'process-without-initializer', 'thread',
+                                      'serial'])
+def test_rename_sources(executor, request):
+    if executor == 'process-without-initializer':
+        request.getfixturevalue('process_pool_without_initializer')
+        executor = 'process'
+
+    sources = [('file_{0}.py'.format(i), 'from a.b import c\nx = {0}\n'.format(i))
+               for i in range(100)]
+    sources[10] = ('file_10.py', 'import os\n')
+    sources[20] = ('file_20.py', 'from a.b impot c\n')
+
+    with Renamer([('a.b.c', 'x.y.c')], executor_type=executor, jobs=2) as renamer:
+        results = list(renamer.rename_sources(iter(sources)))
+        # The workers are kept for the next batches
+        assert list(renamer.rename_sources([('f.py', 'import a.b.c\n')])) == \
+            [RenameResult('f.py', 'import x.y.c\n', True, None)]
+
+    assert [result.path for result in results] == [path for path, _ in sources]
+    assert results[0] == RenameResult('file_0.py', 'from x.y import c\nx = 0\n', True, None)
+    assert results[10] == RenameResult('file_10.py', 'import os\n', False, None)
+    assert results[20].source_code == 'from a.b impot c\n'
+    assert not results[20].changed
+    assert 'invalid syntax' in results[20].error
+    assert sum(result.changed for result in results) == 98
+
+
+def test_renamers_with_threads_dont_share_the_moves():
+    with Renamer([('a.b.c', 'x.y.c')], executor_type='thread') as first_renamer, \
+            Renamer([('a.b.c', 'z.c')], executor_type='thread') as second_renamer:
+        sources = [('f.py', 'from a.b import c\n')]
+        assert next(first_renamer.rename_sources(sources)).source_code == 'from x.y import c\n'
+        assert next(second_renamer.rename_sources(sources)).source_code == 'from z import c\n'
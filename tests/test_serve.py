@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import git
+import pytest
+from click import ClickException
+from click.testing import CliRunner
+
+from module_renamer.cli import analyze, rename, serve
+from module_renamer.commands.serve import RenameServer, SourceCache, run_server, send_request
+
+
+def test_source_cache_evicts_least_recently_used():
+    cache = SourceCache(max_bytes=10)
+    cache.set('a.py', (1, 4), b'aaaa')
+    cache.set('b.py', (1, 4), b'bbbb')
+    assert cache.get('a.py', (1, 4)) == b'aaaa'
+    cache.set('c.py', (1, 4), b'cccc')
+
+    assert cache.get('b.py', (1, 4)) is None
+    assert cache.get('a.py', (1, 4)) == b'aaaa'
+    assert cache.get('a.py', (2, 4)) is None
+    assert cache.size_in_bytes == 4
+    cache.set('d.py', (1, 11), b'd' * 11)
+    assert len(cache) == 1
+
+
+@pytest.fixture
+def project(tmpdir):
+    tmpdir.join('src', 'file_a.py').write('from a.b import c\n', ensure=True)
+    tmpdir.join('src', 'file_b.py').write('import os\n')
+    tmpdir.join('src', 'sub', 'file_c.py').write('import a.b.c\n', ensure=True)
+    return tmpdir
+
+
+def test_rename_server(project):
+    src = project.join('src')
+    server = RenameServer([str(src)], max_cache_bytes=1024)
+    moves = [['a.b.c', 'x.c']]
+
+    response = server.handle({'command': 'rename', 'moves': moves, 'dry_run': True})
+    assert response['parsed'] == 2 and response['skipped'] == 1
+    assert '+from x import c\n' in response['diff']
+    assert src.join('file_a.py').read() == 'from a.b import c\n'
+
+    # The paths of the diff are relative to the current directory of the client
+    response = server.handle({'command': 'rename', 'moves': moves, 'dry_run': True,
+                              'cwd': str(project)})
+    assert response['diff'].startswith('--- a/src/file_a.py\n+++ b/src/file_a.py\n')
+
+    response = server.handle({'command': 'rename', 'moves': moves,
+                              'project_path': [str(src.join('sub'))]})
+    assert response['modified'] == [str(src.join('sub', 'file_c.py'))]
+    assert src.join('sub', 'file_c.py').read() == 'import x.c\n'
+    assert src.join('file_a.py').read() == 'from a.b import c\n'
+
+    # The files changed after the last refresh are read again
+    src.join('file_b.py').write('from a.b import c  # changed\n')
+    src.join('file_d.py').write('from a.b import c\n')
+    server.refresh()
+    src.join('file_a.py').remove()
+    response = server.handle({'command': 'rename', 'moves': moves})
+    assert response['modified'] == [str(src.join('file_b.py')), str(src.join('file_d.py'))]
+    assert response['errors'][0][0] == str(src.join('file_a.py'))
+    server.refresh()
+    assert server.files_referencing(['a.b.c']) == set()
+
+    assert server.handle({'command': 'rename', 'moves': [['a', 'x y']]})['error']
+    assert server.handle({'command': 'unknown'}) == {'error': 'Unknown command: unknown'}
+    for request in ([], 1, 'rename', None):
+        assert server.handle(request) == {'error': 'The request must be a JSON object'}
+
+
+def test_rename_server_analyze(tmpdir):
+    repo = git.Repo.init(path=str(tmpdir))
+    tmpdir.join('file_a.py').write('from a.b import c\n')
+    repo.index.add(['file_a.py'])
+    repo.index.commit('commit on master')
+    repo.heads.master.checkout(b='new_branch')
+    tmpdir.join('file_a.py').write('from x.y import c\n')
+    repo.index.add(['file_a.py'])
+    repo.index.commit('commit on working branch')
+    repo.close()
+
+    server = RenameServer([str(tmpdir)])
+    request = {'command': 'analyze', 'project_path': str(tmpdir), 'compare_with': 'master',
+               'jobs': 1}
+    assert server.handle(request) == {'moved_imports': {'a.b.c': ['x.y.c']}}
+    # The imports of each blob are kept in memory
+    assert server.import_cache.get(repo.head.commit.tree['file_a.py'].hexsha) == [('x.y', 'c')]
+
+
+def test_serve(project, monkeypatch):
+    monkeypatch.chdir(str(project))
+    import_file = project.join('list_output.py')
+    import_file.write("imports_to_move = [('a.b.c', 'x.c')]")
+    address = 'renamer.sock'
+
+    server = threading.Thread(target=run_server, args=(['src'], address),
+                              kwargs={'poll_interval': 0.1})
+    server.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.05)
+
+        result = CliRunner().invoke(rename, ['src', str(import_file), '--server', address,
+                                             '--dry-run'])
+        assert result.exit_code == 0, result.output
+        assert '-from a.b import c\n+from x import c\n' in result.output
+        assert '2 file(s) would be modified' in result.output
+
+        result = CliRunner().invoke(rename, ['src', str(import_file), '--server', address])
+        assert result.exit_code == 0, result.output
+        assert '2 file(s) parsed, 1 file(s) skipped, 2 file(s) modified' in result.output
+        assert project.join('src', 'file_a.py').read() == 'from x import c\n'
+
+        result = CliRunner().invoke(analyze, [str(project), '--server', address])
+        assert result.exit_code == 1
+        assert 'InvalidGitRepositoryError' in result.output
+
+        # The server keeps answering after a request that is not an object
+        for request in ([], 1):
+            with pytest.raises(ClickException, match='must be a JSON object'):
+                send_request(address, request)
+        assert send_request(address, {'command': 'refresh'}) == {'files': 3}
+    finally:
+        CliRunner().invoke(serve, ['--stop', '--address', address])
+        server.join()
+
+    result = CliRunner().invoke(rename, ['src', str(import_file), '--server', address])
+    assert result.exit_code == 1
+    assert 'No server is listening on renamer.sock' in result.output
+
+
+def test_send_request_without_server(tmpdir):
+    with pytest.raises(ClickException, match='No server is listening'):
+        send_request(str(tmpdir.join('renamer.sock')), {'command': 'stop'})
@@ -0,0 +1,67 @@
+import os
+
+import click
+import pytest
+
+from module_renamer.commands.sharding import Shard, stable_hash
+
+
+@pytest.mark.parametrize('balanced', [False, True])
+def test_shards_partition_the_items(balanced):
+    items = ['package_{0}/module_{1}.py'.format(i % 7, i) for i in range(200)]
+    sizes = {item: (i * 37) % 101 for i, item in enumerate(items)}
+
+    selected = [list(Shard(index, 4, balanced).select(items, lambda item: item, sizes.get))
+                for index in range(1, 5)]
+
+    assert sorted(sum(selected, [])) == sorted(items)
+    for items_of_shard in selected:
+        assert items_of_shard
+        assert items_of_shard == [item for item in items if item in items_of_shard]
+
+
+def test_shards_depend_only_on_the_key():
+    items = ['module_{0}.py'.format(i) for i in range(50)]
+
+    first = list(Shard(2, 3).select(items, lambda item: item))
+    second = list(Shard(2, 3).select(reversed(items), lambda item: item))
+
+    assert first == second[::-1]
+    assert stable_hash('module_1.py') == stable_hash(u'module_1.py')
+
+
+def test_balanced_shards_have_similar_sizes():
+    items = list(range(100))
+    size = lambda item: item * item  # noqa: E731
+
+    totals = [sum(size(item) for item in Shard(index, 4, balanced=True).select(
+        items, str, size)) for index in range(1, 5)]
+
+    assert max(totals) - min(totals) <= size(items[-1])
+
+
+def test_select_files_uses_paths_relative_to_the_project(tmpdir):
+    for folder in ['first', 'second']:
+        tmpdir.join(folder, 'a.py').write('import os\n', ensure=True)
+    file_paths = [os.path.realpath(str(tmpdir.join(folder, 'a.py')))
+                  for folder in ['first', 'second']]
+
+    selected = [list(Shard(index, 2).select_files([str(tmpdir.join('first')),
+                                                   str(tmpdir.join('second'))], file_paths))
+                for index in range(1, 3)]
+
+    # Both files have the same relative path, so they are always on the same shard
+    assert sorted(len(files) for files in selected) == [0, 2]
+
+
+@pytest.mark.parametrize('value', ['0/2', '3/2', '1', '1/2/3', 'a/b', ''])
+def test_parse_invalid_shard(value):
+    with pytest.raises(click.BadParameter):
+        Shard.parse(value)
+
+
+def test_parse_shard():
+    shard = Shard.parse('2/5', balanced=True)
+
+    assert (shard.index, shard.count, shard.balanced) == (2, 5, True)
+    assert str(shard) == '2/5'
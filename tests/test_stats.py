@@ -0,0 +1,61 @@
+import threading
+
+from module_renamer.commands import stats
+
+
+def test_stats_are_only_collected_when_enabled():
+    with stats.phase('parse'):
+        stats.count('bytes_read', 10)
+    assert stats.current() is None
+
+    with stats.collecting() as collected_stats:
+        with stats.phase('parse'):
+            stats.count('bytes_read', 10)
+        with stats.phase('parse'):
+            pass
+        with stats.collecting(enabled=False) as disabled_stats:
+            assert disabled_stats is None
+            assert stats.current() is collected_stats
+
+    assert stats.current() is None
+    assert collected_stats.phases['parse'][1] == 2
+    assert collected_stats.counters['bytes_read'] == 10
+
+
+def test_stats_of_tasks_are_merged():
+    with stats.collecting() as collected_stats:
+        stats.set_value('workers', 2)
+        with stats.phase('executor'):
+            task_results = []
+            for task in range(3):
+                with stats.collecting() as task_stats, stats.phase('worker'):
+                    stats.count('bytes_read', 5)
+                    for i in range(10):
+                        stats.add_file('file_{0}_{1}.py'.format(task, i), task * 10 + i)
+                task_results.append(task_stats.as_dict())
+        for task_stats_dict in task_results:
+            stats.merge(task_stats_dict)
+
+    stats_dict = collected_stats.as_dict()
+    assert stats_dict['phases']['worker']['calls'] == 3
+    assert stats_dict['counters'] == {'bytes_read': 15}
+    assert [file_stats['seconds'] for file_stats in stats_dict['slowest_files']] == list(
+        range(29, 29 - stats.SLOWEST_FILES, -1))
+    assert stats_dict['slowest_files'][0]['path'] == 'file_2_9.py'
+    assert 0 < stats_dict['worker_utilization']
+    assert 'Worker utilization' in collected_stats.summary()
+
+
+def test_stats_are_collected_per_thread():
+    def _run_on_thread():
+        with stats.phase('thread'):
+            pass
+
+    with stats.collecting() as collected_stats:
+        thread = threading.Thread(target=_run_on_thread)
+        thread.start()
+        thread.join()
+        list(stats.timed_iter('walk', range(3)))
+
+    assert 'thread' not in collected_stats.phases
+    assert collected_stats.phases['walk'][1] == 4